@@ -1,5 +1,7 @@
 # Django settings for migration_helper project.
 
+import os
+
 import django
 
 DEBUG = True
@@ -12,6 +14,15 @@ DATABASES = {
     }
 }
 
+# Run against a local PostgreSQL database, e.g for benchmarks:
+#   XWORKFLOWS_PGDATABASE=xworkflows make benchmark
+# Other connection parameters are read from the standard PG* environment variables.
+if os.environ.get('XWORKFLOWS_PGDATABASE'):
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['XWORKFLOWS_PGDATABASE'],
+    }
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Local time zone for this installation. Choices can be found here:
@@ -96,6 +107,7 @@ TEMPLATES = [
             'context_processors': [
                 'django.contrib.auth.context_processors.auth',
                 'django.template.context_processors.debug',
+                'django.template.context_processors.request',
                 'django.template.context_processors.i18n',
                 'django.template.context_processors.media',
                 'django.template.context_processors.static',
@@ -117,8 +129,11 @@ MIDDLEWARE = (
 ROOT_URLCONF = 'dev.urls'
 
 INSTALLED_APPS = (
+    'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
+    'django.contrib.messages',
+    'django.contrib.sessions',
     'django.contrib.sites',
     'tests.djworkflows',
     'django_xworkflows',
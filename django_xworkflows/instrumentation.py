@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2011-2020 Raphaël Barrois
+# This code is distributed under the two-clause BSD license.
+
+"""Timings and query counts of transitions, by phase.
+
+When a Workflow has a metrics_collector, each transition is measured and the
+resulting TransitionMeasurement passed to the collector's record() method.
+"""
+
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+from django.db import connections
+from django.db import router
+
+from xworkflows import base
+
+
+logger = logging.getLogger(__name__)
+
+
+#: Pre-transition checks, including the check hooks
+PHASE_CHECK = 'check'
+#: Locking the object's row, for LockingImplementationWrapper
+PHASE_LOCK = 'lock'
+#: 'before' and 'on_leave_state' hooks
+PHASE_BEFORE = 'before'
+#: The transition's implementation
+PHASE_IMPLEMENTATION = 'implementation'
+#: Saving the object
+PHASE_SAVE = 'save'
+#: Writing the transition log
+PHASE_LOG = 'log'
+#: 'after' and 'on_enter_state' hooks
+PHASE_AFTER = 'after'
+
+OUTCOME_SUCCESS = 'success'
+#: The transition wasn't available from the object's state
+OUTCOME_INVALID = 'invalid'
+#: A check hook forbade the transition
+OUTCOME_FORBIDDEN = 'forbidden'
+#: Another AbortTransition was raised
+OUTCOME_ABORTED = 'aborted'
+#: Any other exception
+OUTCOME_ERROR = 'error'
+
+
+#: The cost of a phase of a transition; phases run several times are summed.
+PhaseMetrics = collections.namedtuple('PhaseMetrics', ['duration', 'queries'])
+
+
+def get_outcome(exception):
+    """The outcome of a transition which raised an exception."""
+    if isinstance(exception, base.InvalidTransitionError):
+        return OUTCOME_INVALID
+    elif isinstance(exception, base.ForbiddenTransition):
+        return OUTCOME_FORBIDDEN
+    elif isinstance(exception, base.AbortTransition):
+        return OUTCOME_ABORTED
+    else:
+        return OUTCOME_ERROR
+
+
+class TransitionMeasurement(object):
+    """Measures of a single transition.
+
+    Attributes:
+        workflow (str): the name of the workflow class
+        transition (str): the name of the transition
+        model (str): the label of the modified object's model
+        instance (WorkflowEnabled): the modified object
+        outcome (str): one of the OUTCOME_* constants, once the transition ended
+        exception (Exception): the exception raised by the transition, if any
+        duration (float): the total duration of the transition, in seconds
+        queries (int): the number of queries run on the object's database
+        phases (dict): PhaseMetrics of each PHASE_* run, in order
+    """
+
+    def __init__(self, workflow, transition, instance):
+        self.workflow = workflow.__class__.__name__
+        self.transition = transition.name
+        self.model = instance._meta.label
+        self.instance = instance
+        self.outcome = None
+        self.exception = None
+        self.duration = 0.0
+        self.queries = 0
+        self.phases = collections.OrderedDict()
+
+    def count_query(self, execute, sql, params, many, context):
+        """Database execute_wrapper counting queries."""
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Measure a phase of the transition."""
+        start = time.perf_counter()
+        queries = self.queries
+        try:
+            yield
+        finally:
+            previous = self.phases.get(name, PhaseMetrics(0.0, 0))
+            self.phases[name] = PhaseMetrics(
+                previous.duration + time.perf_counter() - start,
+                previous.queries + self.queries - queries,
+            )
+
+    def __repr__(self):
+        return '<%s: %s.%s %s in %.6fs>' % (
+            self.__class__.__name__, self.workflow, self.transition, self.outcome, self.duration)
+
+
+class _NoPhase(object):
+    """Context manager for phases of transitions which aren't measured."""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+_active = threading.local()
+
+
+def current_measurement():
+    """The measurement of the innermost transition running in this thread, if any."""
+    measurements = getattr(_active, 'measurements', None)
+    return measurements[-1] if measurements else None
+
+
+def phase(measurement, name):
+    """Context manager measuring a phase, if the transition is measured.
+
+    Args:
+        measurement (TransitionMeasurement or None): the transition's measurement
+        name (str): one of the PHASE_* constants
+    """
+    if measurement is None:
+        return _NO_PHASE
+    return measurement.phase(name)
+
+
+@contextlib.contextmanager
+def measure(collector, workflow, transition, instance):
+    """Measure a transition, then pass its measurement to the collector.
+
+    Queries are counted on the database the object is written to.
+    """
+    measurement = TransitionMeasurement(workflow, transition, instance)
+    connection = connections[router.db_for_write(instance.__class__, instance=instance)]
+    if not hasattr(_active, 'measurements'):
+        _active.measurements = []
+    _active.measurements.append(measurement)
+
+    start = time.perf_counter()
+    try:
+        with connection.execute_wrapper(measurement.count_query):
+            yield measurement
+    except Exception as e:
+        measurement.outcome = get_outcome(e)
+        measurement.exception = e
+        raise
+    else:
+        measurement.outcome = OUTCOME_SUCCESS
+    finally:
+        measurement.duration = time.perf_counter() - start
+        _active.measurements.pop()
+        if measurement.outcome is not None:
+            try:
+                collector.record(measurement)
+            except Exception:
+                # The transition is over: a broken collector mustn't make it look failed.
+                logger.exception("Unable to record metrics of %r", measurement)
+
+
+class BaseCollector(object):
+    """Base class for transition metrics collectors."""
+
+    def record(self, measurement):
+        """Record the measures of a transition.
+
+        Args:
+            measurement (TransitionMeasurement): the transition's measures
+        """
+        raise NotImplementedError()
+
+
+#: Histogram buckets for transition durations, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Histogram(object):
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels):
+    return ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in labels
+    )
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class PrometheusCollector(BaseCollector):
+    """Aggregate transition metrics in memory, in the Prometheus model.
+
+    Metrics, labelled by workflow and transition:
+    - <prefix>_transitions_total{outcome}: counter of transitions
+    - <prefix>_transition_duration_seconds: histogram of transition durations
+    - <prefix>_transition_phase_duration_seconds{phase}: histogram of phase durations
+    - <prefix>_transition_queries_total{phase}: counter of queries
+
+    render() returns them in the Prometheus text format, e.g for a metrics view.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix='xworkflows'):
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.transitions = collections.Counter()
+            self.durations = {}
+            self.phase_durations = {}
+            self.queries = collections.Counter()
+
+    def _observe(self, histograms, key, value):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = _Histogram(self.buckets)
+        histogram.observe(value)
+
+    def record(self, measurement):
+        key = (measurement.workflow, measurement.transition)
+        with self.lock:
+            self.transitions[key + (measurement.outcome,)] += 1
+            self._observe(self.durations, key, measurement.duration)
+            for name, metrics in measurement.phases.items():
+                self._observe(self.phase_durations, key + (name,), metrics.duration)
+                self.queries[key + (name,)] += metrics.queries
+
+    def _histogram_samples(self, name, histograms, label_names):
+        for key, histogram in sorted(histograms.items()):
+            labels = list(zip(label_names, key))
+            for bound, count in zip(self.buckets + (float('inf'),), histogram.counts + [histogram.count]):
+                yield name + '_bucket', labels + [('le', _format_value(bound))], count
+            yield name + '_sum', labels, histogram.sum
+            yield name + '_count', labels, histogram.count
+
+    def samples(self):
+        """List the current samples.
+
+        Returns:
+            (name, metric type, (label, value) list, value) list
+        """
+        transition_labels = ('workflow', 'transition')
+        phase_labels = transition_labels + ('phase',)
+        duration_name = '%s_transition_duration_seconds' % self.prefix
+        phase_duration_name = '%s_transition_phase_duration_seconds' % self.prefix
+
+        with self.lock:
+            outcome_labels = transition_labels + ('outcome',)
+            samples = [
+                ('%s_transitions_total' % self.prefix, 'counter', list(zip(outcome_labels, key)), count)
+                for key, count in sorted(self.transitions.items())
+            ]
+            samples += [
+                (name, 'histogram', labels, value)
+                for name, labels, value in self._histogram_samples(duration_name, self.durations, transition_labels)
+            ]
+            samples += [
+                (name, 'histogram', labels, value)
+                for name, labels, value in self._histogram_samples(
+                    phase_duration_name, self.phase_durations, phase_labels)
+            ]
+            samples += [
+                ('%s_transition_queries_total' % self.prefix, 'counter', list(zip(phase_labels, key)), count)
+                for key, count in sorted(self.queries.items())
+            ]
+        return samples
+
+    def render(self):
+        """The current metrics, in the Prometheus text exposition format."""
+        lines = []
+        declared = set()
+        for name, metric_type, labels, value in self.samples():
+            family = name
+            if metric_type == 'histogram':
+                family = name.rsplit('_', 1)[0]
+            if family not in declared:
+                declared.add(family)
+                lines.append('# TYPE %s %s' % (family, metric_type))
+            lines.append('%s{%s} %s' % (name, _format_labels(labels), _format_value(value)))
+        return ''.join(line + '\n' for line in lines)
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2011-2020 Raphaël Barrois
+# This code is distributed under the two-clause BSD license.
+
+"""Backends writing transition logs to the database.
+
+A backend receives the keyword arguments of BaseTransitionLog.log_transition()
+calls, and decides when and how to write them.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+
+from django.db import close_old_connections
+from django.db import connections
+from django.db import router
+from django.db import transaction
+
+
+logger = logging.getLogger(__name__)
+
+
+def _group_by_model(logs):
+    """Group (model_class, log_kwargs) pairs by log model."""
+    by_model = {}
+    for model_class, log_kwargs in logs:
+        by_model.setdefault(model_class, []).append(log_kwargs)
+    return by_model.items()
+
+
+class BaseLogBackend(object):
+    """Base class for transition log backends."""
+
+    def write(self, model_class, log_kwargs):
+        """Log a transition.
+
+        Args:
+            model_class (BaseTransitionLog subclass): the log model
+            log_kwargs (dict): keyword arguments for model_class.log_transition()
+        """
+        raise NotImplementedError()
+
+    def write_many(self, model_class, logs):
+        """Log several transitions.
+
+        Args:
+            model_class (BaseTransitionLog subclass): the log model
+            logs (dict list): keyword arguments for model_class.log_transition()
+        """
+        for log_kwargs in logs:
+            self.write(model_class, log_kwargs)
+
+
+class SyncLogBackend(BaseLogBackend):
+    """Write logs right away, within the transition."""
+
+    def write(self, model_class, log_kwargs):
+        return model_class.log_transition(**log_kwargs)
+
+    def write_many(self, model_class, logs):
+        return model_class.log_transitions(logs)
+
+
+class _TransitionLogBuffer(object):
+    """Transition logs waiting for the commit of a database transaction.
+
+    Pending logs are written with one bulk_create() per log model, from a
+    transaction.on_commit() callback.
+
+    Django drops the callbacks registered within a savepoint when it is rolled
+    back: a buffer only accepts logs from code running within all savepoints
+    that were active when its callback was registered, so that those logs share
+    the callback's fate.
+
+    Attributes:
+        using (str): the database alias
+        savepoint_ids (set): the savepoints active when the buffer was created
+        logs ((model class, dict) list): the pending log_transition() calls
+    """
+    _local = threading.local()
+
+    def __init__(self, using, savepoint_ids):
+        self.using = using
+        self.savepoint_ids = savepoint_ids
+        self.logs = []
+        transaction.on_commit(self.flush, using=using)
+
+    def is_pending(self, connection):
+        """Whether our on_commit() callback is still registered."""
+        return any(callback[1] == self.flush for callback in connection.run_on_commit)
+
+    def flush(self):
+        """Write all pending logs."""
+        logs, self.logs = self.logs, []
+        for model_class, model_logs in _group_by_model(logs):
+            model_class.log_transitions(model_logs)
+
+    @classmethod
+    def _get_buffers(cls, connection):
+        """Retrieve the buffers still waiting for a commit, oldest first.
+
+        Buffers whose remaining active savepoints are the same are merged
+        together: they will be committed or rolled back as a whole.
+        """
+        all_buffers = getattr(cls._local, 'buffers', None)
+        if all_buffers is None:
+            all_buffers = cls._local.buffers = {}
+
+        active = set(connection.savepoint_ids)
+        buffers = []
+        for buf in all_buffers.get(connection.alias, []):
+            if not buf.is_pending(connection):
+                # Committed or rolled back.
+                continue
+            for other in buffers:
+                if other.savepoint_ids & active == buf.savepoint_ids & active:
+                    other.logs.extend(buf.logs)
+                    buf.logs = []
+                    break
+            else:
+                buffers.append(buf)
+
+        all_buffers[connection.alias] = buffers
+        return buffers
+
+    @classmethod
+    def add(cls, model_class, log_kwargs, max_size):
+        """Register a log_transition() call for the next commit.
+
+        Args:
+            model_class (BaseTransitionLog subclass): the log model
+            log_kwargs (dict): keyword arguments for log_transition()
+            max_size (int): write pending logs as soon as that many are
+                waiting.
+        """
+        using = router.db_for_write(model_class)
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            # Autocommit mode: no need to wait.
+            model_class.log_transition(**log_kwargs)
+            return
+
+        active = set(connection.savepoint_ids)
+        buffers = cls._get_buffers(connection)
+        for buf in buffers:
+            if active <= buf.savepoint_ids:
+                break
+        else:
+            buf = cls(using, active)
+            buffers.append(buf)
+
+        buf.logs.append((model_class, log_kwargs))
+        if len(buf.logs) >= max_size:
+            # Writing now is safe: the savepoints that could roll those logs
+            # back are exactly the currently active ones.
+            buf.flush()
+
+
+class OnCommitLogBackend(BaseLogBackend):
+    """Buffer logs until the current database transaction commits.
+
+    Logs are then written with one bulk_create() per log model; logs of
+    transitions rolled back, including by a savepoint rollback, are dropped.
+    Outside of a transaction, logs are written immediately.
+
+    Attributes:
+        buffer_size (int): write pending logs as soon as that many are waiting.
+    """
+
+    def __init__(self, buffer_size=100):
+        self.buffer_size = buffer_size
+
+    def write(self, model_class, log_kwargs):
+        _TransitionLogBuffer.add(model_class, log_kwargs, self.buffer_size)
+
+
+class ThreadedLogBackend(BaseLogBackend):
+    """Fire-and-forget logging: a background thread writes logs by batches.
+
+    Logs are queued once the current database transaction commits, and never
+    block the transition; logs still queued when the process dies are lost,
+    as are logs failing to save. Logs are written through log_transitions():
+    with bulk_create(), no pre_save/post_save signal is sent for them.
+
+    Attributes:
+        batch_size (int): maximum number of logs written per query
+        max_queue_size (int): drop new logs once that many are queued;
+            0 means no limit.
+    """
+
+    def __init__(self, batch_size=100, max_queue_size=0):
+        self.batch_size = batch_size
+        self.queue = queue.Queue(max_queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='xworkflows-log-writer', daemon=True)
+                self._thread.start()
+                if not self._atexit_registered:
+                    atexit.register(self.stop)
+                    self._atexit_registered = True
+
+    def _enqueue(self, model_class, log_kwargs):
+        try:
+            self.queue.put_nowait((model_class, log_kwargs))
+        except queue.Full:
+            logger.error("Transition log queue is full, dropping log %r.", log_kwargs)
+
+    def write(self, model_class, log_kwargs):
+        if self._thread is None or not self._thread.is_alive():
+            self._start()
+        transaction.on_commit(
+            lambda: self._enqueue(model_class, log_kwargs),
+            using=router.db_for_write(model_class),
+        )
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            while item is not None and len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            stop = batch[-1] is None
+            logs = [log for log in batch if log is not None]
+            try:
+                close_old_connections()
+                for model_class, model_logs in _group_by_model(logs):
+                    model_class.log_transitions(model_logs)
+            except Exception:
+                logger.exception("Unable to write %d transition logs.", len(logs))
+            finally:
+                for _log in batch:
+                    self.queue.task_done()
+            if stop:
+                connections.close_all()
+                return
+
+    def flush(self):
+        """Wait until all queued logs have been written."""
+        self.queue.join()
+
+    def stop(self, timeout=None):
+        """Write queued logs, then stop the background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout)
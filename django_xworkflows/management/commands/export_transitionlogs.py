@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2011-2020 Raphaël Barrois
+# This code is distributed under the two-clause BSD license.
+
+
+"""Export the transition logs of selected models to JSON Lines or CSV files."""
+
+
+import csv
+import datetime
+import gzip
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management import base
+from django.core.serializers import json as json_serializers
+from django.utils import dateparse
+from django.utils import timezone
+
+from django_xworkflows import models as xwf_models
+
+
+def _parse_datetime(value):
+    parsed = dateparse.parse_datetime(value)
+    if parsed is None:
+        date = dateparse.parse_date(value)
+        if date is None:
+            raise base.CommandError("Invalid date %r." % value)
+        parsed = datetime.datetime(date.year, date.month, date.day)
+    if settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _jsonl_writer(stream, columns):
+    encoder = json_serializers.DjangoJSONEncoder()
+
+    def write(row):
+        stream.write(encoder.encode(dict(zip(columns, row))) + '\n')
+    return write
+
+
+def _csv_writer(stream, columns):
+    writer = csv.writer(stream)
+    writer.writerow(columns)
+    return writer.writerow
+
+
+def _get_decoder(transition_codes, state_codes):
+    """Convert the (transition, from_state, to_state) codes of a CodedTransitionLog to names."""
+    transition_names = {code: name for name, code in transition_codes.items()}
+    state_names = {code: name for name, code in state_codes.items()}
+
+    def decode(transition, from_state, to_state):
+        return (
+            transition_names.get(transition, transition),
+            state_names.get(from_state, from_state),
+            state_names.get(to_state, to_state),
+        )
+    return decode
+
+
+#: format: (file extension, writer factory)
+FORMATS = {
+    'jsonl': ('jsonl', _jsonl_writer),
+    'csv': ('csv', _csv_writer),
+}
+
+
+class ChunkedOutput(object):
+    """Write rows to numbered files, of at most `chunk_rows` rows each."""
+
+    def __init__(self, prefix, output_format, columns, chunk_rows, compress=True):
+        self.prefix = prefix
+        self.extension, self.make_writer = FORMATS[output_format]
+        self.columns = columns
+        self.chunk_rows = chunk_rows
+        self.compress = compress
+        self.paths = []
+        self.stream = self.writer = None
+        self.rows = 0
+
+    def _open(self):
+        self.close()
+        path = '%s.%05d.%s' % (self.prefix, len(self.paths), self.extension)
+        if self.compress:
+            path += '.gz'
+            self.stream = gzip.open(path, 'wt', encoding='utf-8', newline='')
+        else:
+            self.stream = open(path, 'w', encoding='utf-8', newline='')
+        self.paths.append(path)
+        self.writer = self.make_writer(self.stream, self.columns)
+        self.rows = 0
+
+    def write(self, row):
+        if self.writer is None or self.rows >= self.chunk_rows:
+            self._open()
+        self.writer(row)
+        self.rows += 1
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+class StreamOutput(object):
+    """Write all rows to a single stream."""
+
+    def __init__(self, stream, output_format, columns):
+        self.writer = FORMATS[output_format][1](stream, columns)
+        self.paths = []
+
+    def write(self, row):
+        self.writer(row)
+
+    def close(self):
+        pass
+
+
+class Command(base.BaseCommand):
+    help = "Export the transition logs of the selected models, without loading model instances."
+
+    #: Columns common to all log models; followed by EXTRA_LOG_ATTRIBUTES fields.
+    COLUMNS = ('id', 'model', 'object_id', 'transition', 'from_state', 'to_state', 'timestamp')
+
+    def add_arguments(self, parser):
+        parser.add_argument('args', nargs='+', metavar='app.Model', help="Models whose logs are exported.")
+        parser.add_argument(
+            '--output', required=True,
+            help="Prefix of the output files, numbered and suffixed with the format; '-' for stdout.",
+        )
+        parser.add_argument(
+            '--format', default='jsonl', choices=sorted(FORMATS),
+            help="Output format (default: jsonl).",
+        )
+        parser.add_argument('--since', default=None, help="Only export logs at or after this date/time.")
+        parser.add_argument('--until', default=None, help="Only export logs before this date/time.")
+        parser.add_argument(
+            '--transition', action='append', dest='transitions', default=[],
+            help="Only export this transition; may be repeated.",
+        )
+        parser.add_argument(
+            '--chunk-rows', type=int, default=1000000,
+            help="Maximum number of logs per output file.",
+        )
+        parser.add_argument(
+            '--no-compress', action='store_false', dest='compress', default=True,
+            help="Don't gzip output files.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help="Number of logs fetched per database round-trip.",
+        )
+
+    def handle(self, *labels, **options):
+        log_models = []
+        for label in labels:
+            model = self._get_model(label)
+            for log_model in self._get_log_models(label, model):
+                log_models.append((label, model, log_model))
+
+        extra_fields = []
+        for _label, _model, log_model in log_models:
+            for db_field, _kwarg, _default in log_model.EXTRA_LOG_ATTRIBUTES:
+                name = log_model._meta.get_field(db_field).attname
+                if name not in extra_fields:
+                    extra_fields.append(name)
+        columns = list(self.COLUMNS) + extra_fields
+
+        if options['output'] == '-':
+            output = StreamOutput(self.stdout, options['format'], columns)
+        else:
+            output = ChunkedOutput(
+                options['output'], options['format'], columns,
+                chunk_rows=options['chunk_rows'], compress=options['compress'],
+            )
+
+        count = 0
+        try:
+            for label, model, log_model in log_models:
+                count += self._export(output, label, model, log_model, extra_fields, options)
+        finally:
+            output.close()
+
+        if int(options.get('verbosity', 1)) and output.paths:
+            self.stderr.write("Exported %d logs to %s\n" % (count, ', '.join(output.paths)))
+
+    def _get_model(self, label):
+        app_label, model_label = label.rsplit('.', 1)
+        try:
+            model = apps.get_model(app_label, model_label)
+        except LookupError:
+            raise base.CommandError("Unknown model %s." % label)
+        if not hasattr(model, '_workflows'):
+            raise base.CommandError("Model %s isn't attached to a workflow." % label)
+        return model
+
+    def _get_log_models(self, label, model):
+        """The distinct log models of a model's workflows."""
+        log_models = []
+        for field_name, state_field in model._workflows.items():
+            workflow = state_field.workflow
+            if not workflow.log_model_class and not workflow.log_model:
+                raise base.CommandError("Field %s of %s does not log to a model." % (field_name, label))
+            log_model = workflow._get_log_model_class()
+            if log_model not in log_models:
+                log_models.append(log_model)
+        return log_models
+
+    def _export(self, output, label, model, log_model, extra_fields, options):
+        """Stream the logs of a model through output.
+
+        Returns:
+            int: the number of exported logs.
+        """
+        logs = log_model._get_model_logs(model)
+        if options.get('since'):
+            logs = logs.filter(timestamp__gte=_parse_datetime(options['since']))
+        if options.get('until'):
+            logs = logs.filter(timestamp__lt=_parse_datetime(options['until']))
+
+        transitions = options.get('transitions')
+        decode = None
+        if issubclass(log_model, xwf_models.CodedTransitionLog):
+            transition_codes, state_codes = log_model._get_codes()
+            transitions = [transition_codes.get(name) for name in transitions]
+            decode = _get_decoder(transition_codes, state_codes)
+        if transitions:
+            logs = logs.filter(transition__in=transitions)
+
+        own_fields = {
+            log_model._meta.get_field(db_field).attname for db_field, _kwarg, _default in log_model.EXTRA_LOG_ATTRIBUTES
+        }
+        extra_indexes = [index for index, name in enumerate(extra_fields) if name in own_fields]
+        fields = ['pk', log_model._get_object_key(), 'transition', 'from_state', 'to_state', 'timestamp']
+        fields += [name for name in extra_fields if name in own_fields]
+        # values_list() and iterator() skip model instances, and use server-side cursors where available.
+        rows = logs.order_by('pk').values_list(*fields).iterator(chunk_size=options.get('batch_size') or 2000)
+
+        count = 0
+        for row in rows:
+            pk, object_id, transition, from_state, to_state, timestamp = row[:6]
+            if decode is not None:
+                transition, from_state, to_state = decode(transition, from_state, to_state)
+            extra = [None] * len(extra_fields)
+            for index, value in zip(extra_indexes, row[6:]):
+                extra[index] = value
+            output.write([pk, label, object_id, transition, from_state, to_state, timestamp] + extra)
+            count += 1
+        return count
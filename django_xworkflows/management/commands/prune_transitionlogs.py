@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2011-2020 Raphaël Barrois
+# This code is distributed under the two-clause BSD license.
+
+
+"""Remove transition logs older than a retention period."""
+
+
+import datetime
+
+from django.apps import apps
+from django.core.management import base
+from django.db import router
+from django.db import transaction
+from django.utils import timezone
+
+from django_xworkflows import models as xwf_models
+from django_xworkflows import partitions
+
+
+class Command(base.LabelCommand):
+    args = "<app.Model> <app.Model> ..."
+    help = (
+        "Remove transition logs older than --days from the selected log models: "
+        "whole partitions for partitioned tables, short batched deletes otherwise."
+    )
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            '--days', type=int, required=True,
+            help="Retention period, in days.",
+        )
+        parser.add_argument(
+            '--archive', action='store_true', default=False,
+            help="Detach expired partitions, keeping them as standalone tables, instead of dropping them.",
+        )
+        parser.add_argument(
+            '--create-partitions', type=int, default=0, metavar='MONTHS',
+            help="Also create the missing monthly partitions for the current and next MONTHS-1 months.",
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="For tables which aren't partitioned, number of logs deleted per transaction.",
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help="Only report what would be removed.",
+        )
+
+    def handle_label(self, label, **options):
+        app_label, model_label = label.rsplit('.', 1)
+        try:
+            log_model = apps.get_model(app_label, model_label)
+        except LookupError:
+            raise base.CommandError("Unknown model %s." % label)
+
+        if not issubclass(log_model, xwf_models.BaseTransitionLog):
+            raise base.CommandError("Model %s isn't a transition log model." % label)
+
+        verbosity = int(options.get('verbosity', 1))
+        if verbosity:
+            self.stdout.write('Pruning transition logs of %s\n' % label)
+
+        using = router.db_for_write(log_model)
+        before = timezone.now() - datetime.timedelta(days=options['days'])
+        if partitions.is_partitioned(log_model, using=using):
+            self._prune_partitions(log_model, before, using, **options)
+        else:
+            if options.get('archive') or options.get('create_partitions'):
+                raise base.CommandError(
+                    "--archive and --create-partitions require a partitioned table for %s." % label)
+            self._prune_rows(log_model, before, using, **options)
+
+    def _prune_partitions(self, log_model, before, using, **options):
+        verbosity = int(options.get('verbosity', 1))
+        dry_run = options.get('dry_run', False)
+        archive = options.get('archive', False)
+
+        for partition in partitions.get_expired_partitions(log_model, before, using=using):
+            if not dry_run:
+                partitions.remove_partition(log_model, partition, archive=archive, using=using)
+            if verbosity:
+                action = 'detach' if archive else 'drop'
+                self.stdout.write('  %s partition %s\n' % (
+                    'would %s' % action if dry_run else action + 'ed', partition.name,
+                ))
+
+        if options.get('create_partitions') and not dry_run:
+            created = partitions.create_monthly_partitions(
+                log_model, timezone.now(), options['create_partitions'], using=using,
+            )
+            for name in created:
+                if verbosity:
+                    self.stdout.write('  created partition %s\n' % name)
+
+    def _prune_rows(self, log_model, before, using, **options):
+        """Delete expired logs by small batches, each in its own transaction.
+
+        This avoids locking the table for the whole operation.
+        """
+        verbosity = int(options.get('verbosity', 1))
+        batch_size = options.get('batch_size') or 1000
+        expired = log_model._default_manager.using(using).filter(timestamp__lt=before)
+
+        if options.get('dry_run'):
+            if verbosity:
+                self.stdout.write('  %d logs to delete.\n' % expired.count())
+            return
+
+        deleted = 0
+        while True:
+            with transaction.atomic(using=using):
+                pks = list(expired.order_by('pk').values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    break
+                log_model._default_manager.using(using).filter(pk__in=pks).delete()
+            deleted += len(pks)
+        if verbosity:
+            self.stdout.write('  %d logs deleted.\n' % deleted)
@@ -6,20 +6,94 @@
 """Rebuild missing from_state/to_state fields on TransitionLog objects."""
 
 
-from django.contrib.contenttypes import models as ctype_models
+from concurrent import futures
+import io
+import re
+
+import django
+from django.apps import apps
 from django.core.management import base
+from django.db import connections
 from django.db import models
+from django.db import router
+
+from django_xworkflows import models as xwf_models
+
+
+def _parse_shard(value):
+    """Parse a 'i/N' shard specification into (i, N)."""
+    match = re.match(r'^(\d+)/(\d+)$', value)
+    if not match or int(match.group(1)) >= int(match.group(2)):
+        raise base.CommandError("Invalid shard %r, expected i/N with 0 <= i < N." % value)
+    return int(match.group(1)), int(match.group(2))
+
+
+def _split_range(lower, upper, parts):
+    """Split [lower, upper) into at most `parts` contiguous ranges."""
+    step = max(1, -(-(upper - lower) // parts))
+    return [(start, min(start + step, upper)) for start in range(lower, upper, step)]
+
+
+def _init_worker():
+    if not apps.ready:
+        # Processes started with the 'spawn' method
+        django.setup()
+
+
+def _rebuild_worker(args):
+    """Rebuild a range of objects, from a worker process."""
+    label, field_name, lower, upper, options = args
+    stdout, stderr = io.StringIO(), io.StringIO()
+    command = Command(stdout=stdout, stderr=stderr)
+    model = apps.get_model(label)
+    try:
+        seen, fixed = command._rebuild_range(
+            label, model, model._workflows[field_name].workflow, lower, upper, **options)
+    finally:
+        connections.close_all()
+    return seen, fixed, stdout.getvalue(), stderr.getvalue()
 
 
 class Command(base.LabelCommand):
     args = "<app.Model> <app.Model> ..."
     help = "Rebuild TransitionLog from_state/to_state fields for selected models."
 
+    #: Runs workers, for --workers
+    executor_class = futures.ProcessPoolExecutor
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of logs read per chunk, and fixed per write.",
+        )
+        parser.add_argument(
+            '--start-from', default=None,
+            help="Resume from this object pk (the checkpoint printed by a previous run).",
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help="Only count logs needing a fix, without writing them.",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help="Split objects into primary key ranges, handled by that many processes.",
+        )
+        parser.add_argument(
+            '--shard', default=None,
+            help="Only handle the i-th of N primary key ranges (0-based), as i/N.",
+        )
+
     def handle_label(self, label, **options):
-        self.stdout.write('Rebuilding TransitionLog states for %s\n' % label)
+        verbosity = int(options.get('verbosity', 1))
+        if verbosity:
+            self.stdout.write('Rebuilding TransitionLog states for %s\n' % label)
 
         app_label, model_label = label.rsplit('.', 1)
-        model = models.get_model(app_label, model_label)
+        try:
+            model = apps.get_model(app_label, model_label)
+        except LookupError:
+            raise base.CommandError("Unknown model %s." % label)
 
         if not hasattr(model, '_workflows'):
             raise base.CommandError("Model %s isn't attached to a workflow." % label)
@@ -27,46 +101,184 @@ class Command(base.LabelCommand):
         for field_name, state_field in model._workflows.items():
             self._handle_field(label, model, field_name, state_field.workflow, **options)
 
+    def _get_logs(self, log_model, model):
+        """Retrieve the logs of a model's objects, and the log attribute holding the object pk."""
+        return log_model._get_model_logs(model), log_model._get_object_key()
+
     def _handle_field(self, label, model, field_name, workflow, **options):
         if not hasattr(workflow, 'log_model') or not workflow.log_model:
             raise base.CommandError("Field %s of %s does not log to a model." % (field_name, label))
 
-        log_model = workflow._get_log_model_class()
-        model_type = ctype_models.ContentType.objects.get_for_model(model)
         verbosity = int(options.get('verbosity', 1))
+        workers = options.get('workers') or 1
+        shard = _parse_shard(options['shard']) if options.get('shard') else None
+        start_from = options.get('start_from')
+        dry_run = options.get('dry_run', False)
 
         if verbosity:
-            self.stdout.write('%r.%s: ' % (model, field_name))
-
-        for pk in model.objects.order_by('pk').values_list('pk', flat=True):
-            previous_state = workflow.initial_state
-
-            qs = (log_model.objects.filter(content_type=model_type, content_id=pk)
-                                   .order_by('timestamp'))
-            if verbosity >= 2:
-                self.stdout.write('\n  %d:' % pk)
-
-            for log in qs:
-                try:
-                    workflow.transitions[log.transition]
-                except KeyError:
-                    self.stderr.write(
-                        "Unknown transition %s in log %d for %s %d\n" % (log.transition, log.pk, label, pk))
-                    continue
-
-                updated = False
-                if not log.from_state:
-                    log.from_state = previous_state
-                    updated = True
-                if not log.to_state:
-                    log.to_state = workflow.transitions[log.transition].target
-                    updated = True
-
-                previous_state = log.to_state
-                if updated:
-                    log.save()
-                    if verbosity:
-                        self.stdout.write('.')
+            self.stdout.write('%r.%s:\n' % (model, field_name))
+
+        if shard is None and workers <= 1:
+            ranges = [(start_from, None)]
+        else:
+            ranges = self._get_ranges(model, workflow, workers, shard, start_from)
+
+        if workers <= 1:
+            seen = fixed = 0
+            for lower, upper in ranges:
+                range_seen, range_fixed = self._rebuild_range(label, model, workflow, lower, upper, **options)
+                seen += range_seen
+                fixed += range_fixed
+        else:
+            seen, fixed = self._run_workers(label, field_name, ranges, workers, options)
 
         if verbosity:
-            self.stdout.write('\n')
+            self.stdout.write('  %d logs read, %d %s.\n' % (seen, fixed, 'to fix' if dry_run else 'fixed'))
+
+    def _get_ranges(self, model, workflow, workers, shard, start_from):
+        """Split the object keys of logs into [lower, upper) ranges.
+
+        The range of the selected shard is split into 4 ranges per worker,
+        to balance the load between workers.
+        """
+        logs, object_key = self._get_logs(workflow._get_log_model_class(), model)
+        bounds = logs.aggregate(lower=models.Min(object_key), upper=models.Max(object_key))
+        if bounds['lower'] is None:
+            return []
+        if not isinstance(bounds['lower'], int):
+            raise base.CommandError("--shard and --workers require integer primary keys.")
+        lower, upper = bounds['lower'], bounds['upper'] + 1
+
+        if shard is not None:
+            index, count = shard
+            shard_ranges = _split_range(lower, upper, count)
+            if index >= len(shard_ranges):
+                return []
+            lower, upper = shard_ranges[index]
+
+        if start_from is not None:
+            lower = max(lower, int(start_from))
+        if lower >= upper:
+            return []
+        return _split_range(lower, upper, workers * 4 if workers > 1 else 1)
+
+    def _run_workers(self, label, field_name, ranges, workers, options):
+        """Rebuild ranges from a pool of processes, and merge their results."""
+        worker_options = {
+            key: options.get(key)
+            for key in ('verbosity', 'batch_size', 'dry_run')
+        }
+        # Workers must open their own database connections.
+        connections.close_all()
+
+        seen = fixed = 0
+        with self.executor_class(max_workers=workers, initializer=_init_worker) as executor:
+            results = executor.map(
+                _rebuild_worker,
+                [(label, field_name, lower, upper, worker_options) for lower, upper in ranges],
+            )
+            for range_seen, range_fixed, out, err in results:
+                seen += range_seen
+                fixed += range_fixed
+                self.stdout.write(out, ending='')
+                self.stderr.write(err, ending='')
+        return seen, fixed
+
+    def _rebuild_range(self, label, model, workflow, lower, upper, **options):
+        """Rebuild the logs of objects whose primary key is in [lower, upper).
+
+        Returns:
+            (int, int): the number of logs read, and of logs fixed.
+        """
+        log_model = workflow._get_log_model_class()
+        verbosity = int(options.get('verbosity', 1))
+        batch_size = options.get('batch_size') or 1000
+        dry_run = options.get('dry_run', False)
+
+        logs, object_key = self._get_logs(log_model, model)
+        if lower is not None:
+            logs = logs.filter(**{object_key + '__gte': lower})
+        if upper is not None:
+            logs = logs.filter(**{object_key + '__lt': upper})
+        logs = logs.order_by(object_key, 'timestamp', 'pk').only(
+            'pk', object_key, 'transition', 'from_state', 'to_state',
+        )
+
+        targets, initial_state = self._get_stored_states(log_model, workflow)
+
+        seen = fixed = 0
+        pending = []
+        current_object = previous_state = None
+        for log in logs.iterator(chunk_size=batch_size):
+            object_pk = getattr(log, object_key)
+            if object_pk != current_object:
+                if len(pending) >= batch_size:
+                    # Only write at object boundaries, so that object_pk is a safe checkpoint.
+                    self._write(log_model, pending, dry_run)
+                    pending = []
+                    if verbosity:
+                        self.stdout.write(
+                            '  %d logs read, %d %s; checkpoint: --start-from=%s\n' % (
+                                seen, fixed, 'to fix' if dry_run else 'fixed', object_pk))
+                current_object = object_pk
+                previous_state = initial_state
+            seen += 1
+
+            target = targets.get(log.transition)
+            if target is None:
+                self.stderr.write(
+                    "Unknown transition %s in log %s for %s %s\n" % (log.transition, log.pk, label, object_pk))
+                continue
+
+            updated = False
+            if not log.from_state:
+                log.from_state = previous_state
+                updated = True
+            if not log.to_state:
+                log.to_state = target
+                updated = True
+
+            previous_state = log.to_state
+            if updated:
+                fixed += 1
+                pending.append(log)
+
+        self._write(log_model, pending, dry_run)
+        return seen, fixed
+
+    def _get_stored_states(self, log_model, workflow):
+        """Retrieve transitions and states as stored by log_model: names, or CodedTransitionLog codes.
+
+        Returns:
+            (dict, str or int): the target state of each transition, and the initial state.
+        """
+        targets = {name: transition.target.name for name, transition in workflow.transitions_by_name.items()}
+        initial_state = workflow.initial_state.name
+        if issubclass(log_model, xwf_models.CodedTransitionLog):
+            transition_codes, state_codes = log_model._get_codes()
+            targets = {
+                transition_codes[name]: state_codes[target]
+                for name, target in targets.items()
+                if name in transition_codes
+            }
+            initial_state = state_codes[initial_state]
+        return targets, initial_state
+
+    def _write(self, log_model, logs, dry_run):
+        """Save a batch of fixed logs, with one UPDATE per (from_state, to_state) pair."""
+        if dry_run:
+            return
+
+        # Far cheaper than bulk_update()'s CASE expressions: there are only a few
+        # distinct pairs, bounded by the number of transitions.
+        pks_by_states = {}
+        for log in logs:
+            pks_by_states.setdefault((log.from_state, log.to_state), []).append(log.pk)
+
+        connection = connections[router.db_for_write(log_model)]
+        for (from_state, to_state), pks in pks_by_states.items():
+            chunk_size = connection.ops.bulk_batch_size(['pk'], pks)
+            for start in range(0, len(pks), chunk_size):
+                log_model.objects.filter(pk__in=pks[start:start + chunk_size]).update(
+                    from_state=from_state, to_state=to_state,
+                )
@@ -4,8 +4,14 @@
 
 """Specific versions of XWorkflows to use with Django."""
 
+import functools
+import itertools
+import types
+
 from django.apps import apps
+from django.db import connections
 from django.db import models
+from django.db import router
 from django.db import transaction
 from django.conf import settings
 from django.contrib.contenttypes import fields as ct_fields
@@ -14,11 +20,21 @@ from django.core import exceptions
 from django.forms import fields
 from django.forms import widgets
 from django.utils.deconstruct import deconstructible
+from django.utils.functional import cached_property
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from xworkflows import base
 
+try:
+    from django.utils.choices import BaseChoiceIterator
+except ImportError:  # Django < 5.0
+    BaseChoiceIterator = object
+
+from . import instrumentation
+from . import log_backends
+from . import signals
+
 
 State = base.State
 AbortTransition = base.AbortTransition
@@ -29,6 +45,47 @@ WorkflowError = base.WorkflowError
 transition = base.transition
 
 
+#: bulk_transition(): don't run implementations nor hooks, only update the database.
+BULK_HOOKS_SKIP = 'skip'
+#: bulk_transition(): run implementations and hooks for each object, but save
+#: and log objects by batches.
+BULK_HOOKS_BATCH = 'batch'
+#: bulk_transition(): run the full transition on each object.
+BULK_HOOKS_RUN = 'run'
+
+#: Write each transition log as soon as the transition is performed.
+LOG_FLUSH_IMMEDIATE = 'immediate'
+#: Buffer transition logs, and write them with bulk_create() once the current
+#: database transaction commits.
+LOG_FLUSH_ON_COMMIT = 'on_commit'
+#: Queue transition logs once the current database transaction commits, and
+#: write them from a background thread.
+LOG_FLUSH_BACKGROUND = 'background'
+
+#: Transition logs: index the transition, state, timestamp and object columns separately.
+LOG_INDEXES_COLUMNS = 'columns'
+#: Transition logs: only use composite indexes, for an object's history and
+#: for the transitions of a kind over a period.
+LOG_INDEXES_COMPOSITE = 'composite'
+#: Transition logs: use both single-column and composite indexes.
+LOG_INDEXES_ALL = 'all'
+
+_SYNC_LOG_BACKEND = log_backends.SyncLogBackend()
+_BACKGROUND_LOG_BACKEND = log_backends.ThreadedLogBackend()
+
+
+class IndexedStateWrapper(base.StateWrapper):
+    """StateWrapper reading available transitions from the workflow's index."""
+
+    def transitions(self):
+        """Retrieve a list of transitions available from this state."""
+        transitions_from = getattr(self.workflow, 'transitions_from', None)
+        if transitions_from is None:
+            # Not a django_xworkflows Workflow
+            return super(IndexedStateWrapper, self).transitions()
+        return iter(transitions_from.get(self.state.name, ()))
+
+
 class StateSelect(widgets.Select):
     """Custom 'select' widget to handle state retrieval."""
 
@@ -69,17 +126,132 @@ class StateFieldProperty(object):
             if self.parent_property and hasattr(self.parent_property, '__get__'):
                 # We override a property.
                 return self.parent_property.__get__(instance, owner)
-            default = self.field.to_python(self.field.workflow.initial_state)
-            return instance.__dict__.get(self.field.name, default)
+            try:
+                return instance.__dict__[self.field.name]
+            except KeyError:
+                return self.field.to_python(self.field.workflow.initial_state)
         else:
             return self.field.workflow
 
     def __set__(self, instance, value):
-        instance.__dict__[self.field.name] = self.field.to_python(value)
+        """Store the StateWrapper of a value.
+
+        Values loaded from the database are trusted: wrappers already built by
+        a strict field's from_db_value() are kept as is, and stored names are
+        looked up among the prebuilt wrappers. Other values go through
+        to_python(), which validates them.
+        """
+        field = self.field
+        if isinstance(value, base.StateWrapper):
+            if value.workflow is not field.workflow:
+                value = field.to_python(value)
+        else:
+            try:
+                value = field._state_wrappers[value]
+            except (KeyError, TypeError):
+                value = field.to_python(value)
+        instance.__dict__[field.name] = value
+
+
+class _StateChoices(BaseChoiceIterator):
+    """The (name, title) choices of a workflow's states, listed on first use."""
+
+    def __init__(self, workflow):
+        self.workflow = workflow
+        self._choices = None
+
+    def __iter__(self):
+        if self._choices is None:
+            if isinstance(self.workflow, _SerializedWorkflow):
+                # Don't build the workflow: serialized states are their own titles.
+                self._choices = [(name, name) for name in self.workflow._states]
+            else:
+                self._choices = [(st.name, st.title) for st in self.workflow.states]
+        return iter(self._choices)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, tuple, _StateChoices)):
+            # e.g Field.deconstruct() comparing with the None default: don't list states.
+            return NotImplemented
+        return list(self) == list(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class WorkflowRegistry(object):
+    """The Workflow instances shared by StateFields given a Workflow class.
+
+    A StateField given a Workflow subclass uses the registry's instance of it,
+    so that all fields, across models, share its state and transition tables
+    and its resolved log model. Fields given a Workflow instance keep it.
+    """
+
+    def __init__(self):
+        self._workflows = {}
+        self._fields = {}
+
+    def get(self, workflow_class):
+        """Retrieve the shared instance of a Workflow subclass, creating it on first call."""
+        try:
+            return self._workflows[workflow_class]
+        except KeyError:
+            return self._workflows.setdefault(workflow_class, workflow_class())
+
+    def __getitem__(self, workflow_class):
+        return self._workflows[workflow_class]
+
+    def __contains__(self, workflow_class):
+        return workflow_class in self._workflows
+
+    def __iter__(self):
+        return iter(list(self._workflows))
+
+    def __len__(self):
+        return len(self._workflows)
+
+    def items(self):
+        """The (Workflow subclass, shared instance) pairs."""
+        return list(self._workflows.items())
+
+    def add_field(self, field):
+        """Record a StateField attached to a model, if it uses a shared workflow."""
+        workflow_class = field.workflow.__class__
+        if self._workflows.get(workflow_class) is field.workflow:
+            self._fields.setdefault(workflow_class, []).append(field)
+
+    def get_fields(self, workflow_class):
+        """The StateFields of models using the shared instance of a Workflow subclass.
+
+        Returns:
+            StateField list: use field.model and field.name to find their models.
+        """
+        return list(self._fields.get(workflow_class, ()))
+
+
+#: The shared Workflow instances of this process
+workflow_registry = WorkflowRegistry()
 
 
 class StateField(models.Field):
-    """Holds the current state of a WorkflowEnabled object."""
+    """Holds the current state of a WorkflowEnabled object.
+
+    Attributes:
+        workflow (Workflow): the workflow whose states are stored
+        strict (bool): whether values read from the database should be
+            converted and checked as soon as they are loaded, including in
+            .values() and .values_list() querysets.
+        lazy (bool): whether choices and the table of state wrappers are only
+            built on first use. Fields of historical models, from migrations,
+            are always lazy.
+
+    Fields given a Workflow subclass share its instance from workflow_registry.
+    """
 
     default_error_messages = {
         'invalid': _("Choose a valid state."),
@@ -91,21 +263,59 @@ class StateField(models.Field):
 
     DEFAULT_MAX_LENGTH = 16
 
-    def __init__(self, workflow, **kwargs):
+    def __init__(self, workflow, strict=False, lazy=False, **kwargs):
+        lazy = lazy or isinstance(workflow, _SerializedWorkflow)
         if isinstance(workflow, type):
-            workflow = workflow()
+            workflow = workflow_registry.get(workflow)
         self.workflow = workflow
-        kwargs['choices'] = list(
-            (st.name, st.title) for st in self.workflow.states)
+        self.strict = strict
+        self.lazy = lazy
 
+        initial_state, state_names = self._get_state_names(workflow)
         kwargs['max_length'] = max(
             kwargs.get('max_length', self.DEFAULT_MAX_LENGTH),
-            max(len(st.name) for st in self.workflow.states))
+            max(len(name) for name in state_names))
         kwargs['blank'] = False
         kwargs['null'] = False
-        kwargs['default'] = self.workflow.initial_state.name
+        kwargs['default'] = initial_state
+        if lazy:
+            kwargs['choices'] = _StateChoices(workflow)
+        else:
+            kwargs['choices'] = list(
+                (st.name, st.title) for st in self.workflow.states)
+            self._state_wrappers = self._build_state_wrappers(self.workflow)
         return super(StateField, self).__init__(**kwargs)
 
+    @staticmethod
+    def _get_state_names(workflow):
+        """The initial state name and state names of a workflow, without building a serialized one."""
+        if isinstance(workflow, _SerializedWorkflow):
+            return workflow._initial_state, workflow._states
+        return workflow.initial_state.name, [st.name for st in workflow.states]
+
+    @cached_property
+    def _state_wrappers(self):
+        """Built on first use for lazy fields, in __init__ otherwise."""
+        return self._build_state_wrappers(self.workflow)
+
+    @staticmethod
+    def _build_state_wrappers(workflow):
+        """Prepare one shared StateWrapper per state of the workflow.
+
+        StateWrapper objects are never altered once built, so a single wrapper
+        per state can be handed to every instance.
+
+        Returns:
+            mappingproxy: maps both the state name and the State object to the
+                related base.StateWrapper.
+        """
+        wrappers = {}
+        for state in workflow.states:
+            wrapper = IndexedStateWrapper(state, workflow)
+            wrappers[state.name] = wrapper
+            wrappers[state] = wrapper
+        return types.MappingProxyType(wrappers)
+
     def get_internal_type(self):
         return "CharField"
 
@@ -115,31 +325,54 @@ class StateField(models.Field):
         Attaches a StateFieldProperty to wrap the attribute.
         """
         super(StateField, self).contribute_to_class(cls, name)
+        workflow_registry.add_field(self)
 
         parent_property = getattr(cls, self.name, None)
         setattr(cls, self.name, StateFieldProperty(self, parent_property))
 
+    def get_db_converters(self, connection):
+        """Only strict fields convert values as soon as they are loaded.
+
+        The SQL compiler applies converters row by row, which costs more than
+        the lookup they would save: non-strict fields leave state names as is,
+        and resolve them when they are assigned to the model instance.
+        """
+        if self.strict:
+            return super(StateField, self).get_db_converters(connection)
+        return []
+
+    def from_db_value(self, value, expression, connection):
+        """Converts a value loaded from the database into a Python value.
+
+        Values coming from the database only need a lookup in the table of
+        prebuilt StateWrapper; unknown states are rejected.
+        """
+        try:
+            return self._state_wrappers[value]
+        except KeyError:
+            if value is None:
+                # NULL from an outer join
+                return value
+            raise exceptions.ValidationError(self.error_messages['invalid'])
+
     def to_python(self, value):
         """Converts the DB-stored value into a Python value."""
         if isinstance(value, base.StateWrapper):
-            res = value
-        else:
-            if isinstance(value, base.State):
-                state = value
-            elif value is None:
-                state = self.workflow.initial_state
-            else:
-                try:
-                    state = self.workflow.states[value]
-                except KeyError:
-                    raise exceptions.ValidationError(self.error_messages['invalid'])
-            res = base.StateWrapper(state, self.workflow)
-
-        if res.state not in self.workflow.states:
+            # Our own wrappers are known to be valid.
+            if value.workflow is not self.workflow and value.state not in self.workflow.states:
+                raise exceptions.ValidationError(self.error_messages['invalid'])
+            return value
+
+        if value is None:
+            value = self.workflow.initial_state
+
+        # State objects are looked up by identity: a State from another
+        # workflow won't match, even if it shares its name with one of ours.
+        try:
+            return self._state_wrappers[value]
+        except KeyError:
             raise exceptions.ValidationError(self.error_messages['invalid'])
 
-        return res
-
     def get_prep_value(self, value):
         """Prepares a value.
 
@@ -190,22 +423,95 @@ class StateField(models.Field):
         """
         name, path, args, kwargs = super(StateField, self).deconstruct()
 
-        # We want to display the proper class name, which isn't available
-        # at the same point for _SerializedWorkflow and Workflow.
         if isinstance(self.workflow, _SerializedWorkflow):
-            workflow_class_name = self.workflow._name
+            # Fields of historical models: reuse the serialized workflow as is,
+            # without building its Workflow.
+            kwargs['workflow'] = self.workflow
         else:
-            workflow_class_name = self.workflow.__class__.__name__
-
-        kwargs['workflow'] = _SerializedWorkflow(
-            name=workflow_class_name,
-            initial_state=str(self.workflow.initial_state.name),
-            states=[str(st.name) for st in self.workflow.states],
-        )
+            kwargs['workflow'] = _SerializedWorkflow(
+                name=self.workflow.__class__.__name__,
+                initial_state=str(self.workflow.initial_state.name),
+                states=[str(st.name) for st in self.workflow.states],
+                **self._get_serialized_workflow_kwargs()
+            )
         del kwargs['choices']
         del kwargs['default']
+        if self.strict:
+            kwargs['strict'] = True
         return name, path, args, kwargs
 
+    def _get_serialized_workflow_kwargs(self):
+        """Extra workflow data to record in migrations.
+
+        Codes of the current states and transitions are what coded columns
+        store: changing them must show up as a schema change.
+        """
+        names = {
+            'state_codes': [state.name for state in self.workflow.states],
+            'transition_codes': [transition.name for transition in self.workflow.transitions],
+        }
+        kwargs = {}
+        for attribute, attribute_names in names.items():
+            codes = getattr(self.workflow, attribute, None)
+            if codes:
+                kwargs[attribute] = {str(name): codes[name] for name in attribute_names if name in codes}
+        return kwargs
+
+
+def _check_codes(workflow, attribute, names):
+    """Check that a workflow maps all names to distinct codes, between 1 and 32767.
+
+    Returns:
+        dict: the codes
+    """
+    workflow_name = workflow.__name__ if isinstance(workflow, type) else workflow.__class__.__name__
+    codes = getattr(workflow, attribute, None) or {}
+    missing = [name for name in names if name not in codes]
+    if missing:
+        raise exceptions.ImproperlyConfigured(
+            "%s.%s has no code for %s." % (workflow_name, attribute, ', '.join(missing)))
+
+    values = list(codes.values())
+    if len(set(values)) != len(values) or not all(isinstance(code, int) and 0 < code <= 32767 for code in values):
+        raise exceptions.ImproperlyConfigured(
+            "%s.%s codes must be distinct integers between 1 and 32767." % (workflow_name, attribute))
+    return codes
+
+
+class CodedStateField(StateField):
+    """A StateField stored as a small integer code, from Workflow.state_codes.
+
+    States are still handled by name everywhere but in the database column:
+    choices, forms, serialization and lookups accept state names.
+    """
+
+    description = _("State (integer code)")
+
+    def __init__(self, workflow, strict=False, **kwargs):
+        kwargs.pop('max_length', None)
+        super(CodedStateField, self).__init__(workflow, strict=strict, **kwargs)
+        self.max_length = None
+
+    @staticmethod
+    def _build_state_wrappers(workflow):
+        state_codes = _check_codes(workflow, 'state_codes', [state.name for state in workflow.states])
+        wrappers = dict(StateField._build_state_wrappers(workflow))
+        for state in workflow.states:
+            wrappers[state_codes[state.name]] = wrappers[state]
+        return types.MappingProxyType(wrappers)
+
+    def get_internal_type(self):
+        return "PositiveSmallIntegerField"
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        """Convert a value to DB storage.
+
+        Returns the state code.
+        """
+        if not prepared:
+            value = self.get_prep_value(value)
+        return self.workflow.state_codes[value.state.name]
+
 
 class WorkflowEnabledMeta(base.WorkflowEnabledMeta, models.base.ModelBase):
     """Metaclass for WorkflowEnabled objects."""
@@ -239,6 +545,398 @@ class WorkflowEnabledMeta(base.WorkflowEnabledMeta, models.base.ModelBase):
         # a valid value, and that would clash with django model inheritance.
         pass
 
+    @classmethod
+    def _register_hooks(mcs, cls, implems):
+        """Register the hooks of a new class for each of its workflows.
+
+        The default version scans all attributes of the class (dir()) once per
+        workflow; attributes are scanned only once here, skipping those of
+        models.Model, which declares no hooks.
+        """
+        names = set()
+        for klass in cls.__mro__:
+            if klass not in (models.Model, object):
+                names.update(klass.__dict__)
+
+        hooks = []
+        for name in sorted(names):
+            value = getattr(cls, name, None)
+            if callable(value) and hasattr(value, 'xworkflows_hook'):
+                hooks.append(value)
+
+        for implem_list in implems.values():
+            for hook in hooks:
+                implem_list.register_function_hooks(hook)
+
+
+def _batches(items, batch_size):
+    """Split a list into lists of at most batch_size items."""
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+
+class WorkflowQuerySet(models.QuerySet):
+    """QuerySet for WorkflowEnabled models, able to run transitions in bulk."""
+
+    def __init__(self, *args, **kwargs):
+        super(WorkflowQuerySet, self).__init__(*args, **kwargs)
+        # (log model, to_attr, log queryset) for each prefetch_transitions() call
+        self._transition_prefetches = []
+        self._transition_prefetch_done = False
+
+    def _clone(self, *args, **kwargs):
+        clone = super(WorkflowQuerySet, self)._clone(*args, **kwargs)
+        clone._transition_prefetches = list(self._transition_prefetches)
+        return clone
+
+    def _fetch_all(self):
+        super(WorkflowQuerySet, self)._fetch_all()
+        if self._transition_prefetches and not self._transition_prefetch_done:
+            if self._iterable_class is models.query.ModelIterable:
+                for log_model, to_attr, queryset in self._transition_prefetches:
+                    self._prefetch_transition_logs(self._result_cache, log_model, to_attr, queryset)
+            self._transition_prefetch_done = True
+
+    def _iterator(self, use_chunked_fetch, chunk_size):
+        iterable = super(WorkflowQuerySet, self)._iterator(use_chunked_fetch, chunk_size)
+        if not self._transition_prefetches or self._iterable_class is not models.query.ModelIterable:
+            yield from iterable
+            return
+
+        # Prefetch logs for each chunk of objects, as prefetch_related() does.
+        iterator = iter(iterable)
+        while True:
+            instances = list(itertools.islice(iterator, chunk_size or 2000))
+            if not instances:
+                return
+            for log_model, to_attr, queryset in self._transition_prefetches:
+                self._prefetch_transition_logs(instances, log_model, to_attr, queryset)
+            yield from instances
+
+    def _get_transition(self, transition_name, field_name=None):
+        """Find the state field and Transition matching a transition name.
+
+        Returns:
+            (str, StateField, Transition): the name of the state field, the
+                field itself and the transition.
+        """
+        matches = [
+            (name, state_field)
+            for name, state_field in self.model._workflows.items()
+            if (field_name is None or name == field_name) and transition_name in state_field.workflow.transitions
+        ]
+        if not matches:
+            raise ValueError("No transition %s on model %s." % (transition_name, self.model.__name__))
+        elif len(matches) > 1:
+            raise ValueError(
+                "Transition %s exists for several fields of model %s; please provide a field name."
+                % (transition_name, self.model.__name__))
+
+        name, state_field = matches[0]
+        return name, state_field, state_field.workflow.transitions[transition_name]
+
+    def bulk_transition(
+            self, transition_name, *args, field=None, hooks=BULK_HOOKS_SKIP, batch_size=1000, log=True, **kwargs):
+        """Perform a transition on all objects of the queryset in a valid source state.
+
+        Objects whose state isn't a source of the transition are ignored; the
+        whole operation runs in a single database transaction.
+
+        Args:
+            transition_name (str): the name of the transition to perform
+            field (str): the name of the state field, if the transition name
+                is ambiguous
+            hooks (str): how to handle implementations and hooks:
+                - BULK_HOOKS_SKIP: neither implementations nor hooks are run;
+                  objects are updated with one UPDATE query per batch, or
+                  a single UPDATE query when no log is written
+                - BULK_HOOKS_BATCH: implementations and hooks run for each
+                  object; objects are saved with bulk_update() and logged with
+                  one query per batch
+                - BULK_HOOKS_RUN: the complete transition runs for each object
+                Objects failing a transition check are skipped.
+            batch_size (int): number of objects to handle per query
+            log (bool): whether to log transitions to the database
+            *args, **kwargs: passed to implementations and hooks, and used for
+                the logs' EXTRA_LOG_ATTRIBUTES.
+
+        Returns:
+            int: the number of objects that performed the transition.
+        """
+        field_name, state_field, transition = self._get_transition(transition_name, field)
+        sources = [state.name for state in transition.source]
+
+        if hooks == BULK_HOOKS_SKIP and not (log and state_field.workflow.log_model):
+            # Nothing to log: no need to lock and fetch rows first.
+            return self.filter(**{field_name + '__in': sources}).update(**{field_name: transition.target})
+
+        with transaction.atomic(using=self.db):
+            candidates = self.filter(**{field_name + '__in': sources}).select_for_update()
+            if hooks == BULK_HOOKS_SKIP:
+                rows = list(candidates.order_by('pk').values_list('pk', field_name))
+                return self._bulk_update_states(
+                    rows, field_name, state_field, transition, batch_size, log, *args, **kwargs)
+
+            pks = list(candidates.order_by('pk').values_list('pk', flat=True))
+            if hooks == BULK_HOOKS_BATCH:
+                return self._bulk_run_hooks(pks, field_name, state_field, transition, batch_size, log, *args, **kwargs)
+            elif hooks == BULK_HOOKS_RUN:
+                return self._bulk_run_transitions(pks, field_name, transition, batch_size, log, *args, **kwargs)
+            else:
+                raise ValueError("Invalid hooks mode %r for bulk_transition()." % (hooks,))
+
+    def _bulk_update_states(self, rows, field_name, state_field, transition, batch_size, log, *args, **kwargs):
+        """Update the state of (pk, state) rows in SQL, without loading objects."""
+        manager = self.model._base_manager.db_manager(self.db)
+        pk_attname = self.model._meta.pk.attname
+        sources = [state.name for state in transition.source]
+        count = 0
+
+        for batch in _batches(rows, batch_size):
+            count += manager.filter(
+                pk__in=[pk for pk, _state in batch],
+                **{field_name + '__in': sources}
+            ).update(**{field_name: transition.target})
+
+            if log:
+                state_field.workflow.bulk_db_log(transition, [
+                    (
+                        state_field.to_python(state),
+                        self.model.from_db(self.db, [pk_attname, field_name], [pk, transition.target.name]),
+                    )
+                    for pk, state in batch
+                ], *args, **kwargs)
+        return count
+
+    def _bulk_run_hooks(self, pks, field_name, state_field, transition, batch_size, log, *args, **kwargs):
+        """Run hooks for each object, but save and log objects by batches."""
+        manager = self.model._base_manager.db_manager(self.db)
+        count = 0
+
+        for batch in _batches(pks, batch_size):
+            instances = list(manager.filter(pk__in=batch).order_by('pk'))
+            count += len(self._run_hooks(instances, field_name, state_field, transition, log, *args, **kwargs))
+        return count
+
+    def _run_hooks(self, instances, field_name, state_field, transition, log, *args, **kwargs):
+        """Run hooks for each instance, then save and log them with one query each.
+
+        The transition_failed signal is sent for each instance whose
+        transition raised, before the exception propagates.
+
+        Returns:
+            list: the instances that performed the transition.
+        """
+        manager = self.model._base_manager.db_manager(self.db)
+        attribute = self.model._xworkflows_implems[field_name].transitions_at[transition.name]
+        workflow = state_field.workflow
+        fields = [field.name for field in self.model._meta.concrete_fields if not field.primary_key]
+
+        performed = []
+        for instance in instances:
+            implementation = getattr(instance, attribute)
+            try:
+                implementation._pre_transition_checks()
+            except ForbiddenTransition:
+                continue
+            try:
+                implementation._pre_transition(*args, **kwargs)
+                result = implementation._during_transition(*args, **kwargs)
+
+                from_state = getattr(instance, field_name)
+                setattr(instance, field_name, transition.target)
+                workflow.log_transition(transition, from_state, instance, *args, save=False, log=False, **kwargs)
+            except Exception as e:
+                implementation._send_signal(signals.transition_failed, exception=e)
+                raise
+            performed.append((implementation, from_state, result))
+
+        try:
+            if performed:
+                manager.bulk_update([implem.instance for implem, _state, _res in performed], fields)
+            if log:
+                workflow.bulk_db_log(
+                    transition, [(from_state, implem.instance) for implem, from_state, _res in performed],
+                    *args, **kwargs)
+        except Exception as e:
+            for implementation, _from_state, _result in performed:
+                implementation._send_signal(signals.transition_failed, exception=e)
+            raise
+
+        for implementation, _from_state, result in performed:
+            try:
+                implementation._post_transition(result, *args, **kwargs)
+            except Exception as e:
+                implementation._send_signal(signals.transition_failed, exception=e)
+                raise
+        return [implem.instance for implem, _state, _res in performed]
+
+    def _bulk_run_transitions(self, pks, field_name, transition, batch_size, log, *args, **kwargs):
+        """Run the complete transition for each object."""
+        manager = self.model._base_manager.db_manager(self.db)
+        attribute = self.model._xworkflows_implems[field_name].transitions_at[transition.name]
+        count = 0
+
+        for batch in _batches(pks, batch_size):
+            for instance in manager.filter(pk__in=batch).order_by('pk'):
+                try:
+                    getattr(instance, attribute)(*args, log=log, **kwargs)
+                except ForbiddenTransition:
+                    continue
+                count += 1
+        return count
+
+    def claim(self, transition_name, limit, *args, field=None, hooks=BULK_HOOKS_SKIP, log=True, **kwargs):
+        """Lock up to `limit` objects able to perform a transition, and perform it.
+
+        Rows locked by another transaction are skipped (SELECT ... FOR UPDATE
+        SKIP LOCKED), so that concurrent workers claim distinct objects.
+        Objects are picked in the queryset's order, or by pk.
+
+        That guarantee requires SKIP LOCKED support: other databases lock rows
+        with a plain SELECT ... FOR UPDATE, if supported, and concurrent
+        workers wait for each other's locks instead.
+
+        Args:
+            transition_name (str): the name of the transition to perform
+            limit (int): the maximum number of objects to claim
+            field (str): the name of the state field, if the transition name
+                is ambiguous
+            hooks (str): BULK_HOOKS_SKIP (the default), to update all states
+                with a single UPDATE query, without running implementations
+                nor hooks; or BULK_HOOKS_BATCH, to run implementations and
+                hooks for each object before saving them with bulk_update().
+            log (bool): whether to log transitions to the database
+            *args, **kwargs: passed to implementations and hooks, and used for
+                the logs' EXTRA_LOG_ATTRIBUTES.
+
+        Returns:
+            list: the claimed instances, in the transition's target state.
+
+        Raises:
+            ConcurrentTransitionError: with BULK_HOOKS_SKIP, when some claimed
+                objects left their source state before the UPDATE; nothing is
+                claimed then.
+        """
+        if hooks not in (BULK_HOOKS_SKIP, BULK_HOOKS_BATCH):
+            raise ValueError("Invalid hooks mode %r for claim()." % (hooks,))
+
+        field_name, state_field, transition = self._get_transition(transition_name, field)
+        sources = [state.name for state in transition.source]
+        lock_options = {}
+        if connections[self.db].features.has_select_for_update_skip_locked:
+            lock_options['skip_locked'] = True
+
+        with transaction.atomic(using=self.db):
+            candidates = self.filter(**{field_name + '__in': sources})
+            if not candidates.ordered:
+                candidates = candidates.order_by('pk')
+            instances = list(candidates.select_for_update(**lock_options)[:limit])
+
+            if hooks == BULK_HOOKS_BATCH:
+                return self._run_hooks(instances, field_name, state_field, transition, log, *args, **kwargs)
+
+            if not instances:
+                return instances
+            from_states = [getattr(instance, field_name) for instance in instances]
+            updated = self.model._base_manager.db_manager(self.db).filter(
+                pk__in=[instance.pk for instance in instances],
+                **{field_name + '__in': sources}
+            ).update(**{field_name: transition.target})
+            if updated != len(instances):
+                # Rows weren't locked, and some left their source state meanwhile.
+                raise ConcurrentTransitionError(
+                    "Transition '%s' isn't available: %d of %d claimed objects left their source state meanwhile."
+                    % (transition.name, len(instances) - updated, len(instances)))
+            for instance in instances:
+                setattr(instance, field_name, transition.target)
+            if log:
+                state_field.workflow.bulk_db_log(transition, list(zip(from_states, instances)), *args, **kwargs)
+            return instances
+
+    def _get_log_model(self, field_name=None):
+        """Find the transition log model of a state field."""
+        names = [name for name in self.model._workflows if field_name is None or name == field_name]
+        if not names:
+            raise ValueError("No state field %s on model %s." % (field_name, self.model.__name__))
+        elif len(names) > 1:
+            raise ValueError(
+                "Model %s has several state fields; please provide a field name." % self.model.__name__)
+
+        workflow = self.model._workflows[names[0]].workflow
+        if not workflow.log_model_class and not workflow.log_model:
+            raise ValueError("Field %s of model %s doesn't log to a model." % (names[0], self.model.__name__))
+        return workflow._get_log_model_class()
+
+    def with_last_transition(self, field=None, fields=None):
+        """Annotate objects with their latest transition log, within the same query.
+
+        Each log field is fetched through a correlated subquery, and available
+        as a 'last_<log field>' attribute; it is None for objects without logs.
+        Each subquery looks the latest log up again: only request the fields
+        you need.
+
+        Args:
+            field (str): the name of the state field, if the model has several
+            fields (str list): the log fields to fetch; defaults to transition,
+                from_state, to_state, timestamp and the EXTRA_LOG_ATTRIBUTES
+                fields of the log model.
+        """
+        log_model = self._get_log_model(field)
+        if fields is None:
+            fields = ['transition', 'from_state', 'to_state', 'timestamp'] + [
+                log_model._meta.get_field(db_field).attname
+                for db_field, _kwarg, _default in log_model.EXTRA_LOG_ATTRIBUTES
+            ]
+
+        logs = log_model._get_model_logs(self.model).filter(
+            **{log_model._get_object_key(): models.OuterRef('pk')}
+        ).order_by('-timestamp', '-pk')
+        return self.annotate(**{
+            'last_' + name: models.Subquery(logs.values(name)[:1])
+            for name in fields
+        })
+
+    def prefetch_transitions(self, field=None, to_attr='transition_logs', queryset=None):
+        """Fetch the transition logs of all objects with a single additional query.
+
+        Each object gets the list of its logs, by increasing timestamp, in
+        its `to_attr` attribute. With iterator(), logs are fetched with one
+        query per chunk of objects.
+
+        Args:
+            field (str): the name of the state field, if the model has several
+            to_attr (str): the attribute holding the logs on each object
+            queryset (QuerySet): the logs to consider, e.g to select_related()
+                some of their fields; defaults to all logs.
+        """
+        clone = self._chain()
+        clone._transition_prefetches.append((self._get_log_model(field), to_attr, queryset))
+        return clone
+
+    def _prefetch_transition_logs(self, instances, log_model, to_attr, queryset):
+        object_key = log_model._get_object_key()
+        object_field = log_model._meta.get_field(log_model.MODIFIED_OBJECT_FIELD)
+        history = {instance.pk: [] for instance in instances}
+
+        if history:
+            logs = log_model._get_model_logs(self.model, queryset).filter(
+                **{object_key + '__in': list(history)}
+            ).order_by('timestamp', 'pk')
+            instances_by_pk = {instance.pk: instance for instance in instances}
+            for log in logs:
+                object_pk = getattr(log, object_key)
+                # Reading the object back from the log shouldn't fetch it again.
+                object_field.set_cached_value(log, instances_by_pk[object_pk])
+                history[object_pk].append(log)
+
+        for instance in instances:
+            setattr(instance, to_attr, history[instance.pk])
+
+
+class WorkflowManager(models.Manager.from_queryset(WorkflowQuerySet)):
+    """Default manager for WorkflowEnabled models."""
+
 
 class BaseWorkflowEnabled(base.BaseWorkflowEnabled):
     """Base class for all django models wishing to use a Workflow."""
@@ -275,7 +973,7 @@ class _DjangoWorkflowEnabledMeta:
 WorkflowEnabled = WorkflowEnabledMeta(
     str('WorkflowEnabled'),
     (BaseWorkflowEnabled, models.Model),
-    {'__module__': __name__, 'Meta': _DjangoWorkflowEnabledMeta},
+    {'__module__': __name__, 'Meta': _DjangoWorkflowEnabledMeta, 'objects': WorkflowManager()},
 )
 
 
@@ -288,17 +986,200 @@ def get_default_log_model():
 
 
 class DjangoImplementationWrapper(base.ImplementationWrapper):
-    """Restrict execution of transitions within templates"""
+    """Restrict execution of transitions within templates.
+
+    Transitions are measured when the workflow has a metrics_collector;
+    subclasses customize _run() to stay within the measure.
+    """
     alters_data = True
     do_not_call_in_templates = True
 
+    #: The TransitionMeasurement of the running transition, if measured
+    _measurement = None
+
+    #: The object's state when the transition started
+    _from_state = None
+
+    def __call__(self, *args, **kwargs):
+        try:
+            collector = getattr(self.workflow, 'metrics_collector', None)
+            if collector is None:
+                return self._run(*args, **kwargs)
+            with instrumentation.measure(collector, self.workflow, self.transition, self.instance) as measurement:
+                self._measurement = measurement
+                try:
+                    return self._run(*args, **kwargs)
+                finally:
+                    self._measurement = None
+        except Exception as e:
+            self._send_signal(signals.transition_failed, exception=e)
+            raise
+
+    def _send_signal(self, signal, **kwargs):
+        from_state = self._from_state if self._from_state is not None else self.current_state
+        self.workflow.send_transition_signal(
+            signal, self.instance, self.field_name, self.transition, from_state, **kwargs)
+
+    def _run(self, *args, **kwargs):
+        """Run the transition, with all checks."""
+        return super(DjangoImplementationWrapper, self).__call__(*args, **kwargs)
+
+    def _pre_transition_checks(self):
+        with instrumentation.phase(self._measurement, instrumentation.PHASE_CHECK):
+            return super(DjangoImplementationWrapper, self)._pre_transition_checks()
+
+    def _pre_transition(self, *args, **kwargs):
+        self._from_state = self.current_state
+        self._send_signal(signals.pre_transition)
+        with instrumentation.phase(self._measurement, instrumentation.PHASE_BEFORE):
+            return super(DjangoImplementationWrapper, self)._pre_transition(*args, **kwargs)
+
+    def _during_transition(self, *args, **kwargs):
+        with instrumentation.phase(self._measurement, instrumentation.PHASE_IMPLEMENTATION):
+            return super(DjangoImplementationWrapper, self)._during_transition(*args, **kwargs)
+
+    def _post_transition(self, result, *args, **kwargs):
+        with instrumentation.phase(self._measurement, instrumentation.PHASE_AFTER):
+            super(DjangoImplementationWrapper, self)._post_transition(result, *args, **kwargs)
+        self._send_signal(signals.post_transition, result=result)
+
 
 class TransactionalImplementationWrapper(DjangoImplementationWrapper):
     """Customize the base ImplementationWrapper to run into a db transaction."""
 
-    def __call__(self, *args, **kwargs):
+    def _run(self, *args, **kwargs):
+        with transaction.atomic():
+            return super(TransactionalImplementationWrapper, self)._run(*args, **kwargs)
+
+
+class ConcurrentTransitionError(base.InvalidTransitionError):
+    """Raised when the object left the source state during a transition."""
+
+
+class LockingImplementationWrapper(TransactionalImplementationWrapper):
+    """Lock the object's row and reload its state before running a transition.
+
+    The row is locked with select_for_update(), using the options from the
+    workflow's lock_options for this transition (e.g {'skip_locked': True});
+    transitions mapped to None run without a lock.
+    """
+
+    def _lock(self):
+        options = getattr(self.workflow, 'lock_options', {}).get(self.transition.name, {})
+        instance = self.instance
+        if options is None or instance._state.adding:
+            return
+
+        queryset = instance.__class__._base_manager.using(instance._state.db).select_for_update(**options)
+        try:
+            state = queryset.values_list(self.field_name, flat=True).get(pk=instance.pk)
+        except instance.DoesNotExist:
+            raise ConcurrentTransitionError(
+                "Transition '%s' isn't available: %r is locked or deleted." % (self.transition.name, instance))
+        setattr(instance, self.field_name, state)
+
+    def _run(self, *args, **kwargs):
         with transaction.atomic():
-            return super(TransactionalImplementationWrapper, self).__call__(*args, **kwargs)
+            with instrumentation.phase(self._measurement, instrumentation.PHASE_LOCK):
+                self._lock()
+            return super(TransactionalImplementationWrapper, self)._run(*args, **kwargs)
+
+
+class OptimisticImplementationWrapper(TransactionalImplementationWrapper):
+    """Persist transitions with a conditional UPDATE instead of a full save().
+
+    The row is updated only if it is still in the transition's source state;
+    otherwise, a ConcurrentTransitionError is raised and the transaction
+    rolled back.
+
+    Besides the state, only fields modified by 'before' hooks and the
+    implementation (compared by value, so in-place mutations go unnoticed)
+    and auto_now fields are written. No pre_save/post_save signals are sent.
+    """
+
+    def _get_snapshot_fields(self):
+        deferred = self.instance.get_deferred_fields()
+        return [
+            field for field in self.instance._meta.concrete_fields
+            if not field.primary_key and field.name != self.field_name and field.attname not in deferred
+        ]
+
+    def _run(self, *args, **kwargs):
+        self._snapshot = {
+            field.attname: field.value_from_object(self.instance)
+            for field in self._get_snapshot_fields()
+        }
+        return super(OptimisticImplementationWrapper, self)._run(*args, **kwargs)
+
+    def _conditional_save(self, from_state):
+        instance = self.instance
+        if instance._state.adding:
+            instance.save()
+            return
+
+        values = {self.field_name: self.transition.target.name}
+        for field in self._get_snapshot_fields():
+            if getattr(field, 'auto_now', False):
+                values[field.attname] = field.pre_save(instance, False)
+            elif field.value_from_object(instance) != self._snapshot.get(field.attname):
+                values[field.attname] = field.value_from_object(instance)
+
+        updated = instance.__class__._base_manager.using(instance._state.db).filter(
+            pk=instance.pk,
+            **{self.field_name: from_state.name}
+        ).update(**values)
+
+        if not updated:
+            setattr(instance, self.field_name, from_state)
+            raise ConcurrentTransitionError(
+                "Transition '%s' isn't available: %r left state '%s' meanwhile." %
+                (self.transition.name, instance, from_state.name))
+
+    def _log_transition(self, from_state, *args, **kwargs):
+        if kwargs.pop('save', True):
+            with instrumentation.phase(self._measurement, instrumentation.PHASE_SAVE):
+                self._conditional_save(from_state)
+        super(OptimisticImplementationWrapper, self)._log_transition(from_state, *args, save=False, **kwargs)
+
+
+#: (Workflow subclass, instance) built for _SerializedWorkflow, by (name, initial state, states, codes)
+_serialized_workflows = {}
+
+
+def _get_serialized_workflow(name, initial_state, states, state_codes, transition_codes):
+    """Build the Workflow of a _SerializedWorkflow, or reuse an identical one.
+
+    Returns:
+        (Workflow subclass, Workflow) tuple
+    """
+    key = (
+        name,
+        initial_state,
+        tuple(states),
+        None if state_codes is None else tuple(sorted(state_codes.items())),
+        None if transition_codes is None else tuple(sorted(transition_codes.items())),
+    )
+    try:
+        return _serialized_workflows[key]
+    except KeyError:
+        pass
+
+    # Create a new django_xworkflows.models.Workflow subclass,
+    # using the provided fields.
+    workflow_class = WorkflowMeta(
+        # When constructing from django.db.migrations, we might get a unicode instead of a str for the name;
+        # this breaks calls to super()
+        str(name),
+        (Workflow,),
+        {
+            'states': [(st, st) for st in states],
+            'initial_state': initial_state,
+            'state_codes': state_codes,
+            'transition_codes': transition_codes,
+        },
+    )
+    _serialized_workflows[key] = workflow_class, workflow_class()
+    return _serialized_workflows[key]
 
 
 @deconstructible
@@ -309,45 +1190,80 @@ class _SerializedWorkflow(object):
 
     This class makes it easy to retrieve a Workflow object from its class name,
     initial state and list of states; without going through a class declaration.
+
+    The Workflow is only built on first attribute access: migrations deconstruct
+    fields far more often than they use their workflow. Identical serialized
+    workflows share the same Workflow.
     """
-    def __init__(self, name, initial_state, states):
+    def __init__(self, name, initial_state, states, state_codes=None, transition_codes=None):
         self._name = name
         self._initial_state = initial_state
         self._states = states
+        self._state_codes = state_codes
+        self._transition_codes = transition_codes
+        self._workflow_class = None
+        self._workflow = None
 
-        # Create a new django_xworkflows.models.Workflow subclass,
-        # using the provided fields.
-        workflow_class = base.WorkflowMeta(
-            # When constructing from django.db.migrations, we might get a unicode instead of a str for the name;
-            # this breaks calls to super()
-            str(self._name),
-            (Workflow,),
-            {
-                'states': [(st, st) for st in states],
-                'initial_state': initial_state,
-            },
-        )
-        self._workflow_class = workflow_class
-        self._workflow = workflow_class()
+    def _get_workflow(self):
+        if self._workflow is None:
+            self._workflow_class, self._workflow = _get_serialized_workflow(
+                self._name, self._initial_state, self._states, self._state_codes, self._transition_codes)
+        return self._workflow
 
     def __getattr__(self, attr):
+        if attr.startswith('__') or attr in ('_workflow', '_workflow_class'):
+            # Not set up yet, e.g while copying.
+            raise AttributeError(attr)
         # Forward calls to the created Workflow object.
-        return getattr(self._workflow, attr)
+        return getattr(self._get_workflow(), attr)
 
     def deconstruct(self):
         """Serialization for migrations; simply return our __init__ arguments."""
+        kwargs = {
+            'name': self._name,
+            'initial_state': self._initial_state,
+            'states': self._states,
+        }
+        if self._state_codes is not None:
+            kwargs['state_codes'] = self._state_codes
+        if self._transition_codes is not None:
+            kwargs['transition_codes'] = self._transition_codes
         return (
             'django_xworkflows.models._SerializedWorkflow',
             (),
-            {
-                'name': self._name,
-                'initial_state': self._initial_state,
-                'states': self._states,
-            },
+            kwargs,
         )
 
 
-class Workflow(base.Workflow):
+class WorkflowMeta(base.WorkflowMeta):
+    """Metaclass for Workflow: indexes transitions once states and transitions are set up.
+
+    The indexes are read-only mappings of tuples:
+    - transitions_from: state name => transitions leaving that state
+    - transitions_into: state name => transitions reaching that state
+    - transitions_by_name: transition name => transition
+    """
+
+    def __new__(mcs, name, bases, attrs):
+        new_class = super(WorkflowMeta, mcs).__new__(mcs, name, bases, attrs)
+
+        transitions_from = {state.name: [] for state in new_class.states}
+        transitions_into = {state.name: [] for state in new_class.states}
+        for transition in new_class.transitions:
+            for source in transition.source:
+                transitions_from[source.name].append(transition)
+            transitions_into[transition.target.name].append(transition)
+
+        new_class.transitions_from = types.MappingProxyType(
+            {state: tuple(transitions) for state, transitions in transitions_from.items()})
+        new_class.transitions_into = types.MappingProxyType(
+            {state: tuple(transitions) for state, transitions in transitions_into.items()})
+        new_class.transitions_by_name = types.MappingProxyType(
+            {transition.name: transition for transition in new_class.transitions})
+        return new_class
+
+
+class Workflow(base.Workflow, metaclass=WorkflowMeta):
     """Extended workflow that handles object saving and logging to the database.
 
     Attributes:
@@ -355,6 +1271,22 @@ class Workflow(base.Workflow):
             database will be disabled.
         log_model_class (obj): the class for the log model; resolved once django
             is completely loaded.
+        log_flush_policy (str): when to write logs to the database, either
+            LOG_FLUSH_IMMEDIATE, LOG_FLUSH_ON_COMMIT or LOG_FLUSH_BACKGROUND.
+        log_buffer_size (int): with LOG_FLUSH_ON_COMMIT, the number of pending
+            logs that triggers an early write.
+        log_backend (log_backends.BaseLogBackend): the backend writing logs;
+            overrides log_flush_policy and log_buffer_size.
+        lock_options (dict): for LockingImplementationWrapper, maps transition
+            names to select_for_update() options, or None to skip locking.
+        state_codes (dict): for CodedStateField and CodedTransitionLog, maps
+            state names to stable integer codes
+        transition_codes (dict): for CodedTransitionLog, maps transition
+            names to stable integer codes
+        metrics_collector (instrumentation.BaseCollector): receives the
+            timings and query counts of each transition, by phase.
+        defer_post_transition (bool): whether to send the post_transition
+            signal once the current database transaction commits.
     """
     #: Behave properly in Django templates
     implementation_class = DjangoImplementationWrapper
@@ -365,6 +1297,30 @@ class Workflow(base.Workflow):
     #: Save log to this django model (actual class)
     log_model_class = None
 
+    #: When to write transition logs to the database
+    log_flush_policy = LOG_FLUSH_IMMEDIATE
+
+    #: Write buffered transition logs once that many are pending
+    log_buffer_size = 100
+
+    #: Write transition logs through this backend
+    log_backend = None
+
+    #: select_for_update() options of each transition, for LockingImplementationWrapper
+    lock_options = {}
+
+    #: Integer code of each state, for CodedStateField and CodedTransitionLog
+    state_codes = None
+
+    #: Integer code of each transition, for CodedTransitionLog
+    transition_codes = None
+
+    #: Record transition metrics with this collector
+    metrics_collector = None
+
+    #: Send post_transition when the current database transaction commits
+    defer_post_transition = False
+
     def __init__(self, *args, **kwargs):
         # Fetch 'log_model' if overridden.
         log_model = kwargs.pop('log_model', self.log_model)
@@ -377,6 +1333,46 @@ class Workflow(base.Workflow):
         self.log_model = log_model
         self.log_model_class = log_model_class
 
+    def available_transitions(self, state):
+        """Retrieve the transitions leaving a state, from the precomputed index.
+
+        Args:
+            state (str, State or StateWrapper): the state
+
+        Returns:
+            Transition tuple: the transitions, in declaration order.
+        """
+        return self.transitions_from.get(getattr(state, 'name', state), ())
+
+    def send_transition_signal(self, signal, instance, field_name, transition, from_state, **kwargs):
+        """Send a signal from django_xworkflows.signals, if it has receivers.
+
+        Args:
+            signal (Signal): the signal
+            instance (WorkflowEnabled): the modified object, whose model is the sender
+            field_name (str): the name of the object's StateField
+            transition (Transition): the transition
+            from_state (StateWrapper): the state before the transition
+        """
+        sender = instance.__class__
+        # Nothing to build when nobody listens: transitions stay as fast as without signals.
+        if not signal.has_listeners(sender):
+            return
+
+        send = functools.partial(
+            signal.send, sender,
+            instance=instance,
+            field_name=field_name,
+            transition=transition,
+            from_state=from_state,
+            to_state=transition.target,
+            **kwargs
+        )
+        if signal is signals.post_transition and self.defer_post_transition:
+            transaction.on_commit(send, using=router.db_for_write(sender, instance=instance))
+        else:
+            send()
+
     def _get_log_model_class(self):
         """Cache for fetching the actual log model object once django is loaded.
 
@@ -390,21 +1386,51 @@ class Workflow(base.Workflow):
         self.log_model_class = apps.get_model(app_label, model_label)
         return self.log_model_class
 
+    def get_log_backend(self):
+        """Retrieve the backend for writing transition logs to the database."""
+        if self.log_backend is not None:
+            return self.log_backend
+        elif self.log_flush_policy == LOG_FLUSH_ON_COMMIT:
+            return log_backends.OnCommitLogBackend(self.log_buffer_size)
+        elif self.log_flush_policy == LOG_FLUSH_BACKGROUND:
+            return _BACKGROUND_LOG_BACKEND
+        else:
+            return _SYNC_LOG_BACKEND
+
+    def _log_kwargs(self, model_class, transition, from_state, instance, **kwargs):
+        """Prepare the keyword arguments for a log_transition() call."""
+        extras = {}
+        for db_field, transition_arg, default in model_class.EXTRA_LOG_ATTRIBUTES:
+            extras[db_field] = kwargs.get(transition_arg, default)
+
+        return dict(
+            modified_object=instance,
+            transition=transition.name,
+            from_state=from_state.name,
+            to_state=transition.target.name,
+            **extras)
+
     def db_log(self, transition, from_state, instance, *args, **kwargs):
         """Logs the transition into the database."""
         if self.log_model:
             model_class = self._get_log_model_class()
+            return self.get_log_backend().write(
+                model_class, self._log_kwargs(model_class, transition, from_state, instance, **kwargs))
 
-            extras = {}
-            for db_field, transition_arg, default in model_class.EXTRA_LOG_ATTRIBUTES:
-                extras[db_field] = kwargs.get(transition_arg, default)
+    def bulk_db_log(self, transition, changes, *args, **kwargs):
+        """Logs a transition performed on several objects into the database.
 
-            return model_class.log_transition(
-                modified_object=instance,
-                transition=transition.name,
-                from_state=from_state.name,
-                to_state=transition.target.name,
-                **extras)
+        Args:
+            transition (Transition): the performed transition
+            changes ((State, WorkflowEnabled) list): the source state and
+                modified instance of each object
+        """
+        if self.log_model and changes:
+            model_class = self._get_log_model_class()
+            return self.get_log_backend().write_many(model_class, [
+                self._log_kwargs(model_class, transition, from_state, instance, **kwargs)
+                for from_state, instance in changes
+            ])
 
     def log_transition(self, transition, from_state, instance, *args, **kwargs):
         """Generic transition logging."""
@@ -412,10 +1438,45 @@ class Workflow(base.Workflow):
         log = kwargs.pop('log', True)
         super(Workflow, self).log_transition(
             transition, from_state, instance, *args, **kwargs)
+        measurement = None
+        if self.metrics_collector is not None:
+            measurement = instrumentation.current_measurement()
+            if measurement is not None and measurement.instance is not instance:
+                # Called outside of this object's transition, e.g from bulk_transition()
+                measurement = None
         if save:
-            instance.save()
+            with instrumentation.phase(measurement, instrumentation.PHASE_SAVE):
+                instance.save()
         if log:
-            self.db_log(transition, from_state, instance, *args, **kwargs)
+            with instrumentation.phase(measurement, instrumentation.PHASE_LOG):
+                self.db_log(transition, from_state, instance, *args, **kwargs)
+
+
+#: ContentType ids, by (database alias, model class)
+_content_type_ids = {}
+
+
+def _get_content_type_id(instance):
+    """Retrieve the ContentType id of an object's model, once per database and model.
+
+    Unlike ContentType.objects.get_for_model(), this skips the ContentType
+    instances and model options lookups.
+    """
+    key = (instance._state.db, instance.__class__)
+    try:
+        return _content_type_ids[key]
+    except KeyError:
+        content_type = ct_models.ContentType.objects.db_manager(instance._state.db).get_for_model(instance.__class__)
+        _content_type_ids[key] = content_type.pk
+        return content_type.pk
+
+
+def _clear_content_type_ids(**kwargs):
+    """ContentType rows may have been recreated, e.g by a database flush."""
+    _content_type_ids.clear()
+
+
+models.signals.post_migrate.connect(_clear_content_type_ids)
 
 
 class BaseTransitionLog(models.Model):
@@ -424,6 +1485,8 @@ class BaseTransitionLog(models.Model):
     Class attributes:
         MODIFIED_OBJECT_FIELD (str): name of the field storing the modified
             object.
+        INDEX_PROFILE (str): the indexes of the table, one of LOG_INDEXES_COLUMNS
+            (the default), LOG_INDEXES_COMPOSITE or LOG_INDEXES_ALL.
         EXTRA_LOG_ATTRIBUTES ((db_field, kwarg, default) list): Describes extra
             transition kwargs to store:
             - db_field is the name of the attribute where data should be stored
@@ -442,6 +1505,7 @@ class BaseTransitionLog(models.Model):
     """
     MODIFIED_OBJECT_FIELD = ''
     EXTRA_LOG_ATTRIBUTES = ()
+    INDEX_PROFILE = LOG_INDEXES_COLUMNS
 
     transition = models.CharField(_("transition"), max_length=255, db_index=True)
     from_state = models.CharField(_("from state"), max_length=255, db_index=True)
@@ -460,14 +1524,98 @@ class BaseTransitionLog(models.Model):
         return None
 
     @classmethod
-    def log_transition(cls, transition, from_state, to_state, modified_object, **kwargs):
+    def _get_object_fields(cls, modified_object):
+        """Retrieve the field values pointing a log row to its object."""
+        return {cls.MODIFIED_OBJECT_FIELD: modified_object}
+
+    @classmethod
+    def _get_object_field_names(cls):
+        """Names of the fields pointing a log row to its object."""
+        return (cls.MODIFIED_OBJECT_FIELD,)
+
+    @classmethod
+    def _get_object_key(cls):
+        """Name of the log attribute holding the primary key of its object."""
+        return cls._meta.get_field(cls.MODIFIED_OBJECT_FIELD).attname
+
+    @classmethod
+    def _get_model_logs(cls, model, queryset=None):
+        """The logs of the objects of a given model, among queryset (or all logs)."""
+        return (cls._default_manager if queryset is None else queryset).all()
+
+    @classmethod
+    def _get_composite_indexes(cls):
+        return [
+            # History of an object
+            models.Index(fields=list(cls._get_object_field_names()) + ['timestamp']),
+            # Transitions of a kind over a period
+            models.Index(fields=['transition', 'timestamp']),
+        ]
+
+    @classmethod
+    def _apply_index_profile(cls):
+        """Adjust the indexes of a concrete log model to its INDEX_PROFILE."""
+        if cls.INDEX_PROFILE not in (LOG_INDEXES_COLUMNS, LOG_INDEXES_COMPOSITE, LOG_INDEXES_ALL):
+            raise exceptions.ImproperlyConfigured(
+                "Invalid INDEX_PROFILE %r for %s." % (cls.INDEX_PROFILE, cls.__name__))
+
+        if cls.INDEX_PROFILE == LOG_INDEXES_COLUMNS:
+            return
+
+        if cls._meta.proxy or cls._meta.parents:
+            # Proxy and multi-table inheritance children share their parent's
+            # columns, which the parent already indexed.
+            return
+
+        indexes = cls._get_composite_indexes()
+        if cls.INDEX_PROFILE == LOG_INDEXES_COMPOSITE:
+            # Composite indexes also serve lookups on their leading columns;
+            # the object fields are always looked up together.
+            object_fields = list(cls._get_object_field_names())
+            names = set()
+            for index in indexes:
+                names.add(index.fields[0])
+                if index.fields[:len(object_fields)] == object_fields:
+                    names.update(object_fields)
+            for field in cls._meta.local_fields:
+                if field.name in names:
+                    field.db_index = False
+
+        for index in indexes:
+            index.set_name_with_model(cls)
+            cls._meta.indexes.append(index)
+        # Migrations only serialize explicitly declared Meta options.
+        cls._meta.original_attrs['indexes'] = cls._meta.indexes
+
+    @classmethod
+    def build_log(cls, transition, from_state, to_state, modified_object, **kwargs):
+        """Prepare an unsaved log entry."""
         kwargs.update({
             'transition': transition,
             'from_state': from_state,
             'to_state': to_state,
-            cls.MODIFIED_OBJECT_FIELD: modified_object,
         })
-        return cls.objects.create(**kwargs)
+        kwargs.update(cls._get_object_fields(modified_object))
+        return cls(**kwargs)
+
+    @classmethod
+    def log_transition(cls, transition, from_state, to_state, modified_object, **kwargs):
+        log = cls.build_log(transition, from_state, to_state, modified_object, **kwargs)
+        log.save(force_insert=True)
+        return log
+
+    @classmethod
+    def log_transitions(cls, logs):
+        """Save several log entries at once.
+
+        Entries are inserted with bulk_create(): save() is not called, and
+        no pre_save/post_save signal is sent.
+
+        Args:
+            logs (dict list): the keyword arguments of a log_transition() call,
+                for each entry.
+        """
+        return cls.objects.bulk_create([cls.build_log(**log) for log in logs])
 
     def __str__(self):
         return "%r: %s -> %s at %s" % (
@@ -478,7 +1626,34 @@ class BaseTransitionLog(models.Model):
         )
 
 
-class GenericTransitionLog(BaseTransitionLog):
+class _GenericLogMixin(object):
+    """Point log rows to their object through content_type and content_id.
+
+    Shared by GenericTransitionLog and GenericLastTransitionLog.
+    """
+
+    @classmethod
+    def _get_object_fields(cls, modified_object):
+        return {
+            'content_type_id': _get_content_type_id(modified_object),
+            'content_id': modified_object.pk,
+        }
+
+    @classmethod
+    def _get_object_field_names(cls):
+        return ('content_type', 'content_id')
+
+    @classmethod
+    def _get_object_key(cls):
+        return 'content_id'
+
+    @classmethod
+    def _get_model_logs(cls, model, queryset=None):
+        content_type = ct_models.ContentType.objects.db_manager(router.db_for_read(cls)).get_for_model(model)
+        return (cls._default_manager if queryset is None else queryset).filter(content_type=content_type)
+
+
+class GenericTransitionLog(_GenericLogMixin, BaseTransitionLog):
     """Abstract model for a minimal database logging setup.
 
     Specializes BaseTransitionLog to use a GenericForeignKey.
@@ -505,17 +1680,161 @@ class GenericTransitionLog(BaseTransitionLog):
         verbose_name_plural = _('XWorkflow transition logs')
         abstract = True
 
+    @classmethod
+    def build_log(cls, transition, from_state, to_state, modified_object, **kwargs):
+        log = super(GenericTransitionLog, cls).build_log(transition, from_state, to_state, modified_object, **kwargs)
+        # Reading the object back from the log shouldn't fetch it again.
+        cls._meta.get_field('modified_object').set_cached_value(log, modified_object)
+        return log
+
+
+class CodedTransitionLog(BaseTransitionLog):
+    """Abstract log model storing transitions and states as small integer codes.
+
+    Codes come from the transition_codes and state_codes of WORKFLOW; such
+    a log model thus logs transitions of a single workflow.
+
+    Class attributes:
+        WORKFLOW (Workflow subclass): the workflow whose codes are stored.
+    """
+    WORKFLOW = None
+
+    transition = models.PositiveSmallIntegerField(_("transition"), db_index=True)
+    from_state = models.PositiveSmallIntegerField(_("from state"), db_index=True)
+    to_state = models.PositiveSmallIntegerField(_("to state"), db_index=True)
+
+    class Meta:
+        verbose_name = _('XWorkflow transition log')
+        verbose_name_plural = _('XWorkflow transition logs')
+        abstract = True
+
+    @classmethod
+    def _get_codes(cls):
+        """Retrieve the checked transition and state codes of WORKFLOW.
+
+        Returns:
+            (dict, dict): the transition and state codes
+        """
+        codes = cls.__dict__.get('_codes')
+        if codes is None:
+            workflow = cls.WORKFLOW
+            if workflow is None:
+                raise exceptions.ImproperlyConfigured("%s.WORKFLOW isn't set." % cls.__name__)
+            codes = (
+                _check_codes(workflow, 'transition_codes', [transition.name for transition in workflow.transitions]),
+                _check_codes(workflow, 'state_codes', [state.name for state in workflow.states]),
+            )
+            cls._codes = codes
+        return codes
+
+    @classmethod
+    def build_log(cls, transition, from_state, to_state, modified_object, **kwargs):
+        transition_codes, state_codes = cls._get_codes()
+        return super(CodedTransitionLog, cls).build_log(
+            transition_codes[transition],
+            state_codes[from_state],
+            state_codes[to_state],
+            modified_object,
+            **kwargs
+        )
+
+    @classmethod
+    def _decode(cls, codes, code):
+        """Retrieve the name of a state or transition code."""
+        for name, value in codes.items():
+            if value == code:
+                return name
+        return code
+
+    @property
+    def transition_name(self):
+        return self._decode(self._get_codes()[0], self.transition)
+
+    @property
+    def from_state_name(self):
+        return self._decode(self._get_codes()[1], self.from_state)
+
+    @property
+    def to_state_name(self):
+        return self._decode(self._get_codes()[1], self.to_state)
+
+    def __str__(self):
+        return "%r: %s -> %s at %s" % (
+            self.get_modified_object(),
+            self.from_state_name,
+            self.to_state_name,
+            self.timestamp.isoformat(),
+        )
+
 
 class BaseLastTransitionLog(BaseTransitionLog):
-    """Alternate abstract model holding only the latest transition."""
+    """Alternate abstract model holding only the latest transition.
+
+    Class attributes:
+        UPSERT (bool): whether to write rows with a single INSERT ... ON
+            CONFLICT query, where supported, instead of get_or_create() and
+            save(). Such writes send no pre_save/post_save signals.
+    """
+    UPSERT = False
 
     class Meta:
         verbose_name = _('XWorkflow last transition log')
         verbose_name_plural = _('XWorkflow last transition logs')
         abstract = True
 
+    @classmethod
+    def _get_composite_indexes(cls):
+        # Objects have a single row, already found through their unique constraint.
+        return [models.Index(fields=['transition', 'timestamp'])]
+
+    @classmethod
+    def _get_upsert_options(cls, unique_fields, update_fields):
+        """Prepare bulk_create() options for a single-query upsert.
+
+        Returns None unless UPSERT is set, the database supports INSERT ...
+        ON CONFLICT (Django>=4.1), and unique_fields are covered by a unique
+        constraint.
+
+        Options are computed once per database and set of fields.
+        """
+        if not cls.UPSERT:
+            return None
+
+        using = router.db_for_write(cls)
+        key = (using, tuple(unique_fields), tuple(update_fields))
+        cache = cls.__dict__.get('_upsert_options')
+        if cache is None:
+            cache = cls._upsert_options = {}
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+
+        options = None
+        features = connections[using].features
+        # Accept attnames, e.g content_type_id
+        unique_names = {cls._meta.get_field(name).name for name in unique_fields}
+        unique_sets = [{field.name} for field in cls._meta.concrete_fields if field.unique and not field.primary_key]
+        unique_sets += [set(fields) for fields in cls._meta.unique_together]
+        unique_sets += [set(constraint.fields) for constraint in cls._meta.total_unique_constraints]
+        if getattr(features, 'supports_update_conflicts', False) and unique_names in unique_sets:
+            options = {
+                'update_conflicts': True,
+                'update_fields': sorted(set(update_fields) | {'timestamp'}),
+            }
+            if features.supports_update_conflicts_with_target:
+                options['unique_fields'] = sorted(unique_names)
+        cache[key] = options
+        return options
+
     @classmethod
     def _update_or_create(cls, unique_fields, **kwargs):
+        upsert_options = cls._get_upsert_options(unique_fields, kwargs)
+        if upsert_options is not None:
+            last_transition = cls(**dict(kwargs, **unique_fields))
+            cls.objects.bulk_create([last_transition], **upsert_options)
+            return last_transition
+
         last_transition, created = cls.objects.get_or_create(defaults=kwargs, **unique_fields)
         if not created:
             for field, value in kwargs.items():
@@ -533,14 +1852,35 @@ class BaseLastTransitionLog(BaseTransitionLog):
             'to_state': to_state,
         })
 
-        non_defaults = {
-            cls.MODIFIED_OBJECT_FIELD: modified_object,
-        }
+        return cls._update_or_create(cls._get_object_fields(modified_object), **kwargs)
 
-        return cls._update_or_create(non_defaults, **kwargs)
+    @classmethod
+    def log_transitions(cls, logs):
+        # Only keep the latest log of each object: an upsert may not update
+        # the same row twice.
+        rows = {}
+        for log in logs:
+            kwargs = dict(log)
+            unique_fields = cls._get_object_fields(kwargs.pop('modified_object'))
+            key = tuple(sorted((name, getattr(value, 'pk', value)) for name, value in unique_fields.items()))
+            rows.pop(key, None)
+            rows[key] = (unique_fields, kwargs)
+
+        if not rows:
+            return []
+
+        unique_fields, kwargs = next(iter(rows.values()))
+        upsert_options = cls._get_upsert_options(unique_fields, kwargs)
+        if upsert_options is None or any(row[1].keys() != kwargs.keys() for row in rows.values()):
+            return [cls._update_or_create(unique_fields, **kwargs) for unique_fields, kwargs in rows.values()]
+
+        return cls.objects.bulk_create(
+            [cls(**dict(kwargs, **unique_fields)) for unique_fields, kwargs in rows.values()],
+            **upsert_options
+        )
 
 
-class GenericLastTransitionLog(BaseLastTransitionLog):
+class GenericLastTransitionLog(_GenericLogMixin, BaseLastTransitionLog):
     """Abstract model for a minimal database logging setup.
 
     Specializes BaseLastTransitionLog to use a GenericForeignKey.
@@ -568,13 +1908,11 @@ class GenericLastTransitionLog(BaseLastTransitionLog):
         abstract = True
         unique_together = ('content_type', 'content_id')
 
-    @classmethod
-    def _update_or_create(cls, unique_fields, **kwargs):
-        modified_object = unique_fields.pop(cls.MODIFIED_OBJECT_FIELD)
-        content_type = ct_models.ContentType.objects.get_for_model(modified_object.__class__)
-        content_id = modified_object.id
 
-        unique_fields['content_type'] = content_type
-        unique_fields['content_id'] = content_id
+def _apply_log_index_profile(sender, **kwargs):
+    """Apply INDEX_PROFILE once a concrete log model has all its fields."""
+    if issubclass(sender, BaseTransitionLog) and not sender._meta.abstract:
+        sender._apply_index_profile()
+
 
-        return super(GenericLastTransitionLog, cls)._update_or_create(unique_fields, **kwargs)
+models.signals.class_prepared.connect(_apply_log_index_profile)
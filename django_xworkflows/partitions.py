@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2011-2020 Raphaël Barrois
+# This code is distributed under the two-clause BSD license.
+
+"""Monthly partitions of transition log tables, on PostgreSQL.
+
+A transition log table may be declared as ``PARTITION BY RANGE (timestamp)``
+(PostgreSQL 10+); these helpers list, create and remove its partitions, so
+that old logs are dropped a whole partition at a time.
+"""
+
+import collections
+import datetime
+import re
+
+from django.db import connections
+from django.db import router
+from django.db.backends import utils as backend_utils
+from django.utils import dateparse
+from django.utils import timezone
+
+
+#: A partition of a log table, holding logs with lower <= timestamp < upper.
+#: Bounds are None for MINVALUE / MAXVALUE, and both None for a DEFAULT partition.
+Partition = collections.namedtuple('Partition', ['name', 'lower', 'upper'])
+
+_RANGE_BOUNDS_RE = re.compile(r"^FOR VALUES FROM \((.+)\) TO \((.+)\)$")
+
+
+def month_start(value):
+    """The start of the month holding a datetime."""
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def monthly_ranges(start, count):
+    """The (lower, upper) bounds of `count` months, from the month holding `start`."""
+    lower = month_start(start)
+    ranges = []
+    for _i in range(count):
+        upper = (lower + datetime.timedelta(days=32)).replace(day=1)
+        ranges.append((lower, upper))
+        lower = upper
+    return ranges
+
+
+def _parse_bound(value):
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    bound = dateparse.parse_datetime(value.strip("'"))
+    if bound is None:
+        raise ValueError("Unsupported partition bound %s." % value)
+    return bound
+
+
+def parse_partition_bounds(expression):
+    """Parse the pg_get_expr() of a partition bound into (lower, upper)."""
+    if expression == 'DEFAULT':
+        return None, None
+    match = _RANGE_BOUNDS_RE.match(expression)
+    if not match:
+        raise ValueError("Unsupported partition bounds %s." % expression)
+    return _parse_bound(match.group(1)), _parse_bound(match.group(2))
+
+
+def supports_partitions(connection):
+    return connection.vendor == 'postgresql' and connection.pg_version >= 100000
+
+
+def _get_connection(model, using):
+    return connections[using or router.db_for_write(model)]
+
+
+def is_partitioned(model, using=None):
+    """Whether the table of a model is a partitioned table."""
+    connection = _get_connection(model, using)
+    if not supports_partitions(connection):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            [connection.ops.quote_name(model._meta.db_table)],
+        )
+        return cursor.fetchone() is not None
+
+
+def get_partitions(model, using=None):
+    """List the partitions of a model's table, by increasing bounds.
+
+    Returns:
+        Partition list: empty for tables which aren't partitioned.
+    """
+    connection = _get_connection(model, using)
+    if not supports_partitions(connection):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+            "FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(%s)",
+            [connection.ops.quote_name(model._meta.db_table)],
+        )
+        rows = cursor.fetchall()
+
+    partitions = [Partition(name, *parse_partition_bounds(bounds)) for name, bounds in rows]
+    # DEFAULT and MINVALUE partitions first
+    return sorted(partitions, key=lambda partition: (partition.lower is not None, partition.lower or 0))
+
+
+def get_partition_name(model, lower, using=None):
+    """The name of the monthly partition starting at `lower`."""
+    connection = _get_connection(model, using)
+    name = '%s_%04d%02d' % (model._meta.db_table, lower.year, lower.month)
+    return backend_utils.truncate_name(name, connection.ops.max_name_length())
+
+
+def create_monthly_partitions(model, start, count, using=None):
+    """Create the missing monthly partitions of a model's table.
+
+    Returns:
+        str list: the names of the created partitions.
+    """
+    connection = _get_connection(model, using)
+    existing = {partition.lower for partition in get_partitions(model, using=using)}
+    created = []
+    with connection.cursor() as cursor:
+        for lower, upper in monthly_ranges(start, count):
+            if lower in existing:
+                continue
+            name = get_partition_name(model, lower, using=using)
+            # Bounds are formatted by us, from datetimes: DDL statements take no parameters.
+            cursor.execute("CREATE TABLE %s PARTITION OF %s FOR VALUES FROM ('%s') TO ('%s')" % (
+                connection.ops.quote_name(name),
+                connection.ops.quote_name(model._meta.db_table),
+                lower.isoformat(),
+                upper.isoformat(),
+            ))
+            created.append(name)
+    return created
+
+
+def _as_aware(value):
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+def get_expired_partitions(model, before, using=None):
+    """The partitions only holding logs older than `before`."""
+    return [
+        partition for partition in get_partitions(model, using=using)
+        if partition.upper is not None and _as_aware(partition.upper) <= _as_aware(before)
+    ]
+
+
+def remove_partition(model, partition, archive=False, using=None):
+    """Detach a partition from a model's table, and drop it unless archiving.
+
+    An archived partition is kept as a standalone table, with the same name.
+    """
+    connection = _get_connection(model, using)
+    with connection.cursor() as cursor:
+        cursor.execute("ALTER TABLE %s DETACH PARTITION %s" % (
+            connection.ops.quote_name(model._meta.db_table),
+            connection.ops.quote_name(partition.name),
+        ))
+        if not archive:
+            cursor.execute("DROP TABLE %s" % connection.ops.quote_name(partition.name))
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2011-2020 Raphaël Barrois
+# This code is distributed under the two-clause BSD license.
+
+"""Signals sent by the transitions of django_xworkflows workflows.
+
+They are sent with the modified object's model class as sender, and these arguments:
+- instance: the modified object
+- field_name: the name of the object's StateField
+- transition: the Transition
+- from_state: the object's state before the transition
+- to_state: the transition's target State
+
+post_transition also receives the implementation's `result`, and
+transition_failed the raised `exception`.
+
+Like Django's model signals, they cache receivers by sender: transitions of
+models without receivers only pay for a dictionary lookup.
+"""
+
+from django.dispatch import Signal
+
+
+#: Sent before the 'before' hooks, once the transition's checks passed.
+pre_transition = Signal(use_caching=True)
+
+#: Sent after the 'after' hooks; see Workflow.defer_post_transition.
+post_transition = Signal(use_caching=True)
+
+#: Sent when a transition raises an exception, after its transaction was rolled back.
+transition_failed = Signal(use_caching=True)
@@ -2,19 +2,111 @@
 # Copyright (c) 2011-2020 Raphaël Barrois
 # This code is distributed under the two-clause BSD license.
 
+import json
+
 from . import models
 
+from django.apps import apps
 from django.contrib import admin
+from django.contrib.contenttypes import models as ct_models
+from django.core import paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+
+class EstimatedCountPaginator(paginator.Paginator):
+    """Paginator using the planner's row estimate for large PostgreSQL querysets.
+
+    Counting millions of rows reads them all; estimates are only used above
+    `exact_count_threshold` rows, smaller results are counted exactly.
+    """
+    exact_count_threshold = 10000
+
+    def _estimate_count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    @cached_property
+    def count(self):
+        estimate = self._estimate_count()
+        if estimate is not None and estimate > self.exact_count_threshold:
+            return estimate
+        return self.object_list.count()
+
+
+def _get_logged_workflows():
+    """The (model, workflow) pairs of state fields logging to TransitionLog."""
+    for model in apps.get_models():
+        for state_field in getattr(model, '_workflows', {}).values():
+            workflow = state_field.workflow
+            if (workflow.log_model_class or workflow.log_model) and \
+                    workflow._get_log_model_class() is models.TransitionLog:
+                yield model, workflow
+
+
+class WorkflowModelListFilter(admin.SimpleListFilter):
+    """Filter on the models of logged workflows, instead of all content types."""
+    title = _("Content type")
+    parameter_name = 'content_type'
+
+    def lookups(self, request, model_admin):
+        logged_models = {model for model, _workflow in _get_logged_workflows()}
+        content_types = ct_models.ContentType.objects.get_for_models(*logged_models)
+        return sorted(
+            ((content_type.pk, model._meta.verbose_name) for model, content_type in content_types.items()),
+            key=lambda choice: str(choice[1]),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(content_type_id=self.value())
+        return queryset
+
+
+class TransitionListFilter(admin.SimpleListFilter):
+    """Filter on transitions declared by logged workflows, without a SELECT DISTINCT on logs."""
+    title = _("transition")
+    parameter_name = 'transition'
+
+    def lookups(self, request, model_admin):
+        names = {
+            transition.name
+            for _model, workflow in _get_logged_workflows()
+            for transition in workflow.transitions
+        }
+        return [(name, name) for name in sorted(names)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(transition=self.value())
+        return queryset
 
 
 class TransitionLogAdmin(admin.ModelAdmin):
     actions = None
-    date_hierarchy = 'timestamp'
     list_display = ('modified_object', 'transition', 'from_state', 'to_state', 'user', 'timestamp',)
-    list_filter = ('content_type', 'transition',)
+    # Unlike date_hierarchy, DateFieldListFilter doesn't aggregate the dates of all logs.
+    list_filter = (WorkflowModelListFilter, TransitionListFilter, ('timestamp', admin.DateFieldListFilter),)
+    list_select_related = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     readonly_fields = ('user', 'modified_object', 'transition', 'timestamp',)
     search_fields = ('transition', 'user__username',)
 
+    def get_queryset(self, request):
+        # Fetch the modified objects of a page with one query per content type.
+        return super(TransitionLogAdmin, self).get_queryset(request).prefetch_related('modified_object')
+
     def has_add_permission(self, request):
         return False
 
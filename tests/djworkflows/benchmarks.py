@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2011-2020 Raphaël Barrois
+# This code is distributed under the two-clause BSD license.
+
+"""Micro-benchmarks for the django_xworkflows hot paths.
+
+These are not run along with the test suite; use:
+
+    make benchmark
+
+or:
+
+    ./manage.py test tests.djworkflows.benchmarks
+
+Benchmarks run on SQLite; set XWORKFLOWS_PGDATABASE to run them against a
+local PostgreSQL database (see dev/settings.py).
+
+Database operations also report their number of queries; query counts are
+checked by the test suite.
+"""
+
+import collections
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from unittest import mock
+
+from django import test
+from django.core import exceptions
+from django.core import management
+from django.db import connection
+from django.test import utils as test_utils
+
+from xworkflows import base
+
+from django_xworkflows import instrumentation
+from django_xworkflows import models as xwf_models
+from django_xworkflows import signals
+from django_xworkflows.xworkflow_log import models as xwlog_models
+
+from . import models
+
+
+def report(name, seconds, iterations, unit='call', queries=None):
+    """Print the per-unit cost of a benchmarked operation."""
+    line = "\n  %-45s %8.3f µs/%s" % (name, seconds / iterations * 1e6, unit)
+    if queries is not None:
+        line += "  %6.2f queries/%s" % (queries, unit)
+    sys.stderr.write(line)
+
+
+def count_queries(func):
+    """Count the queries performed by a call to `func`."""
+    with test_utils.CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+def bench(name, func, iterations=100000, per=1, unit='call', queries=None):
+    """Time `iterations` calls to `func`, keeping the best of 3 runs.
+
+    Each call is expected to process `per` units (rows, ...), with `queries`
+    database queries.
+    """
+    best = min(timeit.repeat(func, number=iterations, repeat=3))
+    report(name, best, iterations * per, unit=unit, queries=None if queries is None else queries / per)
+    return best
+
+
+def bench_queries(name, func, iterations=1000, per=1, unit='call'):
+    """Time a database operation, reporting its number of queries."""
+    return bench(name, func, iterations=iterations, per=per, unit=unit, queries=count_queries(func))
+
+
+class StateFieldBenchmark(test.SimpleTestCase):
+    """Per-row cost of the StateField conversions."""
+
+    def setUp(self):
+        self.field = models.MyWorkflowEnabled._meta.get_field('state')
+        self.workflow = self.field.workflow
+
+    def legacy_to_python(self, value):
+        """The StateField.to_python behaviour before states were interned."""
+        try:
+            state = self.workflow.states[value]
+        except KeyError:
+            raise exceptions.ValidationError("invalid")
+        res = base.StateWrapper(state, self.workflow)
+        if res.state not in self.workflow.states:
+            raise exceptions.ValidationError("invalid")
+        return res
+
+    def test_to_python(self):
+        legacy = bench("to_python (fresh StateWrapper)", lambda: self.legacy_to_python('bar'))
+        interned = bench("to_python (interned StateWrapper)", lambda: self.field.to_python('bar'))
+        self.assertLess(interned, legacy)
+
+    def test_from_db_value(self):
+        # Strict fields convert values as they are loaded; others, as they are assigned.
+        strict_field = xwf_models.StateField(models.MyWorkflow, strict=True)
+        bench("from_db_value (strict)", lambda: strict_field.from_db_value('bar', None, None))
+        obj = models.MyWorkflowEnabled()
+        bench("StateFieldProperty.__set__ (non-strict)", lambda: setattr(obj, 'state', 'bar'))
+
+    def test_get_db_prep_value(self):
+        state = self.field.to_python('bar')
+        bench("get_db_prep_value", lambda: self.field.get_db_prep_value(state, connection))
+
+    def test_state_transitions(self):
+        wrapper = self.field.to_python('foo')
+        legacy_wrapper = base.StateWrapper(wrapper.state, self.workflow)
+        legacy = bench("state.transitions() (scan)", lambda: list(legacy_wrapper.transitions()))
+        indexed = bench("state.transitions() (indexed)", lambda: list(wrapper.transitions()))
+        self.assertLess(indexed, legacy)
+
+    def legacy_serialize(self):
+        """_SerializedWorkflow before it built its Workflow lazily."""
+        workflow_class = xwf_models.WorkflowMeta(
+            'MyWorkflow', (xwf_models.Workflow,), {
+                'states': [(st.name, st.name) for st in self.workflow.states],
+                'initial_state': self.workflow.initial_state.name,
+                'state_codes': None,
+            },
+        )
+        return workflow_class()
+
+    def test_deconstruct(self):
+        legacy = bench(
+            "StateField.deconstruct (eager workflow)",
+            lambda: (self.field.deconstruct(), self.legacy_serialize()),
+            iterations=2000,
+        )
+        lazy = bench("StateField.deconstruct (lazy workflow)", self.field.deconstruct, iterations=2000)
+        self.assertLess(lazy, legacy)
+
+    def test_model_init(self):
+        bench(
+            "Model(state=<name>)",
+            lambda: models.MyWorkflowEnabled(state='bar'),
+            iterations=20000,
+        )
+
+
+class HydrationBenchmark(test.TestCase):
+    """Cost of loading WorkflowEnabled instances from the database."""
+
+    ROWS = 1000
+
+    @classmethod
+    def setUpTestData(cls):
+        models.MyWorkflowEnabled.objects.bulk_create(
+            models.MyWorkflowEnabled(state='bar') for _i in range(cls.ROWS)
+        )
+
+    def test_hydration(self):
+        bench_queries(
+            "hydrate %d rows" % self.ROWS,
+            lambda: list(models.MyWorkflowEnabled.objects.all()),
+            iterations=20, per=self.ROWS, unit='row',
+        )
+
+
+class TransitionBenchmark(test.TestCase):
+    """Cost of a single transition, saved and logged."""
+
+    def setUp(self):
+        self.obj = models.MyWorkflowEnabled.objects.create(state='bar')
+        self.workflow = models.MyWorkflowEnabled._workflows['state'].workflow
+        # Don't count the ContentType lookup of the first log.
+        xwlog_models.TransitionLog.build_log('gobaz', 'bar', 'baz', self.obj)
+
+    def cycle(self):
+        # bar -> baz -> bar
+        self.obj.gobaz(1)
+        self.obj.bazbar()
+
+    def test_transition(self):
+        bench_queries("transition (TransitionLog)", self.cycle, per=2)
+
+    def test_transition_without_log(self):
+        with mock.patch.object(self.workflow, 'log_model', ''):
+            bench_queries("transition (no log)", self.cycle, per=2)
+
+    def test_transition_signals(self):
+        workflow, obj = self.workflow, self.obj
+        transition, state = models.MyWorkflow.transitions.bazbar, obj.state
+
+        def send_signals():
+            for signal in (signals.pre_transition, signals.post_transition, signals.transition_failed):
+                workflow.send_transition_signal(signal, obj, 'state', transition, state)
+
+        signals_cost = bench("transition signals (no receiver)", send_signals) / 100000
+        transition_cost = bench("transition (no receiver)", self.cycle, iterations=1000, per=2) / 1000 / 2
+        # Unused signals cost less than a percent of a transition.
+        self.assertLess(signals_cost, transition_cost / 100)
+
+        def receiver(**kwargs):
+            pass
+        signals.post_transition.connect(receiver, sender=models.MyWorkflowEnabled)
+        self.addCleanup(signals.post_transition.disconnect, receiver, sender=models.MyWorkflowEnabled)
+        bench("transition (post_transition receiver)", self.cycle, iterations=1000, per=2)
+
+    def test_transition_instrumented(self):
+        with mock.patch.object(self.workflow, 'metrics_collector', instrumentation.PrometheusCollector()):
+            bench_queries("transition (TransitionLog, instrumented)", self.cycle, per=2)
+
+
+class GenericTransitionLogBenchmark(test.TestCase):
+    """Cost of preparing a GenericTransitionLog row."""
+
+    def test_build_log(self):
+        obj = models.MyWorkflowEnabled.objects.create()
+        xwlog_models.TransitionLog.build_log('foobar', 'foo', 'bar', obj)
+        bench_queries(
+            "GenericTransitionLog.build_log",
+            lambda: xwlog_models.TransitionLog.build_log('foobar', 'foo', 'bar', obj),
+            iterations=20000,
+        )
+
+
+class LogIndexesBenchmark(test.TestCase):
+    """Cost of inserting transition logs, for each index profile."""
+
+    BATCH = 100
+
+    def setUp(self):
+        self.objects = [models.GenericWorkflowEnabled.objects.create() for _i in range(10)]
+        self.logs = [
+            dict(transition=transition, from_state=from_state, to_state=to_state, modified_object=obj)
+            for obj in self.objects
+            for transition, from_state, to_state in (('ab', 'a', 'b'), ('ba', 'b', 'a'))
+        ] * (self.BATCH // (2 * len(self.objects)))
+        # Fetch the ContentType id once
+        models.GenericWorkflowTransitionLog.build_log(**self.logs[0])
+
+    def bench_inserts(self, name, log_model):
+        bench_queries(
+            name,
+            lambda: log_model.log_transitions(self.logs),
+            iterations=100, per=self.BATCH, unit='log',
+        )
+
+    def test_columns(self):
+        self.bench_inserts("log insert (LOG_INDEXES_COLUMNS)", models.GenericWorkflowTransitionLog)
+
+    def test_composite(self):
+        self.bench_inserts("log insert (LOG_INDEXES_COMPOSITE)", models.CompositeIndexedTransitionLog)
+
+    def test_all(self):
+        self.bench_inserts("log insert (LOG_INDEXES_ALL)", models.AllIndexedTransitionLog)
+
+
+class LastTransitionLogBenchmark(test.TestCase):
+    """Cost of updating a BaseLastTransitionLog row."""
+
+    def setUp(self):
+        self.obj = models.SomeWorkflowEnabled.objects.create()
+        models.SomeWorkflowLastTransitionLog.log_transition('ab', 'a', 'b', self.obj)
+
+    def test_update(self):
+        bench_queries(
+            "BaseLastTransitionLog.log_transition",
+            lambda: models.SomeWorkflowLastTransitionLog.log_transition('ab', 'a', 'b', self.obj),
+        )
+
+    def test_upsert(self):
+        with mock.patch.object(models.SomeWorkflowLastTransitionLog, 'UPSERT', True), \
+                mock.patch.object(models.SomeWorkflowLastTransitionLog, '_upsert_options', {}, create=True):
+            bench_queries(
+                "BaseLastTransitionLog.log_transition (UPSERT)",
+                lambda: models.SomeWorkflowLastTransitionLog.log_transition('ab', 'a', 'b', self.obj),
+            )
+
+
+class RebuildTransitionLogBenchmark(test.TestCase):
+    """Cost of rebuild_transitionlog_states on synthetic logs."""
+
+    OBJECTS = 200
+    TRANSITIONS = (
+        ('foobar', 'foo', 'bar'),
+        ('gobaz', 'bar', 'baz'),
+        ('bazbar', 'baz', 'bar'),
+        ('gobaz', 'bar', 'baz'),
+        ('bazbar', 'baz', 'bar'),
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        models.MyWorkflowEnabled.objects.bulk_create(
+            models.MyWorkflowEnabled(state='bar') for _i in range(cls.OBJECTS)
+        )
+        xwlog_models.TransitionLog.log_transitions([
+            dict(transition=transition, from_state='', to_state='', modified_object=obj)
+            for obj in models.MyWorkflowEnabled.objects.all()
+            for transition, _from, _to in cls.TRANSITIONS
+        ])
+
+    def rebuild(self):
+        management.call_command(
+            'rebuild_transitionlog_states', 'djworkflows.MyWorkflowEnabled',
+            verbosity=0, stdout=io.StringIO(), stderr=io.StringIO(),
+        )
+
+    def test_rebuild(self):
+        logs = self.OBJECTS * len(self.TRANSITIONS)
+        timings = []
+        for _i in range(3):
+            xwlog_models.TransitionLog.objects.update(from_state='', to_state='')
+            start = time.perf_counter()
+            queries = count_queries(self.rebuild)
+            timings.append(time.perf_counter() - start)
+        report("rebuild_transitionlog_states", min(timings), logs, unit='log', queries=queries / logs)
+
+        self.assertEqual(
+            set(self.TRANSITIONS),
+            set(xwlog_models.TransitionLog.objects.values_list('transition', 'from_state', 'to_state')),
+        )
+
+
+class StartupBenchmark(test.SimpleTestCase):
+    """Cost of django.setup() for a project with many workflow models, in fresh processes."""
+
+    WORKFLOWS = 20
+    MODELS = 300
+
+    SCRIPT = '''
+import sys, time
+from django.conf import settings
+settings.configure(
+    INSTALLED_APPS=['django.contrib.contenttypes', 'django_xworkflows', 'startup_app'],
+    DATABASES={},
+)
+import django
+start = time.perf_counter()
+django.setup()
+sys.stdout.write(repr(time.perf_counter() - start))
+'''
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp(prefix='tmp_djxwf_startup_')
+        self.addCleanup(shutil.rmtree, self.dirname)
+        app_dir = os.path.join(self.dirname, 'startup_app')
+        os.mkdir(app_dir)
+        with open(os.path.join(app_dir, '__init__.py'), 'w'):
+            pass
+
+        lines = [
+            'import os',
+            'from django.db import models',
+            'from django_xworkflows import models as xwf_models',
+            'from xworkflows import base',
+            "LAZY = os.environ['STARTUP_LAZY'] == '1'",
+            "if os.environ['STARTUP_LEGACY_HOOKS'] == '1':",
+            '    # Scan class attributes once per workflow, as xworkflows does.',
+            '    xwf_models.WorkflowEnabledMeta._register_hooks = classmethod(',
+            '        base.WorkflowEnabledMeta._register_hooks.__func__)',
+        ]
+        for index in range(self.WORKFLOWS):
+            lines += [
+                'class Workflow%d(xwf_models.Workflow):' % index,
+                '    states = %r' % ([('s%d' % state, 'State %d' % state) for state in range(6)],),
+                '    transitions = %r' % ([
+                    ('w%d_t%d' % (index, state), 's%d' % state, 's%d' % (state + 1)) for state in range(5)
+                ],),
+                "    initial_state = 's0'",
+            ]
+        for index in range(self.MODELS):
+            lines += [
+                'class Model%d(xwf_models.WorkflowEnabled, models.Model):' % index,
+                '    state = xwf_models.StateField(Workflow%d, lazy=LAZY)' % (index % self.WORKFLOWS),
+                '    other_state = xwf_models.StateField(Workflow%d, lazy=LAZY)' % ((index + 1) % self.WORKFLOWS),
+            ]
+        with open(os.path.join(app_dir, 'models.py'), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def setup_duration(self, lazy, legacy_hooks=False):
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join([self.dirname, os.getcwd(), os.environ.get('PYTHONPATH', '')]),
+            STARTUP_LAZY='1' if lazy else '0',
+            STARTUP_LEGACY_HOOKS='1' if legacy_hooks else '0',
+        )
+        return float(subprocess.check_output([sys.executable, '-c', self.SCRIPT], env=env))
+
+    def test_setup(self):
+        variants = collections.OrderedDict([
+            ("django.setup() (per-workflow hook scan)", dict(lazy=False, legacy_hooks=True)),
+            ("django.setup() (eager StateField)", dict(lazy=False)),
+            ("django.setup() (lazy StateField)", dict(lazy=True)),
+        ])
+        # Interleave runs, so that load changes affect all variants alike.
+        timings = collections.defaultdict(list)
+        for _i in range(5):
+            for name, kwargs in variants.items():
+                timings[name].append(self.setup_duration(**kwargs))
+        legacy, eager, lazy = [min(timings[name]) for name in variants]
+        for name in variants:
+            report(name, min(timings[name]), self.MODELS, unit='model')
+
+        self.assertLess(eager, legacy)
+        self.assertLess(lazy, legacy)
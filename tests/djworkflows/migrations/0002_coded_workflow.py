@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-17 08:51
+# flake8: noqa
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import django_xworkflows.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djworkflows', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodedWorkflowEnabled',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', django_xworkflows.models.CodedStateField(workflow=django_xworkflows.models._SerializedWorkflow(initial_state='new', name='CodedWorkflow', state_codes={'done': 3, 'new': 1, 'running': 2}, states=['new', 'running', 'done']))),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=(django_xworkflows.models.BaseWorkflowEnabled, models.Model),
+        ),
+        migrations.CreateModel(
+            name='CodedWorkflowTransitionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='performed at')),
+                ('transition', models.PositiveSmallIntegerField(db_index=True, verbose_name='transition')),
+                ('from_state', models.PositiveSmallIntegerField(db_index=True, verbose_name='from state')),
+                ('to_state', models.PositiveSmallIntegerField(db_index=True, verbose_name='to state')),
+                ('obj', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='djworkflows.codedworkflowenabled')),
+            ],
+            options={
+                'verbose_name': 'XWorkflow transition log',
+                'verbose_name_plural': 'XWorkflow transition logs',
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 3.2.25 on 2026-10-17 08:55
+# flake8: noqa
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('djworkflows', '0002_coded_workflow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompositeIndexedTransitionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transition', models.CharField(max_length=255, verbose_name='transition')),
+                ('from_state', models.CharField(max_length=255, verbose_name='from state')),
+                ('to_state', models.CharField(max_length=255, verbose_name='to state')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now, verbose_name='performed at')),
+                ('content_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Content id')),
+                ('content_type', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Content type')),
+            ],
+            options={
+                'verbose_name': 'XWorkflow transition log',
+                'verbose_name_plural': 'XWorkflow transition logs',
+                'ordering': ('-timestamp', 'transition'),
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='CompositeIndexedLastTransitionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transition', models.CharField(max_length=255, verbose_name='transition')),
+                ('from_state', models.CharField(max_length=255, verbose_name='from state')),
+                ('to_state', models.CharField(max_length=255, verbose_name='to state')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now, verbose_name='performed at')),
+                ('obj', models.OneToOneField(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='djworkflows.someworkflowenabled')),
+            ],
+            options={
+                'verbose_name': 'XWorkflow last transition log',
+                'verbose_name_plural': 'XWorkflow last transition logs',
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='AllIndexedTransitionLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transition', models.CharField(db_index=True, max_length=255, verbose_name='transition')),
+                ('from_state', models.CharField(db_index=True, max_length=255, verbose_name='from state')),
+                ('to_state', models.CharField(db_index=True, max_length=255, verbose_name='to state')),
+                ('timestamp', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='performed at')),
+                ('content_id', models.PositiveIntegerField(blank=True, db_index=True, null=True, verbose_name='Content id')),
+                ('content_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype', verbose_name='Content type')),
+            ],
+            options={
+                'verbose_name': 'XWorkflow transition log',
+                'verbose_name_plural': 'XWorkflow transition logs',
+                'ordering': ('-timestamp', 'transition'),
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='compositeindexedtransitionlog',
+            index=models.Index(fields=['content_type', 'content_id', 'timestamp'], name='djworkflows_content_5c3c6f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compositeindexedtransitionlog',
+            index=models.Index(fields=['transition', 'timestamp'], name='djworkflows_transit_e0c350_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='compositeindexedlasttransitionlog',
+            index=models.Index(fields=['transition', 'timestamp'], name='djworkflows_transit_625621_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='allindexedtransitionlog',
+            index=models.Index(fields=['content_type', 'content_id', 'timestamp'], name='djworkflows_content_fafe93_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='allindexedtransitionlog',
+            index=models.Index(fields=['transition', 'timestamp'], name='djworkflows_transit_fcd200_idx'),
+        ),
+    ]
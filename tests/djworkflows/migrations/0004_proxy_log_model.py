@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-17 09:35
+# flake8: noqa
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djworkflows', '0003_index_profiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProxyCompositeIndexedTransitionLog',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('djworkflows.compositeindexedtransitionlog',),
+        ),
+    ]
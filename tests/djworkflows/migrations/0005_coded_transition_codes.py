@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-10-17 09:37
+# flake8: noqa
+
+from django.db import migrations, models
+import django_xworkflows.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djworkflows', '0004_proxy_log_model'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='codedworkflowenabled',
+            name='state',
+            field=django_xworkflows.models.CodedStateField(workflow=django_xworkflows.models._SerializedWorkflow(initial_state='new', name='CodedWorkflow', state_codes={'done': 3, 'new': 1, 'running': 2}, states=['new', 'running', 'done'], transition_codes={'finish': 2, 'retry': 3, 'start': 1})),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-17 09:40
+# flake8: noqa
+
+from django.db import migrations, models
+import django_xworkflows.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djworkflows', '0005_coded_transition_codes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HookedWorkflowEnabled',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', django_xworkflows.models.StateField(max_length=16, workflow=django_xworkflows.models._SerializedWorkflow(initial_state='foo', name='MyWorkflow', states=['foo', 'bar', 'baz']))),
+                ('other', models.CharField(choices=[('aaa', 'AAA'), ('bbb', 'BBB')], max_length=4)),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=(django_xworkflows.models.BaseWorkflowEnabled, models.Model),
+        ),
+    ]
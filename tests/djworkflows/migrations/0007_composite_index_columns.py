@@ -0,0 +1,51 @@
+# Generated by Django 3.2.25 on 2026-10-17 09:57
+# flake8: noqa
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djworkflows', '0006_hooked_workflow_enabled'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='compositeindexedlasttransitionlog',
+            name='from_state',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='from state'),
+        ),
+        migrations.AlterField(
+            model_name='compositeindexedlasttransitionlog',
+            name='obj',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='djworkflows.someworkflowenabled'),
+        ),
+        migrations.AlterField(
+            model_name='compositeindexedlasttransitionlog',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='performed at'),
+        ),
+        migrations.AlterField(
+            model_name='compositeindexedlasttransitionlog',
+            name='to_state',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='to state'),
+        ),
+        migrations.AlterField(
+            model_name='compositeindexedtransitionlog',
+            name='from_state',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='from state'),
+        ),
+        migrations.AlterField(
+            model_name='compositeindexedtransitionlog',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='performed at'),
+        ),
+        migrations.AlterField(
+            model_name='compositeindexedtransitionlog',
+            name='to_state',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='to state'),
+        ),
+    ]
@@ -64,6 +64,16 @@ class MyWorkflowEnabled(dxmodels.WorkflowEnabled, models.Model):
         self.other = 'aaa'
 
 
+class HookedWorkflowEnabled(dxmodels.WorkflowEnabled, models.Model):
+    """A 'before' hook modifies the object, which must then be saved along with its state."""
+    state = dxmodels.StateField(MyWorkflow)
+    other = models.CharField(max_length=4, choices=MyWorkflowEnabled.OTHER_CHOICES)
+
+    @xworkflows.before_transition("bazbar")
+    def hook_before_bazbar(self, *args, **kwargs):
+        self.other = 'bbb'
+
+
 class WithTwoWorkflows(dxmodels.WorkflowEnabled, models.Model):
     state1 = dxmodels.StateField(MyWorkflow())
     state2 = dxmodels.StateField(MyAltWorkflow())
@@ -116,3 +126,52 @@ class GenericWorkflowEnabled(dxmodels.WorkflowEnabled, models.Model):
 
 class GenericWorkflowTransitionLog(dxmodels.GenericTransitionLog):
     """This model ensures different GenericTransitionLog may exist together."""
+
+
+class CodedWorkflow(dxmodels.Workflow):
+    states = (
+        ('new', "New"),
+        ('running', "Running"),
+        ('done', "Done"),
+    )
+    transitions = (
+        ('start', 'new', 'running'),
+        ('finish', 'running', 'done'),
+        ('retry', ('running', 'done'), 'new'),
+    )
+    initial_state = 'new'
+
+    state_codes = {'new': 1, 'running': 2, 'done': 3, 'removed': 4}
+    transition_codes = {'start': 1, 'finish': 2, 'retry': 3}
+    log_model = 'djworkflows.CodedWorkflowTransitionLog'
+
+
+class CodedWorkflowEnabled(dxmodels.WorkflowEnabled, models.Model):
+    state = dxmodels.CodedStateField(CodedWorkflow)
+
+
+class CodedWorkflowTransitionLog(dxmodels.CodedTransitionLog):
+    WORKFLOW = CodedWorkflow
+    MODIFIED_OBJECT_FIELD = 'obj'
+
+    obj = models.ForeignKey(CodedWorkflowEnabled, on_delete=models.CASCADE)
+
+
+class CompositeIndexedTransitionLog(dxmodels.GenericTransitionLog):
+    INDEX_PROFILE = dxmodels.LOG_INDEXES_COMPOSITE
+
+
+class ProxyCompositeIndexedTransitionLog(CompositeIndexedTransitionLog):
+    class Meta:
+        proxy = True
+
+
+class AllIndexedTransitionLog(dxmodels.GenericTransitionLog):
+    INDEX_PROFILE = dxmodels.LOG_INDEXES_ALL
+
+
+class CompositeIndexedLastTransitionLog(dxmodels.BaseLastTransitionLog):
+    INDEX_PROFILE = dxmodels.LOG_INDEXES_COMPOSITE
+    MODIFIED_OBJECT_FIELD = 'obj'
+
+    obj = models.OneToOneField(SomeWorkflowEnabled, on_delete=models.CASCADE, related_name='+')
@@ -2,7 +2,16 @@
 # Copyright (c) 2011-2020 Raphaël Barrois
 # This code is distributed under the two-clause BSD license.
 
+from concurrent import futures
 import contextlib
+import copy
+import csv
+import datetime
+import functools
+import gzip
+import io
+import json
+import multiprocessing
 import os
 import re
 import shutil
@@ -10,17 +19,33 @@ import subprocess
 import sys
 import tempfile
 import unittest
+from unittest import mock
 
+import django
+from django.apps import apps as django_apps
+from django.contrib.auth import models as auth_models
+from django.contrib.contenttypes import models as ct_models
 from django.core import exceptions
+from django.core import management
 from django.core import serializers
+from django.db import connection
 from django.db import models as django_models
+from django.db import transaction
 from django import forms
 from django import test
 from django.template import engines as template_engines
+from django.test import utils as test_utils
+from django.utils import timezone
 
 import xworkflows
 
+from django_xworkflows import instrumentation
+from django_xworkflows import log_backends
+from django_xworkflows.management.commands import rebuild_transitionlog_states as rebuild_command
 from django_xworkflows import models as xwf_models
+from django_xworkflows import partitions
+from django_xworkflows import signals as xwf_signals
+from django_xworkflows.xworkflow_log import admin as xwlog_admin
 from django_xworkflows.xworkflow_log import models as xwlog_models
 
 from . import models
@@ -119,6 +144,65 @@ class ModelTestCase(test.TestCase):
         self.assertRaises(exceptions.ValidationError, set_invalid_state)
         self.assertEqual(models.MyWorkflow.states['foo'], o.state)
 
+    def test_shared_state_wrappers(self):
+        field_def = models.MyWorkflowEnabled._meta.get_field('state')
+        foo = models.MyWorkflow.states.foo
+
+        o1 = models.MyWorkflowEnabled(state='foo')
+        o2 = models.MyWorkflowEnabled(state=foo)
+        self.assertIs(o1.state, o2.state)
+        self.assertIs(field_def.to_python('foo'), field_def.to_python(foo))
+        self.assertIs(o1.state, models.MyWorkflowEnabled().state)
+
+        with self.assertRaises(TypeError):
+            field_def._state_wrappers['blah'] = None
+
+    def test_from_db_value(self):
+        field_def = models.MyWorkflowEnabled._meta.get_field('state')
+        o = models.MyWorkflowEnabled.objects.create(state='bar')
+
+        obj = models.MyWorkflowEnabled.objects.get(pk=o.pk)
+        self.assertIs(field_def._state_wrappers['bar'], obj.state)
+        self.assertEqual([], field_def.get_db_converters(connection))
+
+        strict_field = xwf_models.StateField(models.MyWorkflow, strict=True)
+        self.assertEqual([strict_field.from_db_value], strict_field.get_db_converters(connection))
+        self.assertIs(strict_field._state_wrappers['bar'], strict_field.from_db_value('bar', None, connection))
+        self.assertIsNone(strict_field.from_db_value(None, None, connection))
+
+    def test_load_conversions(self):
+        field_def = models.MyWorkflowEnabled._meta.get_field('state')
+        for _i in range(3):
+            models.MyWorkflowEnabled.objects.create(state='bar')
+
+        def load(strict):
+            with mock.patch.object(field_def, 'strict', strict), \
+                    mock.patch.object(field_def, 'to_python', wraps=field_def.to_python) as to_python, \
+                    mock.patch.object(field_def, 'from_db_value', wraps=field_def.from_db_value) as from_db_value:
+                objs = list(models.MyWorkflowEnabled.objects.all())
+            self.assertEqual([field_def._state_wrappers['bar']] * 3, [obj.state for obj in objs])
+            return from_db_value.call_count, to_python.call_count
+
+        # Stored names are resolved on assignment, without validation.
+        self.assertEqual((0, 0), load(strict=False))
+        # Strict fields convert each row once, in from_db_value().
+        self.assertEqual((3, 0), load(strict=True))
+
+    def test_from_db_unknown_state(self):
+        o = models.MyWorkflowEnabled.objects.create(state='bar')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE %s SET state = 'blah' WHERE id = %%s" % models.MyWorkflowEnabled._meta.db_table,
+                [o.pk],
+            )
+
+        self.assertEqual(['blah'], list(models.MyWorkflowEnabled.objects.values_list('state', flat=True)))
+        self.assertRaises(exceptions.ValidationError, models.MyWorkflowEnabled.objects.get, pk=o.pk)
+
+        strict_field = xwf_models.StateField(models.MyWorkflow, strict=True)
+        self.assertRaises(exceptions.ValidationError, strict_field.from_db_value, 'blah', None, connection)
+        self.assertEqual(True, strict_field.deconstruct()[3]['strict'])
+
     def test_display(self):
         o = models.MyWorkflowEnabled(other='aaa')
         self.assertEqual("Foo", o.get_state_display())
@@ -166,6 +250,364 @@ class ModelTestCase(test.TestCase):
         self.assertRaises(serializers.base.DeserializationError, list, serializers.deserialize('json', data))
 
 
+class CodedStateFieldTestCase(test.TestCase):
+    def setUp(self):
+        self.obj = models.CodedWorkflowEnabled.objects.create()
+
+    def test_storage(self):
+        self.assertEqual(models.CodedWorkflow.states.new, self.obj.state)
+        self.assertEqual([1], list(models.CodedWorkflowEnabled.objects.values_list('state', flat=True)))
+
+        obj = models.CodedWorkflowEnabled.objects.get(pk=self.obj.pk)
+        self.assertEqual(models.CodedWorkflow.states.new, obj.state)
+
+    def test_lookups(self):
+        self.assertEqual([self.obj], list(models.CodedWorkflowEnabled.objects.filter(state='new')))
+        self.assertEqual(
+            [self.obj],
+            list(models.CodedWorkflowEnabled.objects.filter(state__in=[models.CodedWorkflow.states.new, 'done'])),
+        )
+        self.assertFalse(models.CodedWorkflowEnabled.objects.filter(state='running').exists())
+
+    def test_transition(self):
+        self.obj.start()
+        self.assertEqual([2], list(models.CodedWorkflowEnabled.objects.values_list('state', flat=True)))
+
+        log = models.CodedWorkflowTransitionLog.objects.get()
+        self.assertEqual((1, 1, 2), (log.transition, log.from_state, log.to_state))
+        self.assertEqual(('start', 'new', 'running'), (log.transition_name, log.from_state_name, log.to_state_name))
+        self.assertEqual(self.obj, log.obj)
+
+    def test_bulk_transition(self):
+        models.CodedWorkflowEnabled.objects.create()
+        self.assertEqual(2, models.CodedWorkflowEnabled.objects.bulk_transition('start'))
+        self.assertEqual([2, 2], list(models.CodedWorkflowEnabled.objects.values_list('state', flat=True)))
+        self.assertEqual(2, models.CodedWorkflowTransitionLog.objects.filter(to_state=2).count())
+
+    def test_form(self):
+        form_class = forms.modelform_factory(models.CodedWorkflowEnabled, fields=['state'])
+        form = form_class({'state': 'running'}, instance=self.obj)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual([2], list(models.CodedWorkflowEnabled.objects.values_list('state', flat=True)))
+
+    def test_deconstruct(self):
+        field = models.CodedWorkflowEnabled._meta.get_field('state')
+        _name, path, _args, kwargs = field.deconstruct()
+        self.assertEqual('django_xworkflows.models.CodedStateField', path)
+        self.assertNotIn('max_length', kwargs)
+        self.assertEqual({'new': 1, 'running': 2, 'done': 3}, kwargs['workflow']._state_codes)
+        self.assertEqual({'start': 1, 'finish': 2, 'retry': 3}, kwargs['workflow']._transition_codes)
+
+        clone = xwf_models.CodedStateField(**kwargs)
+        self.assertEqual(3, clone.get_db_prep_value('done', connection))
+
+    def test_deconstruct_renumbered_transitions(self):
+        # Transition codes are stored by CodedTransitionLog: renumbering them requires a migration.
+        class RenumberedWorkflow(models.CodedWorkflow):
+            transition_codes = {'start': 1, 'finish': 3, 'retry': 2}
+
+        _name, _path, _args, kwargs = xwf_models.CodedStateField(RenumberedWorkflow).deconstruct()
+        _name, _path, _args, current_kwargs = models.CodedWorkflowEnabled._meta.get_field('state').deconstruct()
+        self.assertNotEqual(current_kwargs['workflow'].deconstruct(), kwargs['workflow'].deconstruct())
+        self.assertEqual(3, kwargs['workflow'].transition_codes['finish'])
+
+    def test_missing_codes(self):
+        with self.assertRaises(exceptions.ImproperlyConfigured):
+            xwf_models.CodedStateField(models.MyWorkflow)
+
+    def test_duplicate_codes(self):
+        class DuplicateCodesWorkflow(models.CodedWorkflow):
+            state_codes = {'new': 1, 'running': 2, 'done': 2}
+
+        with self.assertRaises(exceptions.ImproperlyConfigured):
+            xwf_models.CodedStateField(DuplicateCodesWorkflow)
+
+
+class WorkflowIndexTestCase(test.TestCase):
+    def test_transitions_from(self):
+        workflow = models.MyWorkflow
+        self.assertEqual(
+            ['foobar', 'gobaz'],
+            [transition.name for transition in workflow.transitions_from['foo']],
+        )
+        self.assertEqual(['gobaz'], [transition.name for transition in workflow.transitions_from['bar']])
+        self.assertEqual(['bazbar'], [transition.name for transition in workflow.transitions_from['baz']])
+
+    def test_transitions_into(self):
+        workflow = models.MyWorkflow
+        self.assertEqual((), workflow.transitions_into['foo'])
+        self.assertEqual(
+            ['foobar', 'bazbar'],
+            [transition.name for transition in workflow.transitions_into['bar']],
+        )
+        self.assertEqual(['gobaz'], [transition.name for transition in workflow.transitions_into['baz']])
+
+    def test_transitions_by_name(self):
+        workflow = models.MyWorkflow
+        self.assertIs(workflow.transitions['gobaz'], workflow.transitions_by_name['gobaz'])
+        self.assertEqual({'foobar', 'gobaz', 'bazbar'}, set(workflow.transitions_by_name))
+
+    def test_read_only(self):
+        with self.assertRaises(TypeError):
+            models.MyWorkflow.transitions_from['foo'] = ()
+
+    def test_available_transitions(self):
+        workflow = models.MyWorkflow()
+        obj = models.MyWorkflowEnabled()
+        expected = workflow.transitions_from['bar']
+        self.assertEqual(expected, workflow.available_transitions('bar'))
+        self.assertEqual(expected, workflow.available_transitions(workflow.states['bar']))
+        obj.state = 'bar'
+        self.assertEqual(expected, workflow.available_transitions(obj.state))
+        self.assertEqual((), workflow.available_transitions('unknown'))
+
+    def test_state_transitions(self):
+        obj = models.MyWorkflowEnabled()
+        self.assertEqual(['foobar', 'gobaz'], [transition.name for transition in obj.state.transitions()])
+        obj.state = 'baz'
+        self.assertEqual(['bazbar'], [transition.name for transition in obj.state.transitions()])
+
+    def test_serialized_workflow(self):
+        field = models.MyWorkflowEnabled._meta.get_field('state')
+        _name, _path, _args, kwargs = field.deconstruct()
+        workflow = kwargs['workflow']
+        self.assertEqual({'foo': (), 'bar': (), 'baz': ()}, dict(workflow.transitions_from))
+
+
+class RecordingCollector(instrumentation.BaseCollector):
+    def __init__(self):
+        self.measurements = []
+
+    def record(self, measurement):
+        self.measurements.append(measurement)
+
+
+class InstrumentationTestCase(test.TestCase):
+    def setUp(self):
+        self.obj = models.MyWorkflowEnabled.objects.create()
+        self.collector = RecordingCollector()
+        patcher = mock.patch.object(self.obj._workflows['state'].workflow, 'metrics_collector', self.collector)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_phases(self):
+        self.obj.foobar()
+        measurement, = self.collector.measurements
+        self.assertEqual('MyWorkflow', measurement.workflow)
+        self.assertEqual('foobar', measurement.transition)
+        self.assertEqual('djworkflows.MyWorkflowEnabled', measurement.model)
+        self.assertEqual(instrumentation.OUTCOME_SUCCESS, measurement.outcome)
+        self.assertEqual(
+            [
+                instrumentation.PHASE_CHECK, instrumentation.PHASE_BEFORE, instrumentation.PHASE_IMPLEMENTATION,
+                instrumentation.PHASE_SAVE, instrumentation.PHASE_LOG, instrumentation.PHASE_AFTER,
+            ],
+            list(measurement.phases),
+        )
+        self.assertEqual(0, measurement.phases[instrumentation.PHASE_CHECK].queries)
+        self.assertEqual(1, measurement.phases[instrumentation.PHASE_SAVE].queries)
+        self.assertEqual(1, measurement.phases[instrumentation.PHASE_LOG].queries)
+        self.assertGreaterEqual(measurement.queries, 2)
+        self.assertGreaterEqual(
+            measurement.duration, sum(phase.duration for phase in measurement.phases.values()))
+        self.assertIsNone(instrumentation.current_measurement())
+
+    def test_invalid(self):
+        with self.assertRaises(xwf_models.InvalidTransitionError):
+            self.obj.bazbar()
+        measurement, = self.collector.measurements
+        self.assertEqual(instrumentation.OUTCOME_INVALID, measurement.outcome)
+        self.assertEqual([instrumentation.PHASE_CHECK], list(measurement.phases))
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            self.obj.gobaz(21)
+        measurement, = self.collector.measurements
+        self.assertEqual(instrumentation.OUTCOME_ERROR, measurement.outcome)
+        self.assertIsInstance(measurement.exception, ValueError)
+
+    def test_outcomes(self):
+        self.assertEqual(
+            instrumentation.OUTCOME_FORBIDDEN, instrumentation.get_outcome(xwf_models.ForbiddenTransition()))
+        self.assertEqual(instrumentation.OUTCOME_ABORTED, instrumentation.get_outcome(xwf_models.AbortTransition()))
+        self.assertEqual(
+            instrumentation.OUTCOME_INVALID, instrumentation.get_outcome(xwf_models.ConcurrentTransitionError()))
+
+    def test_optimistic(self):
+        workflow = self.obj._workflows['state'].workflow
+        with mock.patch.object(workflow, 'implementation_class', xwf_models.OptimisticImplementationWrapper):
+            self.obj.foobar()
+        measurement, = self.collector.measurements
+        self.assertEqual(1, measurement.phases[instrumentation.PHASE_SAVE].queries)
+
+    def test_locking(self):
+        workflow = self.obj._workflows['state'].workflow
+        with mock.patch.object(workflow, 'implementation_class', xwf_models.LockingImplementationWrapper):
+            self.obj.foobar()
+        measurement, = self.collector.measurements
+        self.assertEqual(instrumentation.PHASE_LOCK, list(measurement.phases)[0])
+        self.assertEqual(1, measurement.phases[instrumentation.PHASE_LOCK].queries)
+
+    def test_is_available(self):
+        self.assertTrue(self.obj.foobar.is_available())
+        self.assertEqual([], self.collector.measurements)
+
+    def test_broken_collector(self):
+        with mock.patch.object(self.collector, 'record', side_effect=RuntimeError()):
+            with self.assertLogs('django_xworkflows.instrumentation', 'ERROR'):
+                self.obj.foobar()
+        self.assertEqual(models.MyWorkflow.states.bar, self.obj.state)
+
+    def test_prometheus(self):
+        collector = instrumentation.PrometheusCollector(buckets=(0.5, 1.0))
+        with mock.patch.object(self.obj._workflows['state'].workflow, 'metrics_collector', collector):
+            self.obj.foobar()
+            with self.assertRaises(xwf_models.InvalidTransitionError):
+                self.obj.foobar()
+
+        samples = {
+            (name, tuple(labels)): value for name, _type, labels, value in collector.samples()
+        }
+        transition = (('workflow', 'MyWorkflow'), ('transition', 'foobar'))
+        self.assertEqual(1, samples[('xworkflows_transitions_total', transition + (('outcome', 'success'),))])
+        self.assertEqual(1, samples[('xworkflows_transitions_total', transition + (('outcome', 'invalid'),))])
+        self.assertEqual(2, samples[('xworkflows_transition_duration_seconds_count', transition)])
+        self.assertEqual(
+            2, samples[('xworkflows_transition_duration_seconds_bucket', transition + (('le', '+Inf'),))])
+        self.assertEqual(
+            2, samples[('xworkflows_transition_phase_duration_seconds_count', transition + (('phase', 'check'),))])
+        self.assertEqual(
+            1, samples[('xworkflows_transition_queries_total', transition + (('phase', 'save'),))])
+
+        rendered = collector.render()
+        self.assertIn('# TYPE xworkflows_transitions_total counter\n', rendered)
+        self.assertIn('# TYPE xworkflows_transition_duration_seconds histogram\n', rendered)
+        self.assertIn(
+            'xworkflows_transitions_total{workflow="MyWorkflow",transition="foobar",outcome="success"} 1\n',
+            rendered,
+        )
+        self.assertIn(
+            'xworkflows_transition_duration_seconds_bucket{workflow="MyWorkflow",transition="foobar",le="+Inf"} 2\n',
+            rendered,
+        )
+
+        collector.reset()
+        self.assertEqual('', collector.render())
+
+
+class SignalsTestCase(test.TransactionTestCase):
+    def setUp(self):
+        self.obj = models.MyWorkflowEnabled.objects.create()
+        self.received = []
+
+    def connect(self, signal, sender=models.MyWorkflowEnabled):
+        def receiver(signal, sender, instance, **kwargs):
+            self.received.append((signal, instance.other, kwargs))
+        signal.connect(receiver, sender=sender, weak=False)
+        self.addCleanup(signal.disconnect, receiver, sender=sender)
+
+    def test_pre_post_transition(self):
+        self.connect(xwf_signals.pre_transition)
+        self.connect(xwf_signals.post_transition)
+        self.obj.gobaz(1)
+        self.obj.bazbar()
+
+        self.assertEqual(
+            [
+                (xwf_signals.pre_transition, ''),
+                (xwf_signals.post_transition, ''),
+                (xwf_signals.pre_transition, ''),
+                # Entering 'bar' sets 'aaa'.
+                (xwf_signals.post_transition, 'aaa'),
+            ],
+            [(signal, other) for signal, other, _kwargs in self.received],
+        )
+        kwargs = self.received[1][2]
+        self.assertEqual('state', kwargs['field_name'])
+        self.assertEqual(models.MyWorkflow.transitions.gobaz, kwargs['transition'])
+        self.assertEqual(models.MyWorkflow.states.foo, kwargs['from_state'])
+        self.assertEqual(models.MyWorkflow.states.baz, kwargs['to_state'])
+        self.assertEqual(2, kwargs['result'])
+
+    def test_other_sender(self):
+        self.connect(xwf_signals.post_transition, sender=models.SomeWorkflowEnabled)
+        self.obj.foobar()
+        self.assertEqual([], self.received)
+
+    def test_failed(self):
+        self.connect(xwf_signals.post_transition)
+        self.connect(xwf_signals.transition_failed)
+        with self.assertRaises(ValueError):
+            self.obj.gobaz(21)
+
+        (signal, _other, kwargs), = self.received
+        self.assertEqual(xwf_signals.transition_failed, signal)
+        self.assertIsInstance(kwargs['exception'], ValueError)
+        self.assertEqual(models.MyWorkflow.states.foo, kwargs['from_state'])
+        self.assertEqual(models.MyWorkflow.states.foo, models.MyWorkflowEnabled.objects.get().state)
+
+    def test_batch_hooks_failed(self):
+        other = models.MyWorkflowEnabled.objects.create()
+        self.connect(xwf_signals.post_transition)
+        self.connect(xwf_signals.transition_failed)
+        with self.assertRaises(ValueError):
+            models.MyWorkflowEnabled.objects.bulk_transition('gobaz', 21, hooks=xwf_models.BULK_HOOKS_BATCH)
+
+        # The first object's 'after' hook fails; the second one never gets there.
+        (signal, _other, kwargs), = self.received
+        self.assertEqual(xwf_signals.transition_failed, signal)
+        self.assertIsInstance(kwargs['exception'], ValueError)
+        self.assertEqual(models.MyWorkflow.states.foo, kwargs['from_state'])
+        self.assertEqual(
+            [models.MyWorkflow.states.foo, models.MyWorkflow.states.foo],
+            [obj.state for obj in models.MyWorkflowEnabled.objects.filter(pk__in=[self.obj.pk, other.pk])],
+        )
+
+    def test_invalid(self):
+        self.connect(xwf_signals.pre_transition)
+        self.connect(xwf_signals.transition_failed)
+        with self.assertRaises(xwf_models.InvalidTransitionError):
+            self.obj.bazbar()
+
+        (signal, _other, kwargs), = self.received
+        self.assertEqual(xwf_signals.transition_failed, signal)
+        self.assertEqual(models.MyWorkflow.states.foo, kwargs['from_state'])
+
+    def test_defer_post_transition(self):
+        self.connect(xwf_signals.post_transition)
+        workflow = self.obj._workflows['state'].workflow
+        with mock.patch.object(workflow, 'defer_post_transition', True):
+            with transaction.atomic():
+                self.obj.foobar()
+                self.assertEqual([], self.received)
+            self.assertEqual(1, len(self.received))
+
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    self.obj.gobaz(1)
+                    raise ValueError()
+        self.assertEqual(1, len(self.received))
+
+    def test_bulk_transition(self):
+        self.connect(xwf_signals.pre_transition)
+        self.connect(xwf_signals.post_transition)
+        models.MyWorkflowEnabled.objects.bulk_transition('foobar', hooks=xwf_models.BULK_HOOKS_BATCH)
+        self.assertEqual(
+            [xwf_signals.pre_transition, xwf_signals.post_transition],
+            [signal for signal, _other, _kwargs in self.received],
+        )
+
+        self.received = []
+        models.MyWorkflowEnabled.objects.bulk_transition('gobaz')
+        self.assertEqual([], self.received)
+
+    def test_no_receivers(self):
+        with mock.patch.object(xwf_signals.post_transition, 'send') as send:
+            self.obj.foobar()
+        self.assertFalse(send.called)
+
+
 class InheritanceTestCase(test.TestCase):
     """Tests inheritance-related behaviour."""
 
@@ -283,6 +725,750 @@ class TransitionTestCase(test.TransactionTestCase):
         self.assertEqual(models.MyWorkflow.states.foo, obj.state)
 
 
+class TransitionQueriesTestCase(test.TestCase):
+    """Query counts of transitions; benchmarks only time them."""
+
+    def setUp(self):
+        self.obj = models.MyWorkflowEnabled.objects.create(state='bar')
+        self.workflow = models.MyWorkflowEnabled._workflows['state'].workflow
+        # Don't count the ContentType lookup of the first log.
+        xwlog_models.TransitionLog.build_log('gobaz', 'bar', 'baz', self.obj)
+
+    def test_transition(self):
+        # SAVEPOINT, UPDATE, INSERT log, RELEASE SAVEPOINT
+        with self.assertNumQueries(4):
+            self.obj.gobaz(1)
+
+    def test_transition_without_log(self):
+        # SAVEPOINT, UPDATE, RELEASE SAVEPOINT
+        with mock.patch.object(self.workflow, 'log_model', ''):
+            with self.assertNumQueries(3):
+                self.obj.gobaz(1)
+
+    def test_transition_instrumented(self):
+        with mock.patch.object(self.workflow, 'metrics_collector', RecordingCollector()):
+            with self.assertNumQueries(4):
+                self.obj.gobaz(1)
+
+    def test_hydration(self):
+        models.MyWorkflowEnabled.objects.bulk_create(models.MyWorkflowEnabled(state='baz') for _i in range(10))
+        with self.assertNumQueries(1):
+            objs = list(models.MyWorkflowEnabled.objects.all())
+        self.assertEqual(11, len(objs))
+
+
+class OptimisticTransitionTestCase(test.TestCase):
+    """Tests for OptimisticImplementationWrapper."""
+
+    def setUp(self):
+        workflow = models.MyWorkflowEnabled._workflows['state'].workflow
+        patcher = mock.patch.object(workflow, 'implementation_class', xwf_models.OptimisticImplementationWrapper)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.obj = models.MyWorkflowEnabled.objects.create(other='aaa')
+
+    def test_conditional_update(self):
+        with test_utils.CaptureQueriesContext(connection) as queries:
+            self.obj.foobar()
+
+        self.assertEqual(models.MyWorkflow.states.bar, self.obj.state)
+        self.assertEqual('bar', models.MyWorkflowEnabled.objects.get(pk=self.obj.pk).state.name)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(1, len(updates))
+        self.assertIn('"state" = ', updates[0].split('WHERE')[1])
+        self.assertNotIn('"other"', updates[0])
+        self.assertEqual(1, xwlog_models.TransitionLog.objects.count())
+
+    def test_hook_changes(self):
+        obj = models.HookedWorkflowEnabled.objects.create(state='baz', other='aaa')
+        obj.bazbar()
+
+        obj.refresh_from_db()
+        self.assertEqual('bar', obj.state.name)
+        self.assertEqual('bbb', obj.other)
+
+    def test_concurrent_transition(self):
+        stale = models.MyWorkflowEnabled.objects.get(pk=self.obj.pk)
+        self.obj.foobar()
+
+        with self.assertRaises(xwf_models.ConcurrentTransitionError):
+            stale.gobaz(2)
+
+        self.assertEqual(models.MyWorkflow.states.foo, stale.state)
+        self.assertEqual('bar', models.MyWorkflowEnabled.objects.get(pk=self.obj.pk).state.name)
+        self.assertEqual(1, xwlog_models.TransitionLog.objects.count())
+
+    def test_unsaved_instance(self):
+        obj = models.MyWorkflowEnabled(other='aaa')
+        obj.foobar()
+        self.assertEqual('bar', models.MyWorkflowEnabled.objects.get(pk=obj.pk).state.name)
+
+    def test_no_save(self):
+        self.obj.foobar(save=False)
+        self.assertEqual('foo', models.MyWorkflowEnabled.objects.get(pk=self.obj.pk).state.name)
+
+
+class LockingTransitionTestCase(test.TestCase):
+    """Tests for LockingImplementationWrapper."""
+
+    def setUp(self):
+        self.workflow = models.MyWorkflowEnabled._workflows['state'].workflow
+        patcher = mock.patch.object(self.workflow, 'implementation_class', xwf_models.LockingImplementationWrapper)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.obj = models.MyWorkflowEnabled.objects.create(other='aaa')
+        self.stale = models.MyWorkflowEnabled.objects.get(pk=self.obj.pk)
+        self.obj.foobar()
+
+    def test_refresh_state(self):
+        with self.assertRaises(xworkflows.InvalidTransitionError):
+            self.stale.foobar()
+        self.assertEqual(models.MyWorkflow.states.bar, self.stale.state)
+
+        self.assertEqual(4, self.stale.gobaz(2))
+        self.assertEqual('baz', models.MyWorkflowEnabled.objects.get(pk=self.obj.pk).state.name)
+        self.assertEqual(
+            [('foo', 'bar'), ('bar', 'baz')],
+            list(xwlog_models.TransitionLog.objects.order_by('id').values_list('from_state', 'to_state')),
+        )
+
+    @unittest.skipUnless(connection.features.has_select_for_update, "SELECT ... FOR UPDATE not supported.")
+    def test_lock_query(self):
+        with test_utils.CaptureQueriesContext(connection) as queries:
+            self.obj.gobaz(2)
+        self.assertIn('FOR UPDATE', queries[1]['sql'])
+
+    def test_no_lock(self):
+        with mock.patch.object(self.workflow, 'lock_options', {'foobar': None}):
+            self.stale.foobar()
+        self.assertEqual(2, xwlog_models.TransitionLog.objects.count())
+
+    def test_lock_options(self):
+        with mock.patch.object(self.workflow, 'lock_options', {'gobaz': {'nowait': True}}):
+            with mock.patch.object(django_models.QuerySet, 'select_for_update', autospec=True) as sfu:
+                sfu.side_effect = lambda qs, **kwargs: qs
+                self.stale.gobaz(2)
+        sfu.assert_called_once_with(mock.ANY, nowait=True)
+
+    def test_deleted_object(self):
+        models.MyWorkflowEnabled.objects.all().delete()
+        with self.assertRaises(xwf_models.ConcurrentTransitionError):
+            self.stale.gobaz(2)
+
+
+class BulkTransitionTestCase(test.TestCase):
+    def setUp(self):
+        self.foo1 = models.MyWorkflowEnabled.objects.create(state='foo')
+        self.foo2 = models.MyWorkflowEnabled.objects.create(state='foo')
+        self.baz = models.MyWorkflowEnabled.objects.create(state='baz')
+
+    def assertStates(self, **states):
+        for name, state in states.items():
+            obj = models.MyWorkflowEnabled.objects.get(pk=getattr(self, name).pk)
+            self.assertEqual(state, obj.state.name)
+
+    def test_skip_hooks(self):
+        # SAVEPOINT, SELECT, UPDATE, INSERT logs, RELEASE SAVEPOINT
+        with self.assertNumQueries(5):
+            self.assertEqual(2, models.MyWorkflowEnabled.objects.bulk_transition('foobar'))
+
+        self.assertStates(foo1='bar', foo2='bar', baz='baz')
+        # No hook was run
+        self.assertEqual(0, models.MyWorkflowEnabled.objects.filter(other='aaa').count())
+
+        logs = xwlog_models.TransitionLog.objects.order_by('content_id')
+        self.assertEqual([self.foo1, self.foo2], [log.modified_object for log in logs])
+        self.assertEqual({('foobar', 'foo', 'bar')}, set(logs.values_list('transition', 'from_state', 'to_state')))
+
+    def test_skip_hooks_batches(self):
+        # SAVEPOINT, SELECT, 2 * (UPDATE, INSERT logs), RELEASE SAVEPOINT
+        with self.assertNumQueries(7):
+            count = models.MyWorkflowEnabled.objects.bulk_transition('gobaz', batch_size=1)
+        self.assertEqual(2, count)
+        self.assertStates(foo1='baz', foo2='baz', baz='baz')
+        self.assertEqual(2, xwlog_models.TransitionLog.objects.count())
+
+    def test_skip_hooks_without_logs(self):
+        # A single UPDATE
+        with self.assertNumQueries(1):
+            self.assertEqual(2, models.MyWorkflowEnabled.objects.bulk_transition('gobaz', log=False))
+        self.assertStates(foo1='baz', foo2='baz', baz='baz')
+        self.assertFalse(xwlog_models.TransitionLog.objects.exists())
+
+        models.WithTwoWorkflows.objects.create()
+        # MyAltWorkflow doesn't log transitions
+        with self.assertNumQueries(1):
+            self.assertEqual(1, models.WithTwoWorkflows.objects.bulk_transition('tob', field='state2'))
+
+    def test_filtered(self):
+        qs = models.MyWorkflowEnabled.objects.filter(pk__in=[self.foo1.pk, self.baz.pk])
+        self.assertEqual(1, qs.bulk_transition('foobar', log=False))
+        self.assertStates(foo1='bar', foo2='foo', baz='baz')
+        self.assertFalse(xwlog_models.TransitionLog.objects.exists())
+
+    def test_batch_hooks(self):
+        count = models.MyWorkflowEnabled.objects.bulk_transition(
+            'gobaz', 'x', hooks=xwf_models.BULK_HOOKS_BATCH, batch_size=1)
+        self.assertEqual(2, count)
+        self.assertStates(foo1='baz', foo2='baz', baz='baz')
+        self.assertEqual(2, xwlog_models.TransitionLog.objects.filter(transition='gobaz').count())
+
+        count = models.MyWorkflowEnabled.objects.bulk_transition('bazbar', hooks=xwf_models.BULK_HOOKS_BATCH)
+        self.assertEqual(3, count)
+        self.assertStates(foo1='bar', foo2='bar', baz='bar')
+
+    def test_batch_hooks_save(self):
+        # Changes from pre-transition hooks are saved along with the state.
+        models.HookedWorkflowEnabled.objects.create(state='foo', other='aaa')
+        models.HookedWorkflowEnabled.objects.create(state='baz', other='aaa')
+        models.HookedWorkflowEnabled.objects.bulk_transition('bazbar', hooks=xwf_models.BULK_HOOKS_BATCH)
+        self.assertEqual(
+            [('foo', 'aaa'), ('bar', 'bbb')],
+            [(obj.state.name, obj.other) for obj in models.HookedWorkflowEnabled.objects.order_by('pk')],
+        )
+
+    def test_claim(self):
+        # SAVEPOINT, SELECT, UPDATE, INSERT logs, RELEASE SAVEPOINT
+        with self.assertNumQueries(5):
+            claimed = models.MyWorkflowEnabled.objects.claim('foobar', 1)
+        self.assertEqual([self.foo1], claimed)
+        self.assertEqual(models.MyWorkflow.states.bar, claimed[0].state)
+        self.assertStates(foo1='bar', foo2='foo', baz='baz')
+        log = xwlog_models.TransitionLog.objects.get()
+        self.assertEqual((self.foo1, 'foo', 'bar'), (log.modified_object, log.from_state, log.to_state))
+
+        self.assertEqual([self.foo2], models.MyWorkflowEnabled.objects.claim('foobar', 10))
+        self.assertEqual([], models.MyWorkflowEnabled.objects.claim('foobar', 10))
+
+    def test_claim_concurrent_update(self):
+        select_for_update = xwf_models.WorkflowQuerySet.select_for_update
+
+        def select_and_update(queryset, **kwargs):
+            rows = list(select_for_update(queryset, **kwargs))
+            # Another process moves an unlocked row meanwhile.
+            models.MyWorkflowEnabled.objects.filter(pk=self.foo1.pk).update(state='baz')
+            return rows
+
+        with mock.patch.object(xwf_models.WorkflowQuerySet, 'select_for_update', select_and_update):
+            with self.assertRaises(xwf_models.ConcurrentTransitionError):
+                models.MyWorkflowEnabled.objects.claim('foobar', 2)
+        self.assertStates(foo1='foo', foo2='foo', baz='baz')
+        self.assertFalse(xwlog_models.TransitionLog.objects.exists())
+
+    def test_claim_ordering(self):
+        claimed = models.MyWorkflowEnabled.objects.order_by('-pk').claim('gobaz', 1, 'x', log=False)
+        self.assertEqual([self.foo2], claimed)
+        self.assertStates(foo1='foo', foo2='baz', baz='baz')
+        self.assertFalse(xwlog_models.TransitionLog.objects.exists())
+
+    def test_claim_batch_hooks(self):
+        models.HookedWorkflowEnabled.objects.create(state='foo', other='aaa')
+        baz = models.HookedWorkflowEnabled.objects.create(state='baz', other='aaa')
+        claimed = models.HookedWorkflowEnabled.objects.claim('bazbar', 2, hooks=xwf_models.BULK_HOOKS_BATCH)
+        self.assertEqual([baz], claimed)
+        self.assertEqual('bbb', models.HookedWorkflowEnabled.objects.get(pk=baz.pk).other)
+        self.assertEqual(1, xwlog_models.TransitionLog.objects.count())
+
+    def test_claim_invalid_hooks(self):
+        with self.assertRaises(ValueError):
+            models.MyWorkflowEnabled.objects.claim('foobar', 1, hooks=xwf_models.BULK_HOOKS_RUN)
+
+    def test_batch_hooks_failure(self):
+        with self.assertRaises(ValueError):
+            models.MyWorkflowEnabled.objects.bulk_transition('gobaz', 21, hooks=xwf_models.BULK_HOOKS_BATCH)
+        self.assertStates(foo1='foo', foo2='foo', baz='baz')
+        self.assertFalse(xwlog_models.TransitionLog.objects.exists())
+
+    def test_run_transitions(self):
+        count = models.MyWorkflowEnabled.objects.bulk_transition('foobar', hooks=xwf_models.BULK_HOOKS_RUN)
+        self.assertEqual(2, count)
+        self.assertStates(foo1='bar', foo2='bar', baz='baz')
+        self.assertEqual(2, xwlog_models.TransitionLog.objects.count())
+
+    def test_last_transition_log(self):
+        models.SomeWorkflowEnabled.objects.create()
+        models.SomeWorkflowEnabled.objects.create()
+        self.assertEqual(2, models.SomeWorkflowEnabled.objects.bulk_transition('ab'))
+        self.assertEqual(2, models.SomeWorkflowLastTransitionLog.objects.filter(to_state='b').count())
+
+    def test_invalid_transition(self):
+        self.assertRaises(ValueError, models.MyWorkflowEnabled.objects.bulk_transition, 'blah')
+        self.assertRaises(ValueError, models.MyWorkflowEnabled.objects.bulk_transition, 'foobar', field='other')
+        self.assertRaises(ValueError, models.MyWorkflowEnabled.objects.bulk_transition, 'foobar', hooks='blah')
+
+        models.WithTwoWorkflows.objects.create()
+        self.assertEqual(1, models.WithTwoWorkflows.objects.bulk_transition('tob', field='state2'))
+
+
+class BufferedLoggingTestCase(test.TransactionTestCase):
+    """Tests for LOG_FLUSH_ON_COMMIT."""
+
+    def setUp(self):
+        workflow = models.MyWorkflowEnabled._workflows['state'].workflow
+        patcher = mock.patch.object(workflow, 'log_flush_policy', xwf_models.LOG_FLUSH_ON_COMMIT)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.objs = [models.MyWorkflowEnabled.objects.create() for _i in range(3)]
+
+    def count_log_inserts(self, queries):
+        table = xwlog_models.TransitionLog._meta.db_table
+        return len([q for q in queries if q['sql'].startswith('INSERT INTO "%s"' % table)])
+
+    def test_flush_on_commit(self):
+        with test_utils.CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                for obj in self.objs:
+                    obj.foobar()
+                self.assertFalse(xwlog_models.TransitionLog.objects.exists())
+
+        self.assertEqual(3, xwlog_models.TransitionLog.objects.count())
+        # One log was written in the last transition's savepoint.
+        self.assertEqual(2, self.count_log_inserts(queries))
+
+    def test_flush_without_savepoints(self):
+        workflow = models.MyWorkflowEnabled._workflows['state'].workflow
+        with test_utils.CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                for obj in self.objs:
+                    workflow.db_log(models.MyWorkflow.transitions.foobar, models.MyWorkflow.states.foo, obj)
+
+        self.assertEqual(3, xwlog_models.TransitionLog.objects.count())
+        self.assertEqual(1, self.count_log_inserts(queries))
+
+    def test_rollback(self):
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                self.objs[0].foobar()
+                raise ValueError()
+        self.assertFalse(xwlog_models.TransitionLog.objects.exists())
+
+    def test_savepoint_rollback(self):
+        with transaction.atomic():
+            self.objs[0].foobar()
+            try:
+                with transaction.atomic():
+                    self.objs[1].foobar()
+                    raise ValueError()
+            except ValueError:
+                pass
+            self.objs[2].foobar()
+
+        self.assertEqual(
+            [self.objs[0], self.objs[2]],
+            sorted(
+                (log.modified_object for log in xwlog_models.TransitionLog.objects.all()),
+                key=lambda obj: obj.pk,
+            ),
+        )
+
+    def test_buffer_size(self):
+        workflow = models.MyWorkflowEnabled._workflows['state'].workflow
+        with mock.patch.object(workflow, 'log_buffer_size', 2):
+            with transaction.atomic():
+                for obj in self.objs:
+                    obj.foobar(log=False)
+                    workflow.db_log(models.MyWorkflow.transitions.foobar, models.MyWorkflow.states.foo, obj)
+                self.assertEqual(2, xwlog_models.TransitionLog.objects.count())
+        self.assertEqual(3, xwlog_models.TransitionLog.objects.count())
+
+    def test_autocommit(self):
+        self.objs[0].foobar()
+        self.assertEqual(1, xwlog_models.TransitionLog.objects.count())
+
+    def test_save_signals(self):
+        workflow = models.MyWorkflowEnabled._workflows['state'].workflow
+        received = []
+
+        def receiver(signal, sender, instance, **kwargs):
+            received.append((signal, instance.transition))
+        for signal in (django_models.signals.pre_save, django_models.signals.post_save):
+            signal.connect(receiver, sender=xwlog_models.TransitionLog)
+            self.addCleanup(signal.disconnect, receiver, sender=xwlog_models.TransitionLog)
+
+        # Buffered logs are written with bulk_create(), without save signals.
+        with transaction.atomic():
+            self.objs[0].foobar(log=False)
+            workflow.db_log(models.MyWorkflow.transitions.foobar, models.MyWorkflow.states.foo, self.objs[0])
+        self.assertEqual(1, xwlog_models.TransitionLog.objects.count())
+        self.assertEqual([], received)
+
+        # Outside a transaction, logs are saved right away.
+        self.objs[1].foobar(log=False)
+        workflow.db_log(models.MyWorkflow.transitions.foobar, models.MyWorkflow.states.foo, self.objs[1])
+        self.assertEqual(
+            [(django_models.signals.pre_save, 'foobar'), (django_models.signals.post_save, 'foobar')],
+            received,
+        )
+
+
+class LogBackendTestCase(test.TransactionTestCase):
+    """Tests for transition log backends."""
+
+    def set_backend(self, backend):
+        workflow = models.MyWorkflowEnabled._workflows['state'].workflow
+        patcher = mock.patch.object(workflow, 'log_backend', backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_default_backend(self):
+        workflow = models.MyWorkflowEnabled._workflows['state'].workflow
+        self.assertIsInstance(workflow.get_log_backend(), log_backends.SyncLogBackend)
+        with mock.patch.object(workflow, 'log_flush_policy', xwf_models.LOG_FLUSH_ON_COMMIT):
+            self.assertIsInstance(workflow.get_log_backend(), log_backends.OnCommitLogBackend)
+        with mock.patch.object(workflow, 'log_flush_policy', xwf_models.LOG_FLUSH_BACKGROUND):
+            self.assertIsInstance(workflow.get_log_backend(), log_backends.ThreadedLogBackend)
+
+    def test_custom_backend(self):
+        backend = mock.Mock(spec=log_backends.BaseLogBackend)
+        self.set_backend(backend)
+        obj = models.MyWorkflowEnabled.objects.create()
+        obj.foobar()
+
+        backend.write.assert_called_once_with(xwlog_models.TransitionLog, mock.ANY)
+        log_kwargs = backend.write.call_args[0][1]
+        self.assertEqual(obj, log_kwargs['modified_object'])
+        self.assertEqual('foobar', log_kwargs['transition'])
+        self.assertEqual('foo', log_kwargs['from_state'])
+        self.assertEqual('bar', log_kwargs['to_state'])
+
+    def test_custom_backend_bulk(self):
+        backend = mock.Mock(spec=log_backends.BaseLogBackend)
+        self.set_backend(backend)
+        models.MyWorkflowEnabled.objects.create()
+        models.MyWorkflowEnabled.objects.create()
+        models.MyWorkflowEnabled.objects.bulk_transition('foobar')
+
+        backend.write_many.assert_called_once_with(xwlog_models.TransitionLog, mock.ANY)
+        self.assertEqual(2, len(backend.write_many.call_args[0][1]))
+
+    def test_threaded(self):
+        backend = log_backends.ThreadedLogBackend(batch_size=2)
+        self.addCleanup(backend.stop)
+        self.set_backend(backend)
+        objs = [models.MyWorkflowEnabled.objects.create() for _i in range(3)]
+
+        with transaction.atomic():
+            for obj in objs:
+                obj.foobar()
+            backend.flush()
+            self.assertFalse(xwlog_models.TransitionLog.objects.exists())
+
+        backend.stop()
+        self.assertEqual(3, xwlog_models.TransitionLog.objects.count())
+
+    def test_threaded_rollback(self):
+        backend = log_backends.ThreadedLogBackend()
+        self.addCleanup(backend.stop)
+        self.set_backend(backend)
+        obj = models.MyWorkflowEnabled.objects.create()
+
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                obj.foobar()
+                raise ValueError()
+
+        backend.stop()
+        self.assertFalse(xwlog_models.TransitionLog.objects.exists())
+
+    def test_threaded_restart(self):
+        backend = log_backends.ThreadedLogBackend()
+        self.addCleanup(backend.stop)
+        self.set_backend(backend)
+        obj = models.MyWorkflowEnabled.objects.create()
+
+        with mock.patch.object(log_backends.atexit, 'register') as register:
+            obj.foobar()
+            backend.stop()
+            # The next log starts a new thread.
+            obj.gobaz(1)
+            backend.stop()
+        register.assert_called_once_with(backend.stop)
+        self.assertEqual(2, xwlog_models.TransitionLog.objects.count())
+
+    def test_threaded_queue_full(self):
+        backend = log_backends.ThreadedLogBackend(max_queue_size=1)
+        backend._start = mock.Mock()  # Keep the queue from draining.
+        self.set_backend(backend)
+        objs = [models.MyWorkflowEnabled.objects.create() for _i in range(2)]
+
+        with self.assertLogs('django_xworkflows.log_backends', 'ERROR'):
+            for obj in objs:
+                obj.foobar()
+        self.assertEqual(1, backend.queue.qsize())
+
+
+class TransitionHistoryTestCase(test.TestCase):
+    def setUp(self):
+        self.user = auth_models.User.objects.create(username='jdoe')
+        self.objs = [models.MyWorkflowEnabled.objects.create() for _i in range(3)]
+        self.objs[0].foobar(user=self.user)
+        self.objs[0].gobaz(1)
+        self.objs[1].foobar(user=self.user)
+        # Warm the ContentType cache
+        ct_models.ContentType.objects.get_for_model(models.MyWorkflowEnabled)
+
+    def test_with_last_transition(self):
+        with self.assertNumQueries(1):
+            objs = list(models.MyWorkflowEnabled.objects.with_last_transition().order_by('pk'))
+        self.assertEqual(
+            [('gobaz', 'bar', 'baz', None), ('foobar', 'foo', 'bar', self.user.pk), (None, None, None, None)],
+            [(obj.last_transition, obj.last_from_state, obj.last_to_state, obj.last_user_id) for obj in objs],
+        )
+        self.assertIsNotNone(objs[0].last_timestamp)
+
+    def test_with_last_transition_fields(self):
+        obj = models.MyWorkflowEnabled.objects.with_last_transition(fields=['to_state']).get(pk=self.objs[1].pk)
+        self.assertEqual('bar', obj.last_to_state)
+        self.assertFalse(hasattr(obj, 'last_transition'))
+
+    def test_with_last_transition_foreign_key(self):
+        obj = models.CodedWorkflowEnabled.objects.create()
+        obj.start()
+        obj.finish()
+        obj = models.CodedWorkflowEnabled.objects.with_last_transition().get()
+        self.assertEqual((2, 3), (obj.last_transition, obj.last_to_state))
+
+    def test_prefetch_transitions(self):
+        with self.assertNumQueries(2):
+            objs = list(models.MyWorkflowEnabled.objects.prefetch_transitions().order_by('pk'))
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                [['foobar', 'gobaz'], ['foobar'], []],
+                [[log.transition for log in obj.transition_logs] for obj in objs],
+            )
+            self.assertIs(objs[0], objs[0].transition_logs[0].modified_object)
+
+    def test_prefetch_transitions_queryset(self):
+        objs = models.MyWorkflowEnabled.objects.prefetch_transitions(
+            to_attr='history', queryset=xwlog_models.TransitionLog.objects.select_related('user'),
+        ).filter(pk=self.objs[1].pk)
+        with self.assertNumQueries(2):
+            self.assertEqual([self.user], [log.user for log in objs[0].history])
+
+    def test_prefetch_transitions_foreign_key(self):
+        obj = models.CodedWorkflowEnabled.objects.create()
+        obj.start()
+        with self.assertNumQueries(2):
+            obj = models.CodedWorkflowEnabled.objects.prefetch_transitions().get()
+            self.assertEqual([1], [log.transition for log in obj.transition_logs])
+            self.assertIs(obj, obj.transition_logs[0].obj)
+
+    def test_prefetch_transitions_iterator(self):
+        objs = models.MyWorkflowEnabled.objects.prefetch_transitions().order_by('pk')
+        # One query for the objects, one per chunk for their logs.
+        with self.assertNumQueries(3):
+            self.assertEqual(
+                [['foobar', 'gobaz'], ['foobar'], []],
+                [[log.transition for log in obj.transition_logs] for obj in objs.iterator(chunk_size=2)],
+            )
+
+    def test_prefetch_transitions_values(self):
+        self.assertEqual(3, len(models.MyWorkflowEnabled.objects.prefetch_transitions().values('pk')))
+
+    def test_invalid_field(self):
+        with self.assertRaises(ValueError):
+            models.WithTwoWorkflows.objects.with_last_transition()
+        with self.assertRaises(ValueError):
+            # MyAltWorkflow doesn't log to the database
+            models.WithTwoWorkflows.objects.prefetch_transitions(field='state2')
+        self.assertEqual([], list(models.WithTwoWorkflows.objects.prefetch_transitions(field='state1')))
+
+
+class TransitionLogAdminTestCase(test.TestCase):
+    def setUp(self):
+        self.model_admin = xwlog_admin.TransitionLogAdmin(xwlog_models.TransitionLog, xwlog_admin.admin.site)
+        self.request = test.RequestFactory().get('/')
+        user = auth_models.User.objects.create(username='jdoe')
+        for _i in range(3):
+            models.MyWorkflowEnabled.objects.create().foobar(user=user)
+            xwlog_models.TransitionLog.log_transition('ab', 'a', 'b', models.GenericWorkflowEnabled.objects.create())
+
+    def get_filter(self, filter_class, **params):
+        request = test.RequestFactory().get('/', params)
+        # As built by the admin's ChangeList
+        lookup_params = dict(request.GET.lists()) if django.VERSION >= (5, 0) else dict(request.GET.items())
+        return filter_class(request, lookup_params, xwlog_models.TransitionLog, self.model_admin)
+
+    def test_page_queries(self):
+        queryset = self.model_admin.get_queryset(self.request).select_related(*self.model_admin.list_select_related)
+        # Logs with their users, then one query per content type of modified objects
+        with self.assertNumQueries(3):
+            logs = list(queryset[:10])
+            self.assertEqual(6, len([log.modified_object for log in logs]))
+            self.assertEqual(3, len([log.user for log in logs if log.user]))
+
+    def test_changelist(self):
+        request = test.RequestFactory().get('/', {'transition': 'foobar'})
+        request.user = auth_models.User.objects.create(username='admin', is_superuser=True, is_staff=True)
+        changelist = self.model_admin.get_changelist_instance(request)
+        self.assertEqual(3, changelist.result_count)
+        self.assertIsNone(changelist.full_result_count)
+        # The page, with users; then its objects, one query per content type
+        with self.assertNumQueries(2):
+            self.assertEqual(3, len([(log.modified_object, log.user) for log in changelist.result_list]))
+
+    def test_paginator(self):
+        paginator = self.model_admin.get_paginator(self.request, xwlog_models.TransitionLog.objects.all(), 4)
+        self.assertEqual(6, paginator.count)
+        self.assertEqual(2, paginator.num_pages)
+
+    def test_content_type_filter(self):
+        list_filter = self.get_filter(xwlog_admin.WorkflowModelListFilter)
+        content_types = dict(list_filter.lookups(self.request, self.model_admin))
+        my_type = ct_models.ContentType.objects.get_for_model(models.MyWorkflowEnabled)
+        self.assertIn(my_type.pk, content_types)
+        self.assertNotIn(ct_models.ContentType.objects.get_for_model(auth_models.User).pk, content_types)
+
+        list_filter = self.get_filter(xwlog_admin.WorkflowModelListFilter, content_type=str(my_type.pk))
+        self.assertEqual(3, list_filter.queryset(self.request, xwlog_models.TransitionLog.objects.all()).count())
+
+    def test_transition_filter(self):
+        list_filter = self.get_filter(xwlog_admin.TransitionListFilter)
+        with self.assertNumQueries(0):
+            transitions = [name for name, _title in list_filter.lookups(self.request, self.model_admin)]
+        self.assertIn('foobar', transitions)
+        # GenericWorkflow logs to another model
+        self.assertNotIn('ab', transitions)
+
+        list_filter = self.get_filter(xwlog_admin.TransitionListFilter, transition='foobar')
+        self.assertEqual(3, list_filter.queryset(self.request, xwlog_models.TransitionLog.objects.all()).count())
+
+
+class IndexProfileTestCase(test.TestCase):
+    def get_index_columns(self, model):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        return {
+            tuple(constraint['columns'])
+            for constraint in constraints.values()
+            if constraint['index'] and not constraint['primary_key'] and not constraint['unique']
+        }
+
+    def test_columns(self):
+        self.assertEqual(xwf_models.LOG_INDEXES_COLUMNS, models.GenericWorkflowTransitionLog.INDEX_PROFILE)
+        self.assertEqual([], models.GenericWorkflowTransitionLog._meta.indexes)
+        self.assertEqual(
+            {('transition',), ('from_state',), ('to_state',), ('timestamp',), ('content_id',), ('content_type_id',)},
+            self.get_index_columns(models.GenericWorkflowTransitionLog),
+        )
+
+    def test_composite(self):
+        self.assertEqual(
+            {
+                ('from_state',), ('to_state',), ('timestamp',),
+                ('content_type_id', 'content_id', 'timestamp'), ('transition', 'timestamp'),
+            },
+            self.get_index_columns(models.CompositeIndexedTransitionLog),
+        )
+        # Pruning and date filters look up logs by timestamp alone.
+        self.assertTrue(models.CompositeIndexedTransitionLog._meta.get_field('timestamp').db_index)
+
+    def test_all(self):
+        self.assertEqual(
+            {
+                ('transition',), ('from_state',), ('to_state',), ('timestamp',), ('content_id',), ('content_type_id',),
+                ('content_type_id', 'content_id', 'timestamp'), ('transition', 'timestamp'),
+            },
+            self.get_index_columns(models.AllIndexedTransitionLog),
+        )
+
+    def test_last_transition_log(self):
+        # The unique object column already serves the object's lookups.
+        self.assertEqual(
+            {('from_state',), ('to_state',), ('timestamp',), ('transition', 'timestamp')},
+            self.get_index_columns(models.CompositeIndexedLastTransitionLog),
+        )
+
+    @test_utils.isolate_apps('tests.djworkflows')
+    def test_last_transition_log_foreign_key(self):
+        class ForeignKeyLastTransitionLog(xwf_models.BaseLastTransitionLog):
+            INDEX_PROFILE = xwf_models.LOG_INDEXES_COMPOSITE
+            MODIFIED_OBJECT_FIELD = 'obj'
+
+            obj = django_models.ForeignKey(models.SomeWorkflowEnabled, on_delete=django_models.CASCADE)
+
+        # No composite index starts with a non-unique object column: keep its own.
+        self.assertTrue(ForeignKeyLastTransitionLog._meta.get_field('obj').db_index)
+        self.assertFalse(ForeignKeyLastTransitionLog._meta.get_field('transition').db_index)
+
+    def test_log_inserts(self):
+        obj = models.GenericWorkflowEnabled.objects.create()
+        logs = [dict(transition='ab', from_state='a', to_state='b', modified_object=obj)] * 10
+        models.GenericWorkflowTransitionLog.build_log(**logs[0])
+        for log_model in (
+                models.GenericWorkflowTransitionLog,
+                models.CompositeIndexedTransitionLog,
+                models.AllIndexedTransitionLog):
+            with self.assertNumQueries(1):
+                log_model.log_transitions(logs)
+
+    def test_logging(self):
+        obj = models.GenericWorkflowEnabled.objects.create()
+        models.CompositeIndexedTransitionLog.log_transition('foobar', 'foo', 'bar', obj)
+        self.assertEqual(
+            ['foobar'],
+            [log.transition for log in models.CompositeIndexedTransitionLog.objects.filter(content_id=obj.pk)],
+        )
+
+    def test_proxy(self):
+        # Proxies reuse their parent's table and indexes.
+        self.assertEqual([], models.ProxyCompositeIndexedTransitionLog.check())
+        self.assertEqual([], models.ProxyCompositeIndexedTransitionLog._meta.indexes)
+        self.assertEqual(2, len(models.CompositeIndexedTransitionLog._meta.indexes))
+        self.assertFalse(models.CompositeIndexedTransitionLog._meta.get_field('transition').db_index)
+
+    @test_utils.isolate_apps('tests.djworkflows')
+    def test_multi_table_inheritance(self):
+        all_indexed_timestamp = models.AllIndexedTransitionLog._meta.get_field('timestamp')
+
+        class ExtendedTransitionLog(models.CompositeIndexedTransitionLog):
+            comment = django_models.TextField(db_index=True)
+
+        class ExtendedAllIndexedTransitionLog(models.AllIndexedTransitionLog):
+            pass
+
+        # Indexes on inherited fields would be reported as models.E016.
+        self.assertNotIn('models.E016', [error.id for error in ExtendedTransitionLog.check()])
+        self.assertEqual([], ExtendedTransitionLog._meta.indexes)
+        self.assertTrue(ExtendedTransitionLog._meta.get_field('comment').db_index)
+        self.assertEqual([], ExtendedAllIndexedTransitionLog._meta.indexes)
+        # Fields inherited from the parent are left alone.
+        self.assertIs(all_indexed_timestamp, ExtendedAllIndexedTransitionLog._meta.get_field('timestamp'))
+        self.assertTrue(all_indexed_timestamp.db_index)
+        self.assertEqual(2, len(models.AllIndexedTransitionLog._meta.indexes))
+
+    def test_invalid_profile(self):
+        with mock.patch.object(models.AllIndexedTransitionLog, 'INDEX_PROFILE', 'everything'):
+            with self.assertRaises(exceptions.ImproperlyConfigured):
+                models.AllIndexedTransitionLog._apply_index_profile()
+
+
+class GenericTransitionLogTestCase(test.TestCase):
+    def setUp(self):
+        self.obj = models.MyWorkflowEnabled.objects.create()
+
+    def test_build_log(self):
+        xwlog_models.TransitionLog.build_log('foobar', 'foo', 'bar', self.obj)
+        # ContentType ids are cached, even once Django's own cache is cleared.
+        ct_models.ContentType.objects.clear_cache()
+        with self.assertNumQueries(0):
+            log = xwlog_models.TransitionLog.build_log('foobar', 'foo', 'bar', self.obj)
+        self.assertIs(self.obj, log.modified_object)
+
+        self.assertEqual(ct_models.ContentType.objects.get_for_model(models.MyWorkflowEnabled).pk, log.content_type_id)
+        self.assertEqual(self.obj.pk, log.content_id)
+
+    def test_cache_cleared_on_migrate(self):
+        xwlog_models.TransitionLog.build_log('foobar', 'foo', 'bar', self.obj)
+        self.assertTrue(xwf_models._content_type_ids)
+        app_config = django_apps.get_app_config('djworkflows')
+        django_models.signals.post_migrate.send(
+            sender=app_config, app_config=app_config, verbosity=0, interactive=False, using='default',
+            apps=django_apps, plan=[],
+        )
+        self.assertFalse(xwf_models._content_type_ids)
+
+
 class LastTransitionLogTestCase(test.TestCase):
     def setUp(self):
         self.obj = models.SomeWorkflowEnabled.objects.create()
@@ -315,6 +1501,85 @@ class LastTransitionLogTestCase(test.TestCase):
         self.assertEqual('a', tlog.to_state)
         self.assertTrue(tlog.timestamp > ab_datetime)
 
+    def enable_upsert(self):
+        for patcher in (
+                mock.patch.object(models.SomeWorkflowLastTransitionLog, 'UPSERT', True),
+                mock.patch.object(models.SomeWorkflowLastTransitionLog, '_upsert_options', {}, create=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def connect_post_save(self):
+        received = []
+
+        def receiver(sender, instance, created, **kwargs):
+            received.append((instance.transition, created))
+        log_model = models.SomeWorkflowLastTransitionLog
+        django_models.signals.post_save.connect(receiver, sender=log_model)
+        self.addCleanup(django_models.signals.post_save.disconnect, receiver, sender=log_model)
+        return received
+
+    def test_save_signals(self):
+        # By default, rows are written with save(), and send their signals.
+        received = self.connect_post_save()
+        self.obj.ab()
+        self.obj.ba()
+        self.assertEqual([('ab', True), ('ba', False)], received)
+
+    @unittest.skipUnless(getattr(connection.features, 'supports_update_conflicts', False), "Upserts not supported.")
+    def test_upsert_no_save_signals(self):
+        self.enable_upsert()
+        received = self.connect_post_save()
+        self.obj.ab()
+        self.obj.ba()
+        self.assertEqual([], received)
+        self.assertEqual('ba', models.SomeWorkflowLastTransitionLog.objects.get().transition)
+
+    def test_update_queries(self):
+        self.obj.ab(log=False)
+        models.SomeWorkflowLastTransitionLog.log_transition('ab', 'a', 'b', self.obj)
+        # get_or_create(): SELECT; save(): UPDATE
+        with self.assertNumQueries(2):
+            models.SomeWorkflowLastTransitionLog.log_transition('ba', 'b', 'a', self.obj)
+
+    @unittest.skipUnless(getattr(connection.features, 'supports_update_conflicts', False), "Upserts not supported.")
+    def test_single_query_upsert(self):
+        self.enable_upsert()
+        self.obj.ab(log=False)
+        with self.assertNumQueries(1):
+            models.SomeWorkflowLastTransitionLog.log_transition('ab', 'a', 'b', self.obj)
+        with self.assertNumQueries(1):
+            models.SomeWorkflowLastTransitionLog.log_transition('ba', 'b', 'a', self.obj)
+        self.assertEqual('ba', models.SomeWorkflowLastTransitionLog.objects.get().transition)
+
+    def test_upsert_options_cache(self):
+        self.enable_upsert()
+        log_model = models.SomeWorkflowLastTransitionLog
+        options = log_model._get_upsert_options({'obj': self.obj}, {'transition': 'ab'})
+        with mock.patch.object(log_model._meta, 'get_field') as get_field:
+            self.assertIs(options, log_model._get_upsert_options({'obj': self.obj}, {'transition': 'ba'}))
+        self.assertFalse(get_field.called)
+
+    def test_upsert_fallback(self):
+        self.enable_upsert()
+        with mock.patch.object(connection.features, 'supports_update_conflicts', False, create=True):
+            self.obj.ab()
+            self.obj.ba()
+        tlog = models.SomeWorkflowLastTransitionLog.objects.get()
+        self.assertEqual('ba', tlog.transition)
+
+    def test_log_transitions(self):
+        self.enable_upsert()
+        other = models.SomeWorkflowEnabled.objects.create()
+        models.SomeWorkflowLastTransitionLog.log_transitions([
+            dict(transition='ab', from_state='a', to_state='b', modified_object=self.obj),
+            dict(transition='ab', from_state='a', to_state='b', modified_object=other),
+            dict(transition='ba', from_state='b', to_state='a', modified_object=self.obj),
+        ])
+        self.assertEqual(
+            [(self.obj.pk, 'ba'), (other.pk, 'ab')],
+            list(models.SomeWorkflowLastTransitionLog.objects.order_by('obj').values_list('obj', 'transition')),
+        )
+
 
 class GenericLastTransitionLogTestCase(test.TestCase):
     def setUp(self):
@@ -348,6 +1613,415 @@ class GenericLastTransitionLogTestCase(test.TestCase):
         self.assertEqual('a', tlog.to_state)
         self.assertTrue(tlog.timestamp > ab_datetime)
 
+    @unittest.skipUnless(getattr(connection.features, 'supports_update_conflicts', False), "Upserts not supported.")
+    @mock.patch.object(models.GenericWorkflowLastTransitionLog, 'UPSERT', True)
+    def test_single_query_upsert(self):
+        self.obj.ab()
+        with self.assertNumQueries(1):
+            models.GenericWorkflowLastTransitionLog.log_transition('ba', 'b', 'a', self.obj)
+        self.assertEqual('ba', models.GenericWorkflowLastTransitionLog.objects.get().transition)
+
+    def test_log_transitions(self):
+        other = models.GenericWorkflowEnabled.objects.create()
+        models.GenericWorkflowLastTransitionLog.log_transitions([
+            dict(transition='ab', from_state='a', to_state='b', modified_object=self.obj),
+            dict(transition='ab', from_state='a', to_state='b', modified_object=other),
+            dict(transition='ba', from_state='b', to_state='a', modified_object=self.obj),
+        ])
+        self.assertEqual(
+            [(self.obj.pk, 'ba'), (other.pk, 'ab')],
+            list(models.GenericWorkflowLastTransitionLog.objects.order_by('content_id').values_list(
+                'content_id', 'transition',
+            )),
+        )
+
+
+class RebuildTransitionLogStatesTestCase(test.TestCase):
+    TRANSITIONS = (
+        ('foobar', 'foo', 'bar'),
+        ('gobaz', 'bar', 'baz'),
+        ('bazbar', 'baz', 'bar'),
+    )
+
+    def setUp(self):
+        self.objs = [models.MyWorkflowEnabled.objects.create(state='bar') for _i in range(3)]
+        xwlog_models.TransitionLog.log_transitions([
+            dict(transition=transition, from_state='', to_state='', modified_object=obj)
+            for obj in self.objs
+            for transition, _from, _to in self.TRANSITIONS
+        ])
+
+    def rebuild(self, **options):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        management.call_command(
+            'rebuild_transitionlog_states', 'djworkflows.MyWorkflowEnabled',
+            stdout=stdout, stderr=stderr, **options
+        )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def get_states(self, obj):
+        logs = xwlog_models.TransitionLog.objects.filter(content_id=obj.pk).order_by('timestamp', 'pk')
+        return tuple(logs.values_list('transition', 'from_state', 'to_state'))
+
+    def test_rebuild(self):
+        # SELECT logs, one UPDATE per (from_state, to_state) pair
+        with self.assertNumQueries(4):
+            stdout, stderr = self.rebuild()
+        self.assertEqual('', stderr)
+        self.assertIn('9 logs read, 9 fixed.', stdout)
+        for obj in self.objs:
+            self.assertEqual(self.TRANSITIONS, self.get_states(obj))
+
+    def test_partial_logs(self):
+        xwlog_models.TransitionLog.objects.filter(transition='gobaz').update(from_state='bar', to_state='baz')
+        stdout, _stderr = self.rebuild()
+        self.assertIn('9 logs read, 6 fixed.', stdout)
+        self.assertEqual(self.TRANSITIONS, self.get_states(self.objs[0]))
+
+    def test_batches(self):
+        # SELECT logs, then writes for each object: one UPDATE per (from_state, to_state) pair
+        with self.assertNumQueries(10):
+            stdout, _stderr = self.rebuild(batch_size=2)
+        self.assertIn('checkpoint: --start-from=%d' % self.objs[2].pk, stdout)
+        self.assertEqual(self.TRANSITIONS, self.get_states(self.objs[2]))
+
+    def test_start_from(self):
+        stdout, _stderr = self.rebuild(start_from=str(self.objs[1].pk))
+        self.assertIn('6 logs read, 6 fixed.', stdout)
+        self.assertEqual((('foobar', '', ''), ('gobaz', '', ''), ('bazbar', '', '')), self.get_states(self.objs[0]))
+        self.assertEqual(self.TRANSITIONS, self.get_states(self.objs[1]))
+
+    def test_dry_run(self):
+        with self.assertNumQueries(1):
+            stdout, _stderr = self.rebuild(dry_run=True)
+        self.assertIn('9 logs read, 9 to fix.', stdout)
+        self.assertFalse(xwlog_models.TransitionLog.objects.exclude(from_state='').exists())
+
+        stdout, _stderr = self.rebuild(dry_run=True, batch_size=2)
+        self.assertIn('3 logs read, 3 to fix; checkpoint: --start-from=%d' % self.objs[1].pk, stdout)
+        self.assertNotIn('fixed', stdout)
+
+    def test_unknown_transition(self):
+        xwlog_models.TransitionLog.objects.filter(transition='gobaz').update(transition='unknown')
+        _stdout, stderr = self.rebuild()
+        self.assertIn('Unknown transition unknown', stderr)
+        self.assertEqual(
+            (('foobar', 'foo', 'bar'), ('unknown', '', ''), ('bazbar', 'bar', 'bar')),
+            self.get_states(self.objs[0]),
+        )
+
+    def test_shards(self):
+        stdout, _stderr = self.rebuild(shard='0/2')
+        self.assertIn('6 logs read, 6 fixed.', stdout)
+        self.assertEqual(self.TRANSITIONS, self.get_states(self.objs[1]))
+        self.assertEqual((('foobar', '', ''), ('gobaz', '', ''), ('bazbar', '', '')), self.get_states(self.objs[2]))
+
+        stdout, _stderr = self.rebuild(shard='1/2')
+        self.assertIn('3 logs read, 3 fixed.', stdout)
+        for obj in self.objs:
+            self.assertEqual(self.TRANSITIONS, self.get_states(obj))
+
+    def test_invalid_shard(self):
+        for shard in ('2/2', '1', 'a/b'):
+            with self.assertRaises(management.CommandError):
+                self.rebuild(shard=shard)
+
+    def test_coded_logs(self):
+        obj = models.CodedWorkflowEnabled.objects.create()
+        obj.start()
+        obj.retry()
+        models.CodedWorkflowTransitionLog.objects.update(from_state=0, to_state=0)
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        management.call_command(
+            'rebuild_transitionlog_states', 'djworkflows.CodedWorkflowEnabled', stdout=stdout, stderr=stderr)
+        self.assertEqual('', stderr.getvalue())
+        self.assertIn('2 logs read, 2 fixed.', stdout.getvalue())
+        self.assertEqual(
+            [(1, 1, 2), (3, 2, 1)],
+            list(models.CodedWorkflowTransitionLog.objects.order_by('pk').values_list(
+                'transition', 'from_state', 'to_state')),
+        )
+
+    def test_invalid_model(self):
+        with self.assertRaises(management.CommandError):
+            management.call_command('rebuild_transitionlog_states', 'djworkflows.Unknown', stdout=io.StringIO())
+        with self.assertRaises(management.CommandError):
+            management.call_command(
+                'rebuild_transitionlog_states', 'xworkflow_log.TransitionLog', stdout=io.StringIO())
+
+
+class ExportTransitionLogsTestCase(test.TestCase):
+    def setUp(self):
+        self.obj = models.MyWorkflowEnabled.objects.create()
+        self.obj.foobar()
+        self.obj.gobaz(1)
+        # Logs of another model
+        xwlog_models.TransitionLog.log_transition('ab', 'a', 'b', models.GenericWorkflowEnabled.objects.create())
+
+    def export(self, *labels, **options):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        management.call_command('export_transitionlogs', *labels, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue()
+
+    def test_jsonl(self):
+        stdout = self.export('djworkflows.MyWorkflowEnabled', output='-')
+        rows = [json.loads(line) for line in stdout.splitlines()]
+        self.assertEqual(
+            [('foobar', 'foo', 'bar'), ('gobaz', 'bar', 'baz')],
+            [(row['transition'], row['from_state'], row['to_state']) for row in rows],
+        )
+        self.assertEqual(
+            ['id', 'model', 'object_id', 'transition', 'from_state', 'to_state', 'timestamp', 'user_id'],
+            list(rows[0]),
+        )
+        self.assertEqual('djworkflows.MyWorkflowEnabled', rows[0]['model'])
+        self.assertEqual(self.obj.pk, rows[0]['object_id'])
+
+    def test_filters(self):
+        stdout = self.export('djworkflows.MyWorkflowEnabled', output='-', transitions=['gobaz'])
+        self.assertEqual(['gobaz'], [json.loads(line)['transition'] for line in stdout.splitlines()])
+
+        xwlog_models.TransitionLog.objects.filter(transition='foobar').update(
+            timestamp=timezone.now() - datetime.timedelta(days=10))
+        since = (timezone.now() - datetime.timedelta(days=1)).isoformat()
+        stdout = self.export('djworkflows.MyWorkflowEnabled', output='-', since=since)
+        self.assertEqual(['gobaz'], [json.loads(line)['transition'] for line in stdout.splitlines()])
+        stdout = self.export('djworkflows.MyWorkflowEnabled', output='-', until=since)
+        self.assertEqual(['foobar'], [json.loads(line)['transition'] for line in stdout.splitlines()])
+
+        with self.assertRaises(management.CommandError):
+            self.export('djworkflows.MyWorkflowEnabled', output='-', since='yesterday')
+
+    def test_csv_chunks(self):
+        models.MyWorkflowEnabled.objects.create().foobar()
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        self.export('djworkflows.MyWorkflowEnabled', output=os.path.join(tmpdir, 'logs'), format='csv', chunk_rows=2)
+        self.assertEqual(['logs.00000.csv.gz', 'logs.00001.csv.gz'], sorted(os.listdir(tmpdir)))
+
+        rows = []
+        for name in sorted(os.listdir(tmpdir)):
+            with gzip.open(os.path.join(tmpdir, name), 'rt', encoding='utf-8', newline='') as f:
+                chunk = list(csv.reader(f))
+            self.assertEqual('id', chunk[0][0])
+            rows += chunk[1:]
+        self.assertEqual(['foobar', 'gobaz', 'foobar'], [row[3] for row in rows])
+
+    def test_coded(self):
+        models.CodedWorkflowEnabled.objects.create().start()
+        stdout = self.export('djworkflows.CodedWorkflowEnabled', output='-', transitions=['start', 'retry'])
+        rows = [json.loads(line) for line in stdout.splitlines()]
+        self.assertEqual(
+            [('start', 'new', 'running')],
+            [(row['transition'], row['from_state'], row['to_state']) for row in rows],
+        )
+
+    def test_invalid_models(self):
+        with self.assertRaises(management.CommandError):
+            # state2 isn't logged
+            self.export('djworkflows.WithTwoWorkflows', output='-')
+        with self.assertRaises(management.CommandError):
+            self.export('djworkflows.MissingModel', output='-')
+
+
+class PruneTransitionLogsTestCase(test.TestCase):
+    def setUp(self):
+        obj = models.MyWorkflowEnabled.objects.create()
+        xwlog_models.TransitionLog.log_transitions([
+            dict(transition='foobar', from_state='foo', to_state='bar', modified_object=obj)
+            for _i in range(5)
+        ])
+        now = timezone.now()
+        for days, log in zip((1, 10, 40, 50, 60), xwlog_models.TransitionLog.objects.order_by('pk')):
+            xwlog_models.TransitionLog.objects.filter(pk=log.pk).update(timestamp=now - datetime.timedelta(days=days))
+
+    def prune(self, *args, **options):
+        stdout = io.StringIO()
+        management.call_command('prune_transitionlogs', *args, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def get_ages(self):
+        now = timezone.now()
+        return sorted((now - log.timestamp).days for log in xwlog_models.TransitionLog.objects.all())
+
+    def test_prune(self):
+        stdout = self.prune('xworkflow_log.TransitionLog', days=30, batch_size=2)
+        self.assertIn('3 logs deleted.', stdout)
+        self.assertEqual([1, 10], self.get_ages())
+
+    def test_dry_run(self):
+        stdout = self.prune('xworkflow_log.TransitionLog', days=30, dry_run=True)
+        self.assertIn('3 logs to delete.', stdout)
+        self.assertEqual(5, xwlog_models.TransitionLog.objects.count())
+
+    def test_partitions_dry_run(self):
+        expired = [partitions.Partition('xworkflow_log_transitionlog_p2020_11', None, None)]
+        with mock.patch.object(partitions, 'is_partitioned', return_value=True), \
+                mock.patch.object(partitions, 'get_expired_partitions', return_value=expired), \
+                mock.patch.object(partitions, 'remove_partition') as remove_partition:
+            stdout = self.prune('xworkflow_log.TransitionLog', days=30, dry_run=True)
+            self.assertIn('would drop partition xworkflow_log_transitionlog_p2020_11', stdout)
+            stdout = self.prune('xworkflow_log.TransitionLog', days=30, dry_run=True, archive=True)
+            self.assertIn('would detach partition xworkflow_log_transitionlog_p2020_11', stdout)
+            self.assertFalse(remove_partition.called)
+
+            stdout = self.prune('xworkflow_log.TransitionLog', days=30, archive=True)
+            self.assertIn('detached partition xworkflow_log_transitionlog_p2020_11', stdout)
+            self.assertEqual(1, remove_partition.call_count)
+
+    @unittest.skipIf(connection.vendor == 'postgresql', "Requires a database without partitions.")
+    def test_archive_unpartitioned(self):
+        with self.assertRaises(management.CommandError):
+            self.prune('xworkflow_log.TransitionLog', days=30, archive=True)
+        self.assertEqual(5, xwlog_models.TransitionLog.objects.count())
+
+    def test_not_a_log_model(self):
+        with self.assertRaises(management.CommandError):
+            self.prune('djworkflows.MyWorkflowEnabled', days=30)
+        with self.assertRaises(management.CommandError):
+            self.prune('djworkflows.MissingModel', days=30)
+
+
+class PartitionsTestCase(test.SimpleTestCase):
+    def test_monthly_ranges(self):
+        start = datetime.datetime(2020, 11, 15, 10, 30, tzinfo=datetime.timezone.utc)
+        self.assertEqual(
+            [
+                (datetime.datetime(2020, 11, 1, tzinfo=datetime.timezone.utc),
+                 datetime.datetime(2020, 12, 1, tzinfo=datetime.timezone.utc)),
+                (datetime.datetime(2020, 12, 1, tzinfo=datetime.timezone.utc),
+                 datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)),
+            ],
+            partitions.monthly_ranges(start, 2),
+        )
+
+    def test_parse_partition_bounds(self):
+        self.assertEqual(
+            (datetime.datetime(2020, 11, 1, tzinfo=datetime.timezone.utc),
+             datetime.datetime(2020, 12, 1, tzinfo=datetime.timezone.utc)),
+            partitions.parse_partition_bounds(
+                "FOR VALUES FROM ('2020-11-01 00:00:00+00') TO ('2020-12-01 00:00:00+00')"),
+        )
+        self.assertEqual(
+            (None, datetime.datetime(2020, 12, 1, tzinfo=datetime.timezone.utc)),
+            partitions.parse_partition_bounds("FOR VALUES FROM (MINVALUE) TO ('2020-12-01 00:00:00+00')"),
+        )
+        self.assertEqual((None, None), partitions.parse_partition_bounds('DEFAULT'))
+        with self.assertRaises(ValueError):
+            partitions.parse_partition_bounds("FOR VALUES IN ('foo')")
+
+    def test_get_expired_partitions(self):
+        bounds = [
+            partitions.Partition('log_default', None, None),
+            partitions.Partition('log_old', None, datetime.datetime(2020, 11, 1, tzinfo=datetime.timezone.utc)),
+            partitions.Partition(
+                'log_202011',
+                datetime.datetime(2020, 11, 1, tzinfo=datetime.timezone.utc),
+                datetime.datetime(2020, 12, 1, tzinfo=datetime.timezone.utc),
+            ),
+        ]
+        with mock.patch.object(partitions, 'get_partitions', return_value=bounds):
+            expired = partitions.get_expired_partitions(
+                xwlog_models.TransitionLog, datetime.datetime(2020, 11, 20, tzinfo=datetime.timezone.utc))
+        self.assertEqual(['log_old'], [partition.name for partition in expired])
+
+    @unittest.skipIf(connection.vendor == 'postgresql', "Requires a database without partitions.")
+    def test_unsupported_database(self):
+        self.assertFalse(partitions.is_partitioned(xwlog_models.TransitionLog))
+        self.assertEqual([], partitions.get_partitions(xwlog_models.TransitionLog))
+
+
+class SerialThreadPoolExecutor(futures.ThreadPoolExecutor):
+    """Run tasks from a single thread: SQLite in-memory databases lock tables on concurrent writes."""
+
+    def __init__(self, max_workers=None, **kwargs):
+        super().__init__(max_workers=1, **kwargs)
+
+
+class ParallelRebuildTransitionLogStatesTestCase(test.TransactionTestCase):
+    """Worker pools must see committed data: threads stand in for processes."""
+
+    def setUp(self):
+        self.objs = [models.MyWorkflowEnabled.objects.create(state='bar') for _i in range(5)]
+        xwlog_models.TransitionLog.log_transitions([
+            dict(transition=transition, from_state='', to_state='', modified_object=obj)
+            for obj in self.objs
+            for transition, _from, _to in RebuildTransitionLogStatesTestCase.TRANSITIONS
+        ])
+        patcher = mock.patch.object(
+            rebuild_command.Command, 'executor_class', SerialThreadPoolExecutor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_workers(self):
+        stdout = io.StringIO()
+        management.call_command(
+            'rebuild_transitionlog_states', 'djworkflows.MyWorkflowEnabled',
+            workers=2, batch_size=2, stdout=stdout, stderr=io.StringIO(),
+        )
+        self.assertIn('15 logs read, 15 fixed.', stdout.getvalue())
+        self.assertEqual(
+            set(RebuildTransitionLogStatesTestCase.TRANSITIONS),
+            set(xwlog_models.TransitionLog.objects.values_list('transition', 'from_state', 'to_state')),
+        )
+
+    def test_workers_with_shard(self):
+        stdout = io.StringIO()
+        management.call_command(
+            'rebuild_transitionlog_states', 'djworkflows.MyWorkflowEnabled',
+            workers=3, shard='1/2', start_from=str(self.objs[4].pk), stdout=stdout, stderr=io.StringIO(),
+        )
+        self.assertIn('3 logs read, 3 fixed.', stdout.getvalue())
+        self.assertEqual(3, xwlog_models.TransitionLog.objects.exclude(from_state='').count())
+
+
+@unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), "Requires forked worker processes.")
+class ProcessPoolRebuildTransitionLogStatesTestCase(test.TransactionTestCase):
+    """Run workers from a real process pool.
+
+    Processes are forked, so that they inherit the test database settings.
+    """
+
+    def setUp(self):
+        self.objs = [models.MyWorkflowEnabled.objects.create(state='bar') for _i in range(4)]
+        xwlog_models.TransitionLog.log_transitions([
+            dict(transition=transition, from_state='', to_state='', modified_object=obj)
+            for obj in self.objs
+            for transition, _from, _to in RebuildTransitionLogStatesTestCase.TRANSITIONS
+        ])
+        patcher = mock.patch.object(
+            rebuild_command.Command, 'executor_class',
+            functools.partial(futures.ProcessPoolExecutor, mp_context=multiprocessing.get_context('fork')),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_workers_dry_run(self):
+        # Forked processes read a copy of in-memory SQLite databases: only run a dry run there.
+        stdout = io.StringIO()
+        management.call_command(
+            'rebuild_transitionlog_states', 'djworkflows.MyWorkflowEnabled',
+            workers=2, batch_size=2, dry_run=True, verbosity=2, stdout=stdout, stderr=io.StringIO(),
+        )
+        self.assertIn('12 logs read, 12 to fix.', stdout.getvalue())
+        self.assertEqual(0, xwlog_models.TransitionLog.objects.exclude(from_state='').count())
+
+    def test_workers(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("Worker processes can't write to in-memory SQLite databases.")
+        stdout = io.StringIO()
+        management.call_command(
+            'rebuild_transitionlog_states', 'djworkflows.MyWorkflowEnabled',
+            workers=2, batch_size=2, stdout=stdout, stderr=io.StringIO(),
+        )
+        self.assertIn('12 logs read, 12 fixed.', stdout.getvalue())
+        self.assertEqual(
+            set(RebuildTransitionLogStatesTestCase.TRANSITIONS),
+            set(xwlog_models.TransitionLog.objects.values_list('transition', 'from_state', 'to_state')),
+        )
+
 
 class StateFieldMigrationTests(test.TestCase):
     def test_modelstate(self):
@@ -365,6 +2039,142 @@ class StateFieldMigrationTests(test.TestCase):
         )
 
 
+class WorkflowRegistryTestCase(test.SimpleTestCase):
+    def test_shared(self):
+        registry = xwf_models.workflow_registry
+        field = models.MyWorkflowEnabled._meta.get_field('state')
+        self.assertIn(models.MyWorkflow, registry)
+        self.assertIs(registry[models.MyWorkflow], field.workflow)
+        self.assertIs(field.workflow, xwf_models.StateField(models.MyWorkflow).workflow)
+        self.assertIn((models.MyWorkflow, field.workflow), registry.items())
+        self.assertIn(models.MyWorkflow, list(registry))
+        self.assertEqual(len(registry.items()), len(registry))
+
+    def test_instance(self):
+        # Fields given a workflow instance keep it.
+        field = models.WithTwoWorkflows._meta.get_field('state1')
+        self.assertIsNot(xwf_models.workflow_registry.get(models.MyWorkflow), field.workflow)
+        self.assertNotIn(field, xwf_models.workflow_registry.get_fields(models.MyWorkflow))
+        self.assertNotIn(models.MyAltWorkflow, xwf_models.workflow_registry)
+
+    def test_get_fields(self):
+        registry = xwf_models.workflow_registry
+        self.assertIn(models.MyWorkflowEnabled._meta.get_field('state'), registry.get_fields(models.MyWorkflow))
+        self.assertEqual(
+            [(models.SomeWorkflowEnabled, 'state')],
+            [(field.model, field.name) for field in registry.get_fields(models.SomeWorkflow)],
+        )
+        self.assertEqual([], registry.get_fields(models.MyAltWorkflow))
+
+    def test_get(self):
+        registry = xwf_models.WorkflowRegistry()
+        with self.assertRaises(KeyError):
+            registry[models.MyWorkflow]
+        workflow = registry.get(models.MyWorkflow)
+        self.assertIsInstance(workflow, models.MyWorkflow)
+        self.assertIs(workflow, registry.get(models.MyWorkflow))
+        self.assertEqual([models.MyWorkflow], list(registry))
+
+    def test_log_model_resolved_once(self):
+        registry = xwf_models.WorkflowRegistry()
+        field = xwf_models.StateField(models.MyWorkflow)
+        with mock.patch.object(xwf_models, 'workflow_registry', registry):
+            fields = [xwf_models.StateField(models.MyWorkflow) for _i in range(2)]
+        self.assertIs(fields[0].workflow, fields[1].workflow)
+        self.assertIsNot(field.workflow, fields[0].workflow)
+        with mock.patch.object(django_apps, 'get_model', return_value=xwlog_models.TransitionLog) as get_model:
+            for field in fields:
+                self.assertIs(xwlog_models.TransitionLog, field.workflow._get_log_model_class())
+        self.assertEqual(1, get_model.call_count)
+
+
+class LazyStateFieldTestCase(test.SimpleTestCase):
+    def test_lazy(self):
+        field = xwf_models.StateField(models.MyWorkflow, lazy=True)
+        self.assertTrue(field.lazy)
+        self.assertNotIn('_state_wrappers', field.__dict__)
+        self.assertIsNone(field.choices._choices)
+        self.assertEqual(16, field.max_length)
+        self.assertEqual('foo', field.default)
+
+        self.assertEqual([('foo', "Foo"), ('bar', "Bar"), ('baz', "Baz")], list(field.choices))
+        self.assertEqual([('foo', "Foo"), ('bar', "Bar"), ('baz', "Baz")], field.choices)
+        self.assertEqual(models.MyWorkflow.states.bar, field.to_python('bar').state)
+        self.assertIs(field.to_python('bar'), field.to_python('bar'))
+
+    def test_formfield(self):
+        field = xwf_models.StateField(models.MyWorkflow, lazy=True)
+        field.name = 'state'
+        self.assertEqual(['foo', 'bar', 'baz'], [value for value, _label in field.formfield().choices])
+
+    def test_shared_workflow(self):
+        field = xwf_models.StateField(models.MyWorkflow, lazy=True)
+        self.assertIs(field.workflow, xwf_models.StateField(models.MyWorkflow).workflow)
+
+    def test_eager(self):
+        field = xwf_models.StateField(models.MyWorkflow)
+        self.assertFalse(field.lazy)
+        self.assertIn('_state_wrappers', field.__dict__)
+        self.assertEqual([('foo', "Foo"), ('bar', "Bar"), ('baz', "Baz")], field.choices)
+
+    def test_deconstruct(self):
+        field = xwf_models.StateField(models.MyWorkflow, lazy=True)
+        _name, _path, _args, kwargs = field.deconstruct()
+        self.assertNotIn('lazy', kwargs)
+        self.assertNotIn('choices', kwargs)
+
+    def test_historical_model(self):
+        from django.db.migrations import state as migrations_state
+        project_state = migrations_state.ProjectState()
+        project_state.add_model(migrations_state.ModelState.from_model(models.MyWorkflowEnabled))
+        model = project_state.apps.get_model('djworkflows.MyWorkflowEnabled')
+
+        field = model._meta.get_field('state')
+        self.assertTrue(field.lazy)
+        self.assertIsNone(field.workflow._workflow)
+        self.assertEqual([('foo', 'foo'), ('bar', 'bar'), ('baz', 'baz')], list(field.choices))
+        self.assertEqual('foo', field.default)
+        self.assertEqual(16, field.max_length)
+
+
+class SerializedWorkflowTestCase(test.SimpleTestCase):
+    def serialize(self, states=('a', 'b'), **kwargs):
+        return xwf_models._SerializedWorkflow(name='LazyWorkflow', initial_state='a', states=list(states), **kwargs)
+
+    def test_lazy(self):
+        workflow = self.serialize()
+        self.assertIsNone(workflow._workflow)
+        self.assertEqual(
+            ('django_xworkflows.models._SerializedWorkflow', (), {
+                'name': 'LazyWorkflow', 'initial_state': 'a', 'states': ['a', 'b'],
+            }),
+            workflow.deconstruct(),
+        )
+        self.assertIsNone(workflow._workflow)
+
+        self.assertEqual(['a', 'b'], [state.name for state in workflow.states])
+        self.assertEqual('LazyWorkflow', workflow._workflow_class.__name__)
+        self.assertIsInstance(workflow._workflow, workflow._workflow_class)
+
+    def test_memo(self):
+        workflow = self.serialize()
+        self.assertIs(workflow.states, self.serialize().states)
+        self.assertIsNot(workflow.states, self.serialize(states=('a', 'b', 'c')).states)
+        self.assertIsNot(workflow.states, self.serialize(state_codes={'a': 1, 'b': 2}).states)
+        self.assertEqual({'a': 1, 'b': 2}, self.serialize(state_codes={'b': 2, 'a': 1}).state_codes)
+
+    def test_copy(self):
+        workflow = copy.deepcopy(self.serialize())
+        self.assertIsNone(workflow._workflow)
+        self.assertEqual('a', workflow.initial_state.name)
+
+    def test_field_deconstruct(self):
+        workflow = self.serialize()
+        field = xwf_models.StateField(workflow)
+        _name, _path, _args, kwargs = field.deconstruct()
+        self.assertIs(workflow, kwargs['workflow'])
+
+
 class ProjectMigrationTests(test.TestCase):
     DEMO_PROJECT_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'demo_project')
 